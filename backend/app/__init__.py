@@ -15,7 +15,7 @@ def create_app(config_class=Config):
 
     db.init_app(app)
     migrate.init_app(app, db)
-    CORS(app) # Allow cross-origin requests
+    CORS(app, expose_headers=['X-Next-Cursor']) # Allow cross-origin requests
 
     # Redis is disabled for now
     # if app.config['REDIS_URL']:
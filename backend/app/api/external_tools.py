@@ -7,7 +7,15 @@ from flask import Blueprint, jsonify, request
 import requests
 
 from app import db
-from app.models.models import ExternalTool, ExternalToolOperation
+from app.core.circuit_breaker import get_circuit_breaker
+from app.core.execution_archive import get_archived_execution, query_executions
+from app.core.execution_log import decode_body, execution_body
+from app.core.http_sessions import http_sessions
+from app.core.rate_limiter import get_rate_limiter
+from app.core.single_flight import get_single_flight
+from app.core.tool_cache import get_response_cache
+from app.core.tool_mapping import invalidate_operation_mappings
+from app.models.models import ExternalTool, ExternalToolExecution, ExternalToolOperation
 from app.api.auth import token_required
 
 bp = Blueprint('external_tools', __name__)
@@ -64,6 +72,7 @@ def create_tool(current_user):
         openapi_spec_url=openapi_spec_url,
         auth_type=data.get('auth_type', 'none'),
         auth_config=data.get('auth_config', {}),
+        config=data.get('config', {}),
     )
 
     # If OpenAPI spec URL is provided, try to import
@@ -99,7 +108,10 @@ def get_tool(current_user, tool_id):
         'base_url': tool.base_url,
         'openapi_spec_url': tool.openapi_spec_url,
         'auth_type': tool.auth_type,
+        'config': tool.config or {},
         'is_active': tool.is_active,
+        'circuit_breaker': get_circuit_breaker().status(tool),
+        'rate_limit': get_rate_limiter().status(tool),
         'operations': [
             {
                 'id': op.id,
@@ -116,6 +128,8 @@ def get_tool(current_user, tool_id):
                 'retry_config': op.retry_config,
                 'tool_type': op.tool_type,
                 'validation_config': op.validation_config,
+                'cache_config': op.cache_config or {},
+                'batch_config': op.batch_config or {},
             }
             for op in tool.operations
         ],
@@ -142,13 +156,30 @@ def update_tool(current_user, tool_id):
         tool.auth_type = data['auth_type']
     if 'auth_config' in data:
         tool.auth_config = data['auth_config']
+    if 'config' in data:
+        tool.config = data['config']
     if 'is_active' in data:
         tool.is_active = data['is_active']
 
     db.session.commit()
+    # 连接相关配置可能已变更，下次调用时重建会话
+    http_sessions.invalidate(tool.id)
     return jsonify({'message': 'Tool updated successfully'})
 
 
+@bp.route('/<int:tool_id>/circuit-breaker/reset', methods=['POST'])
+@token_required
+def reset_circuit_breaker(current_user, tool_id):
+    """Close the tool's circuit breaker after the upstream has been fixed"""
+    if not current_user.has_role('Admin'):
+        return jsonify({'message': 'Admin role required'}), 403
+
+    tool = ExternalTool.query.get_or_404(tool_id)
+    breaker = get_circuit_breaker()
+    breaker.reset(tool.id)
+    return jsonify({'message': 'Circuit breaker reset', 'circuit_breaker': breaker.status(tool)})
+
+
 @bp.route('/<int:tool_id>/refresh-spec', methods=['POST'])
 @token_required
 def refresh_openapi_spec(current_user, tool_id):
@@ -210,6 +241,8 @@ def create_operation(current_user, tool_id):
         retry_config=data.get('retry_config', {}),
         tool_type=data.get('tool_type', 'other'),
         validation_config=data.get('validation_config', {}),
+        cache_config=data.get('cache_config', {}),
+        batch_config=data.get('batch_config', {}),
     )
     db.session.add(operation)
     db.session.commit()
@@ -231,13 +264,14 @@ def update_operation(current_user, operation_id):
         'name', 'description', 'method', 'path', 'parameters',
         'request_body', 'response_schema', 'input_mapping',
         'output_mapping', 'timeout', 'retry_config',
-        'tool_type', 'validation_config'
+        'tool_type', 'validation_config', 'cache_config', 'batch_config'
     ]
     for field in updatable_fields:
         if field in data:
             setattr(operation, field, data[field])
 
     db.session.commit()
+    invalidate_operation_mappings(operation.id)
     return jsonify({'message': 'Operation updated'})
 
 
@@ -316,6 +350,8 @@ def execute_operation_from_form(current_user, operation_id):
             'response': result.get('response'),
             'mapped_output': result.get('mapped_output', {}),
             'error': result.get('error'),
+            'execution_id': result.get('execution_id'),
+            'next_attempt_at': result.get('next_attempt_at'),
         })
     except Exception as e:
         return jsonify({
@@ -324,10 +360,122 @@ def execute_operation_from_form(current_user, operation_id):
         }), 500
 
 
+@bp.route('/cache', methods=['GET'])
+@token_required
+def get_cache_stats(current_user):
+    """Response cache statistics (hits, misses, entries, evictions)"""
+    if not current_user.has_role('Admin'):
+        return jsonify({'message': 'Admin role required'}), 403
+    return jsonify(get_response_cache().stats())
+
+
+@bp.route('/cache', methods=['DELETE'])
+@token_required
+def clear_cache(current_user):
+    """Drop all cached tool responses"""
+    if not current_user.has_role('Admin'):
+        return jsonify({'message': 'Admin role required'}), 403
+    get_response_cache().clear()
+    return jsonify({'message': 'Cache cleared'})
+
+
+@bp.route('/coalescing', methods=['GET'])
+@token_required
+def get_coalescing_stats(current_user):
+    """Request coalescing counters (upstream calls made vs. results shared)"""
+    if not current_user.has_role('Admin'):
+        return jsonify({'message': 'Admin role required'}), 403
+    flights = get_single_flight()
+    return jsonify(flights.stats() if flights is not None else {'mode': 'off'})
+
+
+@bp.route('/executions/<int:execution_id>', methods=['GET'])
+@token_required
+def get_execution(current_user, execution_id):
+    """Execution status, including the queue job for asynchronous executions"""
+    execution = db.session.get(ExternalToolExecution, execution_id)
+    if execution is None:
+        record = get_archived_execution(execution_id)
+        if record is None:
+            return jsonify({'message': 'Execution not found'}), 404
+        if record['actor_id'] != current_user.id and not current_user.has_role('Admin'):
+            return jsonify({'message': 'Permission denied'}), 403
+        return jsonify(_execution_record_json(record))
+    if execution.actor_id != current_user.id and not current_user.has_role('Admin'):
+        return jsonify({'message': 'Permission denied'}), 403
+
+    job = execution.job
+    return jsonify({
+        'id': execution.id,
+        'operation_id': execution.operation_id,
+        'proposal_id': execution.proposal_id,
+        'triggered_by': execution.triggered_by,
+        'status': execution.status,
+        'response_status': execution.response_status,
+        'response_body': execution_body(execution, 'response_body'),
+        'error_message': execution.error_message,
+        'retry_count': execution.retry_count,
+        'next_attempt_at': execution.next_attempt_at.isoformat() if execution.next_attempt_at else None,
+        'cache_hit': bool(execution.cache_hit),
+        'started_at': execution.started_at.isoformat() if execution.started_at else None,
+        'completed_at': execution.completed_at.isoformat() if execution.completed_at else None,
+        'job': {
+            'id': job.id,
+            'status': job.status,
+            'attempts': job.attempts,
+            'max_attempts': job.max_attempts,
+            'run_after': job.run_after.isoformat() if job.run_after else None,
+            'last_error': job.last_error,
+        } if job else None,
+    })
+
+
+@bp.route('/executions', methods=['GET'])
+@token_required
+def list_executions(current_user):
+    """
+    Search executions across the live table and the archive
+
+    Query params: proposal_id, operation_id, status, limit (default 100, max 500).
+    Non-admin users only see their own executions.
+    """
+    try:
+        limit = min(int(request.args.get('limit', 100)), 500)
+    except ValueError:
+        return jsonify({'message': 'limit must be an integer'}), 400
+    records = query_executions(
+        proposal_id=request.args.get('proposal_id', type=int),
+        operation_id=request.args.get('operation_id', type=int),
+        status=request.args.get('status'),
+        actor_id=None if current_user.has_role('Admin') else current_user.id,
+        limit=limit,
+    )
+    return jsonify({'executions': [_execution_record_json(record) for record in records]})
+
+
 # --------------------------------------------------------------------------- #
 # Helper functions
 # --------------------------------------------------------------------------- #
 
+def _execution_record_json(record):
+    """Serialize an execution record from query_executions / the archive"""
+    return {
+        'id': record['id'],
+        'operation_id': record['operation_id'],
+        'proposal_id': record['proposal_id'],
+        'triggered_by': record['triggered_by'],
+        'status': record['status'],
+        'response_status': record['response_status'],
+        'response_body': decode_body(record['response_body']),
+        'error_message': record['error_message'],
+        'retry_count': record['retry_count'],
+        'cache_hit': bool(record.get('cache_hit')),
+        'started_at': record['started_at'],
+        'completed_at': record['completed_at'],
+        'archived': record['archived'],
+    }
+
+
 def _fetch_openapi_spec(url):
     """Fetch and parse OpenAPI spec from URL"""
     response = requests.get(url, timeout=30)
@@ -423,7 +571,7 @@ def _execute_operation(operation, params):
     body = params.get('body', {})
     
     # Execute request
-    response = requests.request(
+    response = http_sessions.get(tool).request(
         method=operation.method,
         url=url,
         headers=headers,
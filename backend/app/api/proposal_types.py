@@ -1,6 +1,8 @@
-from flask import Blueprint, jsonify
-from app.models.models import ProposalType
-from app.api.auth import token_required
+from flask import Blueprint, jsonify, request
+from app import db
+from app.core.workflow_compiler import invalidate_proposal_type
+from app.models.models import ProposalSeason, ProposalType, Workflow
+from app.api.auth import token_required, admin_required
 
 bp = Blueprint('proposal_types', __name__)
 
@@ -19,3 +21,28 @@ def get_proposal_types(current_user):
         }
         for t in types
     ])
+
+
+@bp.route('/<int:id>', methods=['PUT'])
+@token_required
+@admin_required
+def update_proposal_type(current_user, id):
+    """Updates a proposal type, including the workflow its proposals follow."""
+    proposal_type = ProposalType.query.get_or_404(id)
+    data = request.get_json()
+    if not data:
+        return jsonify({'message': 'No payload provided'}), 400
+
+    if 'workflow_id' in data and db.session.get(Workflow, data['workflow_id']) is None:
+        return jsonify({'message': 'Workflow not found'}), 400
+    if data.get('season_id') is not None and db.session.get(ProposalSeason, data['season_id']) is None:
+        return jsonify({'message': 'Season not found'}), 400
+
+    proposal_type.name = data.get('name', proposal_type.name)
+    proposal_type.description = data.get('description', proposal_type.description)
+    proposal_type.workflow_id = data.get('workflow_id', proposal_type.workflow_id)
+    if 'season_id' in data:
+        proposal_type.season_id = data['season_id']
+    db.session.commit()
+    invalidate_proposal_type(proposal_type.id)
+    return jsonify({'message': 'Proposal type updated successfully'})
@@ -1,9 +1,16 @@
+import base64
+import json
 from datetime import datetime
+from typing import Optional
 
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import and_, false, or_
 from sqlalchemy.exc import IntegrityError
 
 from app import db
+from app.core.proposal_counters import aggregates
+from app.core.proposal_export import iter_export
+from app.core.proposal_summary import refresh_summary
 from app.core.workflow_engine import WorkflowEngine
 from app.models.models import (
     Instrument,
@@ -11,6 +18,7 @@ from app.models.models import (
     Proposal,
     ProposalInstrument,
     ProposalPhase,
+    ProposalSummary,
     ProposalType,
     WorkflowState,
 )
@@ -18,61 +26,246 @@ from app.api.auth import token_required
 
 bp = Blueprint('proposals', __name__)
 
+MAX_BATCH_PROPOSALS = 1000
+
+
+LIST_ORDERS = {
+    'id': (ProposalSummary.proposal_id,),
+    'timestamp': (ProposalSummary.timestamp, ProposalSummary.proposal_id),
+}
+
+
+def _nullable(column) -> bool:
+    return bool(getattr(column.expression, 'nullable', False))
+
+
+def _encode_cursor(values) -> str:
+    # 空值按 JSON null 显式编码
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str, columns):
+    """游标为排序键的最后一行取值；格式或长度不符时抛出 ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError('Invalid cursor')
+    decoded = []
+    for column, value in zip(columns, values):
+        if value is None and _nullable(column):
+            pass
+        elif isinstance(column.type, db.DateTime):
+            try:
+                value = datetime.fromisoformat(value)
+            except (ValueError, TypeError):
+                raise ValueError('Invalid cursor')
+        elif not isinstance(value, int):
+            raise ValueError('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+
+def _order_by(columns, descending=False):
+    """排序子句；可为空的列升序时空值在前、降序时在后，与 _after 的比较一致"""
+    clauses = []
+    for column in columns:
+        if _nullable(column):
+            present = column.isnot(None)
+            clauses.append(present.desc() if descending else present)
+        clauses.append(column.desc() if descending else column)
+    return clauses
+
+
+def _after(columns, values, descending=False):
+    """(c1, c2, ...) > (v1, v2, ...) 的展开形式，各数据库都能利用复合索引；空值的位置同 _order_by"""
+    condition = None
+    for index in reversed(range(len(columns))):
+        column, value = columns[index], values[index]
+        if value is None:
+            step = false() if descending else column.isnot(None)
+            same = column.is_(None)
+        else:
+            step = column < value if descending else column > value
+            if descending and _nullable(column):
+                step = or_(step, column.is_(None))
+            same = column == value
+        condition = step if condition is None else or_(step, and_(same, condition))
+    return condition
+
+
+def _page_size() -> Optional[int]:
+    """每页条数；未传 limit 与 cursor 时返回 None，即不分页返回全部（兼容未读取 X-Next-Cursor 的调用方）"""
+    if 'limit' not in request.args and not request.args.get('cursor'):
+        return None
+    default = current_app.config.get('PROPOSAL_PAGE_SIZE', 100)
+    limit = request.args.get('limit', default, type=int)
+    return max(1, min(limit, current_app.config.get('PROPOSAL_PAGE_SIZE_MAX', 1000)))
+
+
+def _filter_summaries(query):
+    """Applies the state / proposal_type_id / season_id query parameters to a summary query."""
+    if request.args.get('state'):
+        query = query.filter(ProposalSummary.state_name == request.args['state'])
+    proposal_type_id = request.args.get('proposal_type_id', type=int)
+    if proposal_type_id:
+        query = query.filter(ProposalSummary.proposal_type_id == proposal_type_id)
+    season_id = request.args.get('season_id', type=int)
+    if season_id:
+        query = query.filter(ProposalSummary.season_id == season_id)
+    return query
+
+
+def _summary_json(summary: ProposalSummary):
+    return {
+        'id': summary.proposal_id,
+        'title': summary.title,
+        'abstract': summary.abstract,
+        'status': summary.state_name or 'N/A',
+        'phases': summary.phases or [],
+        'instruments': summary.instruments or [],
+    }
+
 
 @bp.route('/', methods=['GET'])
 @token_required
 def get_proposals(current_user):
-    """Returns proposals for the current user or instrument queues."""
+    """
+    Returns proposals for the current user or instrument queues, optionally one keyset page at a time.
+
+    Without limit or cursor the whole list is returned in one response, as before paging.
+    Query parameters: limit, cursor (from the X-Next-Cursor header of the previous page),
+    order (id | timestamp, prefix with '-' for descending), state, proposal_type_id,
+    season_id and instrument_status; the scheduler queue (instrument_code) also accepts phase
+    and is always ordered by assignment id. The body stays a JSON array; X-Next-Cursor is
+    only present when another page exists.
+    """
     instrument_code = request.args.get('instrument_code')
     scheduler_mode = instrument_code and (
         current_user.has_role('Instrument Scheduler') or current_user.has_role('Admin')
     )
+    limit = _page_size()
+    cursor = request.args.get('cursor')
+    instrument_status = request.args.get('instrument_status')
 
+    # 列表读取 proposal_summary 读模型：一页一次查询（调度队列的分配与读模型行在同一查询中联接）
     if scheduler_mode:
         instrument = Instrument.query.filter_by(code=instrument_code).first()
         if instrument is None:
             return jsonify({'message': 'Instrument not found'}), 404
-        assignments = ProposalInstrument.query.filter_by(instrument_id=instrument.id).all()
-        proposals = [assignment.proposal for assignment in assignments]
-    elif current_user.has_role('Panel Chair') or current_user.has_role('Admin'):
-        proposals = Proposal.query.all()
+        # 按分配 id 排序：同时给出 phase 与 instrument_status 时由 ix_proposal_instrument_queue_id
+        # (instrument_id, phase, status, id) 按序读取，否则由 ix_proposal_instrument_instrument_id_id
+        # (instrument_id, id) 按序读取再过滤；内联接读模型，limit 只计入实际返回的行
+        query = (
+            db.session.query(ProposalInstrument, ProposalSummary)
+            .join(ProposalSummary, ProposalInstrument.proposal_id == ProposalSummary.proposal_id)
+            .filter(ProposalInstrument.instrument_id == instrument.id)
+        )
+        if request.args.get('phase'):
+            query = query.filter(ProposalInstrument.phase == request.args['phase'])
+        if instrument_status:
+            query = query.filter(ProposalInstrument.status == instrument_status)
+        query = _filter_summaries(query)
+        columns, descending = (ProposalInstrument.id,), False
     else:
-        proposals = Proposal.query.filter_by(user_id=current_user.id).all()
-
-    output = []
-    for proposal in proposals:
-        proposal_data = {
-            'id': proposal.id,
-            'title': proposal.title,
-            'abstract': proposal.abstract,
-            'status': proposal.current_state.name if proposal.current_state else 'N/A',
-            'phases': [
-                {
-                    'phase': phase.phase,
-                    'status': phase.status,
-                    'submitted_at': phase.submitted_at.isoformat() if phase.submitted_at else None,
-                }
-                for phase in proposal.phases.order_by(ProposalPhase.id)
-            ],
-            'instruments': [
-                {
-                    'instrument': pi.instrument.code,
-                    'status': pi.status,
-                    'phase': pi.phase,
-                    'confirmed_at': pi.confirmed_at.isoformat() if pi.confirmed_at else None,
-                }
-                for pi in proposal.instruments.order_by(ProposalInstrument.id)
-            ],
-        }
-        if scheduler_mode:
-            assignment = proposal.instruments.filter_by(instrument_id=instrument.id).first()
+        query = ProposalSummary.query
+        if not (current_user.has_role('Panel Chair') or current_user.has_role('Admin')):
+            query = query.filter(ProposalSummary.user_id == current_user.id)
+        query = _filter_summaries(query)
+        if instrument_status:
+            query = query.filter(
+                ProposalInstrument.query.filter(
+                    ProposalInstrument.proposal_id == ProposalSummary.proposal_id,
+                    ProposalInstrument.status == instrument_status,
+                ).exists()
+            )
+        order = request.args.get('order', 'id')
+        descending = order.startswith('-')
+        columns = LIST_ORDERS.get(order.lstrip('-'))
+        if columns is None:
+            return jsonify({'message': f"Unsupported order '{order}'"}), 400
+
+    if cursor:
+        try:
+            query = query.filter(_after(columns, _decode_cursor(cursor, columns), descending))
+        except ValueError as e:
+            return jsonify({'message': str(e)}), 400
+    query = query.order_by(*_order_by(columns, descending))
+    next_cursor = None
+    if limit is None:
+        rows = query.all()
+    else:
+        rows = query.limit(limit + 1).all()
+        if len(rows) > limit:
+            last = rows[limit - 1][0] if scheduler_mode else rows[limit - 1]
+            next_cursor = _encode_cursor([getattr(last, column.key) for column in columns])
+        rows = rows[:limit]
+
+    if not scheduler_mode:
+        output = [_summary_json(summary) for summary in rows]
+    else:
+        output = []
+        for assignment, summary in rows:
+            proposal_data = _summary_json(summary)
             proposal_data['assignment'] = {
                 'status': assignment.status,
                 'form_data': assignment.form_data,
                 'scheduling_feedback': assignment.scheduling_feedback,
             }
-        output.append(proposal_data)
-    return jsonify(output)
+            output.append(proposal_data)
+    response = jsonify(output)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
+@bp.route('/export', methods=['GET'])
+@token_required
+def export_proposals(current_user):
+    """
+    Streams proposals as NDJSON or CSV without building the result in memory.
+
+    Query parameters: format (ndjson | csv), columns (comma separated, default all),
+    payloads (include phase payloads and instrument form data), chunk_size (clamped to
+    PROPOSAL_EXPORT_CHUNK_SIZE), and the state / proposal_type_id / season_id filters
+    of the list endpoint.
+    """
+    if not (current_user.has_role('Admin') or current_user.has_role('Panel Chair')):
+        return jsonify({'message': 'Admin or Panel Chair role required'}), 403
+    fmt = request.args.get('format', 'ndjson')
+    columns = [c.strip() for c in request.args.get('columns', '').split(',') if c.strip()]
+    try:
+        lines = iter_export(
+            fmt,
+            columns=columns,
+            payloads=request.args.get('payloads', 'false').lower() in ('1', 'true', 'yes'),
+            chunk_size=request.args.get('chunk_size', type=int),
+            state=request.args.get('state'),
+            proposal_type_id=request.args.get('proposal_type_id', type=int),
+            season_id=request.args.get('season_id', type=int),
+        )
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    response = Response(stream_with_context(lines), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=proposals.{fmt}'
+    return response
+
+
+@bp.route('/aggregates', methods=['GET'])
+@token_required
+def get_aggregates(current_user):
+    """
+    Dashboard counts by workflow state, proposal type, instrument, phase status and
+    instrument status, read from the incrementally maintained counters.
+
+    Query parameters: season_id (default: all seasons combined; 0 for types without a season).
+    """
+    if not (current_user.has_role('Admin') or current_user.has_role('Panel Chair')):
+        return jsonify({'message': 'Admin or Panel Chair role required'}), 403
+    return jsonify(aggregates(season_id=request.args.get('season_id', type=int)))
 
 
 def _resolve_initial_state(proposal_type: ProposalType):
@@ -178,6 +371,7 @@ def create_proposal(current_user):
         return jsonify({'message': str(exc)}), 400
 
     try:
+        refresh_summary(db.session, proposal)
         db.session.commit()
     except IntegrityError as exc:
         db.session.rollback()
@@ -263,6 +457,7 @@ def update_phase(current_user, id):
         phase.payload = payload
     phase.notes = data.get('notes', phase.notes)
 
+    refresh_summary(db.session, proposal)
     db.session.commit()
     return jsonify({'message': 'Phase updated successfully'})
 
@@ -295,6 +490,7 @@ def submit_instrument_feedback(current_user, id, instrument_code):
     proposal_instrument.scheduling_feedback = data.get('payload', {})
     proposal_instrument.status = data.get('status', proposal_instrument.status)
     db.session.add(feedback)
+    refresh_summary(db.session, proposal)
     db.session.commit()
 
     return jsonify({'message': 'Feedback submitted'})
@@ -319,6 +515,7 @@ def confirm_instrument_allocation(current_user, id, instrument_code):
     data = request.get_json() or {}
     proposal_instrument.status = data.get('status', 'confirmed')
     proposal_instrument.confirmed_at = datetime.utcnow()
+    refresh_summary(db.session, proposal)
     db.session.commit()
 
     return jsonify({'message': 'Instrument allocation confirmed'})
@@ -336,6 +533,111 @@ def list_transitions(current_user, id):
     return jsonify({'transitions': transitions})
 
 
+@bp.route('/transitions:batch', methods=['POST'])
+@token_required
+def list_transitions_batch(current_user):
+    """Returns allowed transitions for many proposals in one request."""
+    data = request.get_json() or {}
+    proposal_ids = data.get('proposal_ids')
+    if not isinstance(proposal_ids, list) or not proposal_ids:
+        return jsonify({'message': 'proposal_ids must be a non-empty list'}), 400
+    if len(proposal_ids) > MAX_BATCH_PROPOSALS:
+        return jsonify({'message': f'At most {MAX_BATCH_PROPOSALS} proposals per request'}), 400
+    try:
+        proposal_ids = [int(pid) for pid in proposal_ids]
+    except (TypeError, ValueError):
+        return jsonify({'message': 'proposal_ids must be integers'}), 400
+
+    owners = dict(
+        db.session.query(Proposal.id, Proposal.user_id).filter(Proposal.id.in_(proposal_ids)).all()
+    )
+    is_admin = current_user.has_role('Admin')
+    errors = {}
+    permitted = []
+    for pid in proposal_ids:
+        if pid not in owners:
+            errors[str(pid)] = {'message': 'Proposal not found'}
+        elif owners[pid] != current_user.id and not is_admin:
+            errors[str(pid)] = {'message': 'Permission denied'}
+        else:
+            permitted.append(pid)
+
+    engine = WorkflowEngine(db.session)
+    transitions = engine.get_allowed_actions_bulk(permitted, current_user)
+    return jsonify({
+        'transitions': {str(pid): items for pid, items in transitions.items()},
+        'errors': errors,
+    })
+
+
+@bp.route('/transitions:bulk', methods=['POST'])
+@token_required
+def trigger_transition_bulk(current_user):
+    """
+    Applies one transition to many proposals.
+
+    Request body:
+    {
+        "proposal_ids": [1, 2, 3],
+        "transition": "accept",
+        "context": {...},          // optional, copied for every proposal
+        "chunk_size": 50,          // optional, proposals per transaction
+        "fan_out_tools": false     // optional, send external tool calls concurrently
+    }
+    """
+    data = request.get_json() or {}
+    transition_name = data.get('transition')
+    if not transition_name:
+        return jsonify({'message': 'transition is required'}), 400
+    proposal_ids = data.get('proposal_ids')
+    if not isinstance(proposal_ids, list) or not proposal_ids:
+        return jsonify({'message': 'proposal_ids must be a non-empty list'}), 400
+    if len(proposal_ids) > MAX_BATCH_PROPOSALS:
+        return jsonify({'message': f'At most {MAX_BATCH_PROPOSALS} proposals per request'}), 400
+    try:
+        proposal_ids = list(dict.fromkeys(int(pid) for pid in proposal_ids))
+        chunk_size = int(data['chunk_size']) if data.get('chunk_size') else None
+    except (TypeError, ValueError):
+        return jsonify({'message': 'proposal_ids and chunk_size must be integers'}), 400
+
+    owners = dict(
+        db.session.query(Proposal.id, Proposal.user_id).filter(Proposal.id.in_(proposal_ids)).all()
+    )
+    is_admin = current_user.has_role('Admin')
+    denied = {}
+    permitted = []
+    for pid in proposal_ids:
+        if pid in owners and owners[pid] != current_user.id and not is_admin:
+            denied[pid] = {
+                'status': 'error',
+                'proposal_id': pid,
+                'action': transition_name,
+                'error': 'Permission denied',
+                'error_type': 'permission_denied',
+            }
+        else:
+            permitted.append(pid)
+
+    engine = WorkflowEngine(db.session)
+    executed = engine.execute_transition_bulk(
+        permitted,
+        transition_name,
+        current_user,
+        context=data.get('context', {}),
+        chunk_size=chunk_size,
+        fan_out_tools=bool(data.get('fan_out_tools')),
+    )
+    by_id = {item['proposal_id']: item for item in executed}
+    by_id.update(denied)
+    results = [by_id[pid] for pid in proposal_ids]
+    succeeded = sum(1 for item in results if item['status'] == 'success')
+    return jsonify({
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+    })
+
+
 @bp.route('/<int:id>/transitions', methods=['POST'])
 @token_required
 def trigger_transition(current_user, id):
@@ -361,6 +663,12 @@ def trigger_transition(current_user, id):
             'message': str(exc),
             'error_type': 'permission_denied'
         }), 403
+    except LookupError as exc:
+        # 外部工具执行期间提案被删除
+        return jsonify({
+            'message': str(exc),
+            'error_type': 'not_found'
+        }), 404
     except ValueError as exc:
         # 检查是否是验证错误
         error_msg = str(exc)
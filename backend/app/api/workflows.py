@@ -1,5 +1,6 @@
 from flask import Blueprint, jsonify, request
 from app import db
+from app.core.workflow_compiler import invalidate_workflow, validate_definition
 from app.models.models import Workflow, WorkflowAction, WorkflowState, WorkflowTransition
 from app.api.auth import token_required, admin_required
 
@@ -36,6 +37,11 @@ def create_workflow(current_user):
     if not data or not data.get('name'):
         return jsonify({'message': 'Missing name'}), 400
 
+    try:
+        validate_definition(data.get('definition'))
+    except ValueError as exc:
+        return jsonify({'message': str(exc)}), 400
+
     new_workflow = Workflow(
         name=data['name'],
         description=data.get('description', ''),
@@ -59,8 +65,13 @@ def update_workflow(current_user, id):
     workflow.name = data.get('name', workflow.name)
     workflow.description = data.get('description', workflow.description)
     if 'definition' in data:
+        try:
+            validate_definition(data['definition'])
+        except ValueError as exc:
+            return jsonify({'message': str(exc)}), 400
         workflow.definition = data['definition']
     db.session.commit()
+    invalidate_workflow(workflow.id)
     return jsonify({'message': 'Workflow updated successfully'})
 
 
@@ -85,6 +96,7 @@ def create_workflow_state(current_user, id):
     state = WorkflowState(name=name, workflow=workflow)
     db.session.add(state)
     db.session.commit()
+    invalidate_workflow(workflow.id)
     return jsonify({'message': 'State created', 'id': state.id}), 201
 
 
@@ -0,0 +1,255 @@
+"""
+Asyncio external tool engine
+在单个事件循环中并发发送大量已准备好的外部工具调用（httpx.AsyncClient）
+
+只替换 send 阶段：prepare / complete 仍由 ExternalToolExecutor 在应用上下文中完成，
+因此参数映射、验证、执行日志、缓存、限流、熔断与重试调度的语义与同步执行完全一致。
+并发由全局与每个工具两级信号量限制，不随调用数量增加线程。
+
+httpx 为可选依赖：pip install "astropropose-backend[async]"
+"""
+import asyncio
+import http.cookiejar
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from flask import current_app
+
+from app.core.tool_batching import batch_request, group_calls, split_outcome
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - 未安装可选依赖时只有 threads 引擎可用
+    httpx = None
+
+
+def async_engine_available() -> bool:
+    return httpx is not None
+
+
+class AsyncClientPool:
+    """
+    一个线程内长期存在的事件循环与按工具复用的 AsyncClient
+
+    AsyncClient 的连接绑定在创建它的事件循环上，因此调用 retain_async_clients 的线程
+    （JobWorker）保留自己的循环，send_all 都在其上运行，批次之间保持 keep-alive 连接；
+    其他线程（如 Web 请求中的批量转换）每次 send_all 使用临时的池并在结束时关闭。
+    客户端按与 SessionRegistry 相同的指纹（base_url、认证与 config["http"]）缓存，
+    指纹变化时关闭重建；保留池的线程退出前调用 close_async_clients 关闭。
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        # tool_id -> (指纹, transport, client, 每个工具的并发信号量)
+        self._clients: Dict[int, Tuple[str, Any, 'httpx.AsyncClient', asyncio.Semaphore]] = {}
+        self._stale: List['httpx.AsyncClient'] = []
+
+    def run(self, coro):
+        return self.loop.run_until_complete(coro)
+
+    def client(self, call, limit: int, transport=None) -> Tuple['httpx.AsyncClient', asyncio.Semaphore]:
+        entry = self._clients.get(call.tool_id)
+        if entry is not None and entry[0] == call.http_fingerprint and entry[1] is transport:
+            return entry[2], entry[3]
+        if entry is not None:
+            self._stale.append(entry[2])
+        headers = {} if call.http_config.get('keep_alive', True) else {'Connection': 'close'}
+        # 与 SessionRegistry 一致，不在调用之间保存上游的 Cookie
+        client = httpx.AsyncClient(
+            cookies=http.cookiejar.CookieJar(http.cookiejar.DefaultCookiePolicy(allowed_domains=[])),
+            limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit),
+            headers=headers,
+            transport=transport,
+        )
+        slots = asyncio.Semaphore(limit)
+        self._clients[call.tool_id] = (call.http_fingerprint, transport, client, slots)
+        return client, slots
+
+    async def close_stale(self) -> None:
+        stale, self._stale = self._stale, []
+        await asyncio.gather(*(client.aclose() for client in stale))
+
+    def close(self) -> None:
+        self._stale.extend(entry[2] for entry in self._clients.values())
+        self._clients.clear()
+        try:
+            self.run(self.close_stale())
+        finally:
+            self.loop.close()
+
+
+_local = threading.local()
+
+
+def retain_async_clients() -> None:
+    """让当前线程在多次 send_all 之间保留事件循环与 AsyncClient；线程退出前需调用 close_async_clients"""
+    _local.retain = True
+
+
+def async_client_pool() -> Optional[AsyncClientPool]:
+    """当前线程保留的 AsyncClientPool；未调用 retain_async_clients 的线程返回 None"""
+    if not getattr(_local, 'retain', False):
+        return None
+    pool = getattr(_local, 'pool', None)
+    if pool is None:
+        pool = _local.pool = AsyncClientPool()
+    return pool
+
+
+def close_async_clients() -> None:
+    """关闭当前线程保留的 AsyncClient 与事件循环（未使用过异步引擎时什么也不做）"""
+    _local.retain = False
+    pool = getattr(_local, 'pool', None)
+    if pool is not None:
+        _local.pool = None
+        pool.close()
+
+
+class AsyncToolEngine:
+    """
+    基于 asyncio 的 send 阶段
+
+    send_all 在当前线程保留的（或临时的）AsyncClientPool 事件循环上运行：每个工具一个
+    AsyncClient（连接数上限取 tool.config["http"]["max_concurrency"]，缺省为
+    per_tool_concurrency），相同请求在循环内合并为一次调用。跨进程合并
+    （TOOL_COALESCE_MODE=host）在此引擎中不生效。
+    """
+
+    def __init__(self, executor, max_concurrency: int = 500, per_tool_concurrency: int = 64, transport=None,
+                 pool: Optional[AsyncClientPool] = None):
+        if httpx is None:
+            raise RuntimeError(
+                'EXTERNAL_TOOL_ENGINE=asyncio requires httpx '
+                '(pip install "astropropose-backend[async]")'
+            )
+        self.executor = executor
+        self.max_concurrency = max_concurrency
+        self.per_tool_concurrency = per_tool_concurrency
+        self.transport = transport
+        self.pool = pool or async_client_pool()
+
+    @classmethod
+    def from_config(cls, executor, **kwargs) -> 'AsyncToolEngine':
+        config = current_app.config
+        return cls(
+            executor,
+            max_concurrency=config.get('EXTERNAL_TOOL_ASYNC_CONCURRENCY', 500),
+            per_tool_concurrency=config.get('EXTERNAL_TOOL_ASYNC_PER_TOOL', 64),
+            **kwargs,
+        )
+
+    def send_all(self, calls: List) -> List:
+        """发送全部调用并等待完成；调用方线程中不能已有正在运行的事件循环"""
+        if not calls:
+            return calls
+        if self.pool is not None:
+            self.pool.run(self._send_all(calls, self.pool))
+            return calls
+        pool = AsyncClientPool()
+        try:
+            pool.run(self._send_all(calls, pool))
+        finally:
+            pool.close()
+        return calls
+
+    def _tool_limit(self, call) -> int:
+        return int(call.http_config.get('max_concurrency') or self.per_tool_concurrency)
+
+    async def _send_all(self, calls: List, pool: AsyncClientPool) -> None:
+        self._pool = pool
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._flights: Dict[str, asyncio.Future] = {}
+        batches, singles = group_calls(calls)
+        try:
+            await asyncio.gather(
+                *(self._send(call) for call in singles),
+                *(self._send_batch(batch) for batch in batches),
+            )
+        finally:
+            await pool.close_stale()
+
+    def _client(self, call) -> Tuple['httpx.AsyncClient', asyncio.Semaphore]:
+        return self._pool.client(call, self._tool_limit(call), self.transport)
+
+    async def _send(self, call) -> None:
+        executor = self.executor
+        if executor._use_cached(call):
+            return
+        if call.flights is None:
+            executor._settle(call, await self._attempt_inline(call))
+            return
+        pending = self._flights.get(call.flight_key)
+        if pending is not None:
+            call.coalesced = True
+            executor._settle(call, await asyncio.shield(pending))
+            return
+        pending = self._flights[call.flight_key] = asyncio.get_running_loop().create_future()
+        try:
+            outcome = await self._attempt_inline(call)
+            pending.set_result(outcome)
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            self._flights.pop(call.flight_key, None)
+        executor._settle(call, outcome)
+
+    async def _send_batch(self, calls: List) -> None:
+        executor = self.executor
+        pending = [call for call in calls if not executor._use_cached(call)]
+        if not pending:
+            return
+        request = batch_request(pending)
+        outcome = await self._attempt(request)
+        for call, call_outcome in zip(pending, split_outcome(pending, outcome, request.response_ms)):
+            executor._settle(call, call_outcome)
+
+    async def _attempt_inline(self, call):
+        outcome = await self._attempt(call)
+        while True:
+            delay = self.executor._inline_retry_delay(call, outcome)
+            if delay is None:
+                return outcome
+            await asyncio.sleep(delay)
+            outcome = await self._attempt(call)
+
+    async def _attempt(self, call):
+        executor = self.executor
+        # 熔断器与限流器在本机状态库中加锁读写，放到线程中执行，不阻塞事件循环里的其他调用；
+        # 先过熔断器再预约限流令牌，被熔断拒绝的调用不占用令牌
+        refused = await asyncio.to_thread(executor._admit, call)
+        if refused is not None:
+            return None, refused
+        wait, refused = await asyncio.to_thread(executor._reserve, call)
+        if refused is not None:
+            return None, refused
+        if wait:
+            await asyncio.sleep(wait)
+        client, slots = self._client(call)
+        request_params = call.request_params
+        try:
+            async with self._global, slots:
+                started = time.monotonic()
+                response = await client.request(
+                    request_params['method'],
+                    request_params['url'],
+                    headers=request_params['headers'],
+                    params=request_params.get('params'),
+                    json=request_params.get('body') if request_params.get('body') else None,
+                    timeout=call.timeout,
+                )
+        except Exception as e:
+            return await asyncio.to_thread(executor._record, call, None, _as_requests_error(e))
+        call.response_ms = round((time.monotonic() - started) * 1000, 3)
+        return await asyncio.to_thread(executor._record, call, response, None)
+
+
+def _as_requests_error(error: Exception) -> Exception:
+    """把 httpx 的传输错误转换为 requests 的对应异常，重试与熔断按同一类错误处理"""
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(error) or 'Request timed out')
+    if isinstance(error, httpx.RequestError):
+        return requests.exceptions.ConnectionError(str(error) or type(error).__name__)
+    return error
@@ -0,0 +1,168 @@
+"""
+Per-tool circuit breaker
+按 ExternalTool 统计调用结果，连续失败后熔断（open），冷却期后放行探测请求（half_open）
+状态保存在 HostStore 中，同一台机器上的多个 worker 进程共享
+
+按工具开启：只有 tool.config["circuit_breaker"]["enabled"] 为 true 的工具才会熔断，
+未配置的工具保持原来的失败行为（每次都发出请求）
+"""
+import time
+from typing import Any, Dict, Optional
+
+from flask import current_app
+
+from app.core.host_store import get_host_store
+from app.models.models import ExternalTool
+
+
+DEFAULT_BREAKER_CONFIG = {
+    "enabled": False,  # 默认关闭，需在工具配置中显式开启
+    "failure_threshold": 5,  # 连续失败次数达到后熔断
+    "recovery_timeout": 30,  # 熔断后多少秒放行探测请求
+    "half_open_max_calls": 1,  # 半开状态下同时放行的探测请求数
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于 open 状态，请求未发出"""
+
+
+def breaker_config(tool: ExternalTool) -> Dict[str, Any]:
+    config = dict(DEFAULT_BREAKER_CONFIG)
+    config.update((tool.config or {}).get("circuit_breaker") or {})
+    return config
+
+
+class CircuitBreaker:
+    """
+    熔断器状态机
+
+    closed：正常放行，连续失败计数达到 failure_threshold 时转为 open；
+    open：直接拒绝，recovery_timeout 后第一个请求把状态转为 half_open 并作为探测；
+    half_open：最多放行 half_open_max_calls 个探测，成功则 closed，失败则重新 open。
+    allow / record_* 都不依赖应用上下文，可在 send 线程中调用。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS circuit_breaker (
+        tool_id INTEGER PRIMARY KEY,
+        state TEXT NOT NULL,
+        failures INTEGER NOT NULL DEFAULT 0,
+        opened_at REAL,
+        probes INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        updated_at REAL NOT NULL
+    );
+    """
+
+    def __init__(self, store):
+        self.store = store
+        store.ensure_schema("circuit_breaker", self.SCHEMA)
+
+    def _row(self, conn, tool_id: int) -> Dict[str, Any]:
+        row = conn.execute(
+            "SELECT state, failures, opened_at, probes, last_error, updated_at FROM circuit_breaker WHERE tool_id = ?",
+            (tool_id,),
+        ).fetchone()
+        if row is None:
+            return {"state": CLOSED, "failures": 0, "opened_at": None, "probes": 0, "last_error": None, "updated_at": None}
+        return dict(zip(("state", "failures", "opened_at", "probes", "last_error", "updated_at"), row))
+
+    def _save(self, conn, tool_id: int, row: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO circuit_breaker (tool_id, state, failures, opened_at, probes, last_error, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (tool_id, row["state"], row["failures"], row["opened_at"], row["probes"], row["last_error"], time.time()),
+        )
+
+    def _decide(self, row: Dict[str, Any], config: Dict[str, Any], now: float) -> Optional[bool]:
+        """按当前行判断；需要认领探测名额（写入）时返回 None"""
+        if row["state"] == CLOSED:
+            return True
+        if row["state"] == OPEN:
+            if now - (row["opened_at"] or 0) < config["recovery_timeout"]:
+                return False
+            return None
+        # half_open：探测名额用完时拒绝；探测方长时间无结果（进程退出）则重新放行
+        stale = row["updated_at"] is not None and now - row["updated_at"] >= config["recovery_timeout"]
+        if row["probes"] >= config["half_open_max_calls"] and not stale:
+            return False
+        return None
+
+    def allow(self, tool_id: int, config: Dict[str, Any]) -> bool:
+        """
+        是否放行一次请求
+
+        先无锁读取：closed 放行、冷却期内的 open 与探测名额已满的 half_open 直接拒绝；
+        只有需要认领半开探测名额时才加写锁，并在锁内按最新的行重新判断。
+        """
+        if not config["enabled"]:
+            return True
+        now = time.time()
+        decision = self._decide(self._row(self.store, tool_id), config, now)
+        if decision is not None:
+            return decision
+        with self.store.transaction() as conn:
+            row = self._row(conn, tool_id)
+            decision = self._decide(row, config, now)
+            if decision is not None:
+                return decision
+            if row["state"] == OPEN:
+                row.update(state=HALF_OPEN, probes=0)
+            stale = row["updated_at"] is not None and now - row["updated_at"] >= config["recovery_timeout"]
+            row["probes"] = 1 if stale else row["probes"] + 1
+            self._save(conn, tool_id, row)
+        return True
+
+    def record_success(self, tool_id: int, config: Dict[str, Any]) -> None:
+        if not config["enabled"]:
+            return
+        row = self._row(self.store, tool_id)
+        if row["state"] == CLOSED and row["failures"] == 0:
+            return
+        with self.store.transaction() as conn:
+            self._save(conn, tool_id, {"state": CLOSED, "failures": 0, "opened_at": None, "probes": 0, "last_error": None})
+
+    def record_failure(self, tool_id: int, config: Dict[str, Any], error: Optional[str] = None) -> None:
+        if not config["enabled"]:
+            return
+        with self.store.transaction() as conn:
+            row = self._row(conn, tool_id)
+            row["failures"] += 1
+            row["last_error"] = (error or "")[:500]
+            if row["state"] == HALF_OPEN or row["failures"] >= config["failure_threshold"]:
+                row.update(state=OPEN, opened_at=time.time(), probes=0)
+            self._save(conn, tool_id, row)
+
+    def reset(self, tool_id: int) -> None:
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM circuit_breaker WHERE tool_id = ?", (tool_id,))
+
+    def status(self, tool: ExternalTool) -> Dict[str, Any]:
+        config = breaker_config(tool)
+        row = self._row(self.store, tool.id)
+        retry_at = None
+        if row["state"] == OPEN and row["opened_at"] is not None:
+            retry_at = row["opened_at"] + config["recovery_timeout"]
+        return {
+            "enabled": config["enabled"],
+            "state": row["state"],
+            "failures": row["failures"],
+            "failure_threshold": config["failure_threshold"],
+            "opened_at": row["opened_at"],
+            "retry_at": retry_at,
+            "last_error": row["last_error"],
+        }
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """当前应用的熔断器（状态存放在 HOST_STATE_PATH 指向的本机共享库中）"""
+    app = current_app._get_current_object()
+    breaker = app.extensions.get("tool_circuit_breaker")
+    if breaker is None:
+        breaker = app.extensions["tool_circuit_breaker"] = CircuitBreaker(get_host_store())
+    return breaker
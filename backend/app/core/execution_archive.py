@@ -0,0 +1,250 @@
+"""
+External tool execution archive
+把超过保留期的执行日志移出 external_tool_execution，按月追加到压缩归档文件中
+
+归档文件位于 EXECUTION_ARCHIVE_DIR，命名为 executions-YYYY-MM.jsonl.gz。每批记录写为
+一个独立的 gzip 成员（整个文件仍是合法的 gzip 流，可直接 zcat），成员的起始偏移
+记在 ExternalToolExecutionArchive 索引表中，按提案或操作查询时只解压命中的成员。
+"""
+import gzip
+import json
+import os
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from flask import current_app
+from sqlalchemy import and_, exists
+
+from app import db
+from app.core.execution_log import BODY_FIELDS, stored_body
+from app.models.models import (
+    ExternalToolBlob,
+    ExternalToolExecution,
+    ExternalToolExecutionArchive,
+    ExternalToolJob,
+)
+
+
+# 仍可能被 worker 或重试调度更新的执行不归档
+ACTIVE_STATUSES = ("pending", "queued", "running", "retrying")
+
+
+def archive_dir() -> str:
+    return current_app.config["EXECUTION_ARCHIVE_DIR"]
+
+
+def serialize_execution(execution: ExternalToolExecution) -> Dict[str, Any]:
+    """
+    执行记录 -> 可写入 JSON 的字典
+
+    时间为 ISO 字符串；请求/响应内容从去重存储中取回（保持编码后的形式），
+    归档记录因此不依赖 external_tool_blob。
+    """
+    record = {}
+    for column in ExternalToolExecution.__table__.columns:
+        value = getattr(execution, column.name)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        record[column.name] = value
+    for field in BODY_FIELDS:
+        record[field] = stored_body(execution, field)
+    return record
+
+
+def _unreferenced():
+    """内容没有被任何在线执行记录引用"""
+    return and_(*(
+        ~exists().where(getattr(ExternalToolExecution, f"{field}_hash") == ExternalToolBlob.hash)
+        for field in BODY_FIELDS
+    ))
+
+
+def _mark_unreferenced_blobs(hashes: Set[str]) -> None:
+    """给已归档记录引用过、现在已无引用的内容打上待清理标记（orphaned_at）"""
+    if not hashes:
+        return
+    db.session.execute(
+        ExternalToolBlob.__table__.update()
+        .where(ExternalToolBlob.hash.in_(list(hashes)), ExternalToolBlob.orphaned_at.is_(None), _unreferenced())
+        .values(orphaned_at=datetime.utcnow())
+    )
+
+
+def _prune_blobs() -> int:
+    """
+    删除标记超过 EXECUTION_BLOB_GRACE_SECONDS 且仍无引用的内容，返回删除数
+
+    是否仍在使用只看执行记录的引用；写入方在写入内容前清除标记（store_execution_bodies），
+    因此标记之后又被并发写入引用、执行记录尚未提交的内容不会被删除：清除标记的事务提交前
+    删除语句在该行上等待，提交后标记已为空；删除先提交时写入方重新插入该内容。
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config.get("EXECUTION_BLOB_GRACE_SECONDS", 3600))
+    return db.session.execute(
+        ExternalToolBlob.__table__.delete().where(ExternalToolBlob.orphaned_at < cutoff, _unreferenced())
+    ).rowcount
+
+
+def _append_member(path: str, records: List[Dict[str, Any]]) -> int:
+    """把一批记录作为一个 gzip 成员追加到文件末尾并落盘，返回成员的起始偏移"""
+    lines = "".join(json.dumps(record, default=str, ensure_ascii=False) + "\n" for record in records)
+    data = gzip.compress(lines.encode("utf-8"))
+    with open(path, "ab") as fh:
+        offset = fh.seek(0, os.SEEK_END)
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    return offset
+
+
+def _read_member(path: str, offset: int) -> List[Dict[str, Any]]:
+    """解压从 offset 开始的单个 gzip 成员"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = []
+    with open(path, "rb") as fh:
+        fh.seek(offset)
+        while not decompressor.eof:
+            block = fh.read(64 * 1024)
+            if not block:
+                break
+            chunks.append(decompressor.decompress(block))
+    return [json.loads(line) for line in b"".join(chunks).decode("utf-8").splitlines() if line]
+
+
+def archive_executions(older_than_days: Optional[int] = None, batch_size: Optional[int] = None) -> int:
+    """
+    归档 started_at 早于保留期的已结束执行，返回归档条数
+
+    每批先写归档文件并 fsync，再在一个事务中写入索引、删除对应的已结束任务和执行记录，
+    并标记只被这些记录引用的去重内容；最后删除标记已超过宽限期的内容（见 _prune_blobs）。
+    中途失败时最多在归档文件中留下未被索引引用的重复成员，不会丢记录。
+    """
+    config = current_app.config
+    if older_than_days is None:
+        older_than_days = config.get("EXECUTION_RETENTION_DAYS", 90)
+    if batch_size is None:
+        batch_size = config.get("EXECUTION_ARCHIVE_BATCH", 1000)
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    directory = archive_dir()
+    os.makedirs(directory, exist_ok=True)
+
+    archived = 0
+    last_id = 0
+    while True:
+        executions = (
+            ExternalToolExecution.query
+            .filter(
+                ExternalToolExecution.id > last_id,
+                ExternalToolExecution.started_at < cutoff,
+                ExternalToolExecution.status.notin_(ACTIVE_STATUSES),
+            )
+            .order_by(ExternalToolExecution.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not executions:
+            break
+        last_id = executions[-1].id
+
+        by_month = defaultdict(list)
+        for execution in executions:
+            by_month[execution.started_at.strftime("%Y-%m")].append(execution)
+
+        index_rows = []
+        for month, items in sorted(by_month.items()):
+            file_name = f"executions-{month}.jsonl.gz"
+            offset = _append_member(os.path.join(directory, file_name), [serialize_execution(e) for e in items])
+            index_rows.extend(
+                ExternalToolExecutionArchive(
+                    execution_id=e.id,
+                    operation_id=e.operation_id,
+                    proposal_id=e.proposal_id,
+                    actor_id=e.actor_id,
+                    status=e.status,
+                    started_at=e.started_at,
+                    archive_file=file_name,
+                    member_offset=offset,
+                )
+                for e in items
+            )
+
+        ids = [e.id for e in executions]
+        hashes = {
+            getattr(e, f"{field}_hash") for e in executions for field in BODY_FIELDS
+        } - {None}
+        db.session.add_all(index_rows)
+        ExternalToolJob.query.filter(ExternalToolJob.execution_id.in_(ids)).delete(synchronize_session=False)
+        ExternalToolExecution.query.filter(ExternalToolExecution.id.in_(ids)).delete(synchronize_session=False)
+        _mark_unreferenced_blobs(hashes)
+        db.session.commit()
+        for execution in executions:
+            db.session.expunge(execution)
+        archived += len(ids)
+    _prune_blobs()
+    db.session.commit()
+    return archived
+
+
+def _load_archived(entries: Iterable[ExternalToolExecutionArchive]) -> List[Dict[str, Any]]:
+    """按 (文件, 偏移) 分组读取归档成员，返回索引条目对应的记录"""
+    wanted = defaultdict(set)
+    for entry in entries:
+        wanted[(entry.archive_file, entry.member_offset)].add(entry.execution_id)
+    directory = archive_dir()
+    records = []
+    for (file_name, offset), ids in wanted.items():
+        for record in _read_member(os.path.join(directory, file_name), offset):
+            if record["id"] in ids:
+                record["archived"] = True
+                records.append(record)
+    return records
+
+
+def get_archived_execution(execution_id: int) -> Optional[Dict[str, Any]]:
+    entry = db.session.get(ExternalToolExecutionArchive, execution_id)
+    if entry is None:
+        return None
+    records = _load_archived([entry])
+    return records[0] if records else None
+
+
+def query_executions(
+    proposal_id: Optional[int] = None,
+    operation_id: Optional[int] = None,
+    status: Optional[str] = None,
+    actor_id: Optional[int] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    同时查询在线表与归档，按 started_at 倒序返回最多 limit 条
+
+    归档部分先在索引表上过滤并截取 limit 条，再只解压涉及的成员。
+    """
+    filters = {
+        "proposal_id": proposal_id,
+        "operation_id": operation_id,
+        "status": status,
+        "actor_id": actor_id,
+    }
+    filters = {name: value for name, value in filters.items() if value is not None}
+
+    hot = (
+        ExternalToolExecution.query
+        .filter_by(**filters)
+        .order_by(ExternalToolExecution.started_at.desc(), ExternalToolExecution.id.desc())
+        .limit(limit)
+        .all()
+    )
+    records = [dict(serialize_execution(execution), archived=False) for execution in hot]
+
+    entries = (
+        ExternalToolExecutionArchive.query
+        .filter_by(**filters)
+        .order_by(ExternalToolExecutionArchive.started_at.desc(), ExternalToolExecutionArchive.execution_id.desc())
+        .limit(limit)
+        .all()
+    )
+    records.extend(_load_archived(entries))
+    records.sort(key=lambda record: (record["started_at"] or "", record["id"]), reverse=True)
+    return records[:limit]
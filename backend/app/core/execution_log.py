@@ -0,0 +1,279 @@
+"""
+External tool execution log
+执行日志的请求/响应体编码（截断、压缩）与后台批量写入（write-behind）
+"""
+import atexit
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import select
+
+from app import db
+from app.models.models import ExternalToolBlob, ExternalToolExecution
+
+logger = logging.getLogger(__name__)
+
+ENCODING_KEY = "_encoding"
+
+# 按内容去重存储的字段
+BODY_FIELDS = ("request_body", "response_headers", "response_body")
+
+
+def encode_body(value: Any, max_bytes: int = 0, compress: bool = False, compress_min: int = 1024) -> Any:
+    """
+    按配置编码要写入日志的 JSON 内容
+
+    超过 max_bytes（>0 时生效）的内容截断为 {"_encoding": "truncated", ...}；
+    开启压缩且序列化后不小于 compress_min 字节时存为 gzip+base64。
+    小内容保持原样，已编码的内容不再处理。
+    """
+    if value is None or (isinstance(value, dict) and ENCODING_KEY in value):
+        return value
+    if not max_bytes and not compress:
+        return value
+    raw = json.dumps(value, default=str, ensure_ascii=False).encode("utf-8")
+    if max_bytes and len(raw) > max_bytes:
+        return {
+            ENCODING_KEY: "truncated",
+            "size": len(raw),
+            "preview": raw[:max_bytes].decode("utf-8", errors="ignore"),
+        }
+    if compress and len(raw) >= compress_min:
+        return {
+            ENCODING_KEY: "gzip+base64",
+            "size": len(raw),
+            "data": base64.b64encode(gzip.compress(raw)).decode("ascii"),
+        }
+    return value
+
+
+def decode_body(value: Any) -> Any:
+    """还原 encode_body 的结果；截断的内容原样返回（只有预览）"""
+    if isinstance(value, dict) and value.get(ENCODING_KEY) == "gzip+base64":
+        return json.loads(gzip.decompress(base64.b64decode(value["data"])).decode("utf-8"))
+    return value
+
+
+def body_hash(value: Any) -> str:
+    """内容哈希：规范化（键排序、无空白）JSON 的 SHA-256"""
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _insert_blobs(session, rows: List[Dict[str, Any]]) -> None:
+    """
+    写入库中还没有的内容；已存在的行保持不变，热门内容被反复引用时不会反复改写同一行
+
+    先清除这些内容的待清理标记（只有被归档标记过的行会被改写），再插入缺失的行：
+    与 execution_archive._prune_blobs 并发时，内容要么保留，要么被删除后在这里重新插入。
+    """
+    table = ExternalToolBlob.__table__
+    session.execute(
+        table.update()
+        .where(table.c.hash.in_([row["hash"] for row in rows]), table.c.orphaned_at.isnot(None))
+        .values(orphaned_at=None)
+    )
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        session.execute(insert(table).on_conflict_do_nothing(index_elements=["hash"]), rows)
+        return
+    existing = {
+        digest
+        for (digest,) in session.execute(
+            select(table.c.hash).where(table.c.hash.in_([row["hash"] for row in rows]))
+        )
+    }
+    missing = [row for row in rows if row["hash"] not in existing]
+    if missing:
+        session.execute(table.insert(), missing)
+
+
+def store_execution_bodies(session, executions: Iterable[ExternalToolExecution]) -> None:
+    """
+    按配置编码执行记录的请求/响应内容，在写入数据库前调用
+
+    EXTERNAL_TOOL_LOG_DEDUP 开启时，内容按原始 JSON 的哈希写入 ExternalToolBlob（库中已有的
+    不再写入），执行记录只保留 *_hash 列；否则按 encode_body 就地编码。
+    """
+    config = current_app.config
+    options = dict(
+        max_bytes=config.get("EXTERNAL_TOOL_LOG_MAX_BODY", 0),
+        compress=config.get("EXTERNAL_TOOL_LOG_COMPRESS", False),
+        compress_min=config.get("EXTERNAL_TOOL_LOG_COMPRESS_MIN", 1024),
+    )
+    dedup = config.get("EXTERNAL_TOOL_LOG_DEDUP", True)
+    contents: Dict[str, Any] = {}
+    for execution in executions:
+        for field in BODY_FIELDS:
+            value = getattr(execution, field)
+            if value is None:
+                continue
+            if not dedup:
+                setattr(execution, field, encode_body(value, **options))
+                continue
+            digest = body_hash(value)
+            contents.setdefault(digest, value)
+            setattr(execution, f"{field}_hash", digest)
+            setattr(execution, field, None)
+    if not contents:
+        return
+
+    now = datetime.utcnow()
+    rows = []
+    for digest, value in contents.items():
+        size = len(json.dumps(value, default=str, ensure_ascii=False).encode("utf-8"))
+        rows.append({
+            "hash": digest,
+            "content": encode_body(value, **options),
+            "size": size,
+            "created_at": now,
+        })
+    _insert_blobs(session, rows)
+
+
+def stored_body(execution: ExternalToolExecution, field: str) -> Any:
+    """执行记录中某个内容字段的存储形式（可能仍是 encode_body 的编码结果）"""
+    value = getattr(execution, field)
+    digest = getattr(execution, f"{field}_hash")
+    if value is None and digest:
+        blob = db.session.get(ExternalToolBlob, digest)
+        value = blob.content if blob is not None else None
+    return value
+
+
+def execution_body(execution: ExternalToolExecution, field: str = "response_body") -> Any:
+    """读取执行记录的请求/响应内容（解析内容哈希并解压）"""
+    return decode_body(stored_body(execution, field))
+
+
+def _snapshot(execution: ExternalToolExecution) -> Dict[str, Any]:
+    return {
+        column.name: getattr(execution, column.name)
+        for column in ExternalToolExecution.__table__.columns
+        if column.name != "id" and getattr(execution, column.name) is not None
+    }
+
+
+class ExecutionLogWriter:
+    """
+    执行日志的后台批量写入
+
+    submit 只把记录的快照放入队列；后台线程在自己的应用上下文中每攒够
+    batch_size 条或每隔 flush_interval 秒编码并写入一次（一个事务）。队列已满时
+    退回到调用线程同步写入，不丢记录。
+    """
+
+    def __init__(self, app, batch_size: int = 100, flush_interval: float = 1.0, max_queue: int = 10000):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self.written = 0
+        self.inline_writes = 0
+
+    def submit(self, execution: ExternalToolExecution) -> None:
+        record = _snapshot(execution)
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.inline_writes += 1
+            self._write([record])
+            return
+        self._ensure_thread()
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> None:
+        """把队列中的记录全部写入（测试与进程退出时调用）"""
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return
+            self._write(batch)
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            self._wakeup.set()
+            thread.join()
+        self.flush()
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="execution-log-writer", daemon=True)
+                self._thread.start()
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        # 每隔 flush_interval 秒（或队列攒满 batch_size 条被唤醒时）写出队列中的全部记录
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            while True:
+                batch = self._take(self.batch_size)
+                if not batch:
+                    break
+                try:
+                    self._write(batch)
+                except Exception:
+                    logger.exception("Failed to write %s execution log records", len(batch))
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        with self.app.app_context():
+            try:
+                executions = [ExternalToolExecution(**record) for record in batch]
+                store_execution_bodies(db.session, executions)
+                db.session.add_all(executions)
+                db.session.commit()
+            finally:
+                db.session.remove()
+        with self._lock:
+            self.written += len(batch)
+
+
+def get_log_writer() -> Optional[ExecutionLogWriter]:
+    """EXTERNAL_TOOL_LOG_MODE=buffered 时返回当前应用的日志写入器，否则为 None"""
+    app = current_app._get_current_object()
+    if app.config.get("EXTERNAL_TOOL_LOG_MODE", "sync") != "buffered":
+        return None
+    writer = app.extensions.get("execution_log_writer")
+    if writer is None:
+        writer = app.extensions["execution_log_writer"] = ExecutionLogWriter(
+            app,
+            batch_size=app.config.get("EXTERNAL_TOOL_LOG_BATCH_SIZE", 100),
+            flush_interval=app.config.get("EXTERNAL_TOOL_LOG_FLUSH_INTERVAL", 1.0),
+            max_queue=app.config.get("EXTERNAL_TOOL_LOG_QUEUE_SIZE", 10000),
+        )
+        atexit.register(writer.stop)
+    return writer
@@ -3,20 +3,176 @@ External Tool Executor
 负责在工作流中执行外部工具调用
 支持参数映射、重试机制、执行日志
 """
+import random
 import time
-from datetime import datetime
-from typing import Any, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Dict, FrozenSet, List, Optional
+from urllib.parse import urlencode
 import requests
+from flask import current_app
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload
 
 from app import db
+from app.core.circuit_breaker import CircuitOpenError, breaker_config, get_circuit_breaker
+from app.core.execution_log import get_log_writer, store_execution_bodies
+from app.core.http_sessions import http_config, http_sessions, tool_fingerprint
+from app.core.job_queue import schedule_retry
+from app.core.rate_limiter import RateLimitedError, get_rate_limiter, rate_limit_config
+from app.core.single_flight import coalesce_enabled, flight_key, get_single_flight
+from app.core.tool_batching import batch_config, batch_request, group_calls, split_outcome
+from app.core.tool_cache import cache_key, get_response_cache
+from app.core.tool_mapping import compiled_mappings
 from app.models.models import (
     ExternalTool,
     ExternalToolOperation,
     ExternalToolExecution,
     Proposal,
+    ProposalInstrument,
 )
 
 
+# 请求未实际发出（熔断或限流拒绝）的错误；可延后重试，按服务不可用返回
+NOT_SENT_ERRORS = (CircuitOpenError, RateLimitedError)
+
+
+def blocks_transition(operation) -> bool:
+    """验证结果可能阻止工作流转换的操作（调用方必须当场拿到结论）"""
+    if operation.tool_type != 'validation':
+        return False
+    validation_config = operation.validation_config or {}
+    return bool(
+        validation_config.get('block_on_failure', True)
+        or validation_config.get('block_on_service_error', False)
+    )
+
+
+def _source_status(proposal: Proposal, state_name: Optional[str]) -> Optional[str]:
+    if state_name:
+        return state_name
+    return proposal.current_state.name if proposal.current_state else None
+
+
+def _source_author(proposal: Proposal, state_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    author = proposal.author
+    if not author:
+        return None
+    return {
+        'id': author.id,
+        'username': author.username,
+        'email': author.email,
+    }
+
+
+def _source_phases(proposal: Proposal, state_name: Optional[str]) -> List[Dict[str, Any]]:
+    return [
+        {
+            'phase': p.phase,
+            'status': p.status,
+            'payload': p.payload,
+        }
+        for p in proposal.phases
+    ]
+
+
+def _source_instruments(proposal: Proposal, state_name: Optional[str]) -> List[Dict[str, Any]]:
+    return [
+        {
+            'code': pi.instrument.code,
+            'status': pi.status,
+            'form_data': pi.form_data,
+            'scheduling_feedback': pi.scheduling_feedback,
+        }
+        for pi in proposal.instruments.options(joinedload(ProposalInstrument.instrument))
+    ]
+
+
+# 数据源中 proposal 的各字段及其构建方式
+_PROPOSAL_SOURCE_BUILDERS = {
+    'id': lambda proposal, state_name: proposal.id,
+    'title': lambda proposal, state_name: proposal.title,
+    'abstract': lambda proposal, state_name: proposal.abstract,
+    'status': _source_status,
+    'data': lambda proposal, state_name: proposal.data or {},
+    'author': _source_author,
+    'phases': _source_phases,
+    'instruments': _source_instruments,
+}
+PROPOSAL_SOURCE_FIELDS = frozenset(_PROPOSAL_SOURCE_BUILDERS)
+
+
+def _request_url(request_params: Dict[str, Any]) -> str:
+    """实际请求的 URL（含查询参数，与 requests 一样忽略取值为 None 的参数）"""
+    url = request_params['url']
+    params = {key: value for key, value in (request_params.get('params') or {}).items() if value is not None}
+    if not params:
+        return url
+    return f"{url}{'&' if '?' in url else '?'}{urlencode(params, doseq=True)}"
+
+
+class PreparedCall:
+    """
+    一次外部工具调用在 prepare / send / complete 三个阶段之间传递的状态
+
+    send 阶段只访问本对象，不触碰数据库会话，因此可以在线程池中并发执行。
+    """
+
+    def __init__(self, operation, proposal, context, execution, request_params):
+        self.operation = operation
+        self.proposal = proposal
+        self.context = context
+        self.execution = execution
+        self.request_params = request_params
+        self.timeout = operation.timeout
+        retry_config = operation.retry_config or {}
+        self.max_retries = retry_config.get('max_retries', 3)
+        self.retry_delay = retry_config.get('retry_delay', 5)
+        self.retryable_codes = retry_config.get('retryable_codes', [500, 502, 503, 504])
+        # 阻止型验证工具当场有限次重试（次数与单次等待均有上限），仍失败即作为服务错误返回；
+        # 其余操作的重试交给任务队列
+        self.defer_retries = not blocks_transition(operation)
+        config = current_app.config
+        self.inline_retries = 0 if self.defer_retries else min(
+            self.max_retries, config.get('EXTERNAL_TOOL_INLINE_RETRIES', 2)
+        )
+        self.inline_max_delay = config.get('EXTERNAL_TOOL_INLINE_RETRY_MAX_DELAY', 2.0)
+        self.retry_due = False
+        self.session = http_sessions.get(operation.tool)
+        self.http_config = http_config(operation.tool)
+        self.http_fingerprint = tool_fingerprint(operation.tool)
+        # 响应缓存在 prepare 阶段（应用上下文内）解析，send 线程中只读取
+        cache_config = operation.cache_config or {}
+        self.cache_ttl = cache_config.get('ttl', 300) if cache_config.get('enabled') else 0
+        self.cache = get_response_cache() if self.cache_ttl else None
+        self.cache_key = cache_key(operation.id, request_params) if self.cache else None
+        self.cache_hit = False
+        # 熔断器同样在 prepare 阶段解析
+        self.tool_id = operation.tool_id
+        self.tool_name = operation.tool.name
+        self.breaker_config = breaker_config(operation.tool)
+        self.breaker = get_circuit_breaker() if self.breaker_config['enabled'] else None
+        self.rate_limit = rate_limit_config(operation.tool)
+        self.limiter = get_rate_limiter() if self.rate_limit else None
+        # 批量操作在 send_all 中与同批次的其他调用合并；其余操作的并发相同请求合并为一次上游调用
+        self.operation_id = operation.id
+        self.batch = batch_config(operation)
+        coalesce = self.batch is None and coalesce_enabled(operation)
+        self.flights = get_single_flight() if coalesce else None
+        self.flight_key = flight_key(operation.id, request_params) if self.flights else None
+        self.flight_wait = (operation.timeout or 30) + 5
+        self.coalesced = False
+        self.retry_count = execution.retry_count or 0
+        self.response = None
+        self.error = None
+        self.response_ms = None  # 请求发出到收到响应的耗时，不含限流等待；缓存命中与共享他人结果时没有该值，批量调用记整批请求的耗时
+        self.log_writer = None
+        self.proposal_data = None  # 非 None 时输出映射写入该字典而不是 proposal.data（见 prepare）
+
+    def can_retry(self) -> bool:
+        return self.defer_retries and self.retry_count < self.max_retries
+
+
 class ExternalToolExecutor:
     """
     外部工具执行器
@@ -26,11 +182,17 @@ class ExternalToolExecutor:
     2. 执行 HTTP 请求
     3. 处理响应并映射回 proposal/context
     4. 记录执行日志
-    5. 处理重试逻辑
+    5. 处理重试逻辑（可重试的失败记为 retrying，由任务队列按退避时间重新执行）
+
+    一次调用分为三个阶段：prepare（建日志、构建请求）、send（纯 HTTP）、
+    complete（写回响应与映射）。execute 依次执行三者，并在 send 之前提交，
+    使 HTTP 请求期间不持有数据库连接；send_all 可并发执行多个已准备好的
+    调用。autocommit=False 时只 flush，由调用方负责提交。
     """
     
-    def __init__(self, db_session=None):
+    def __init__(self, db_session=None, autocommit: bool = True):
         self.db = db_session or db.session
+        self.autocommit = autocommit
     
     def execute(
         self,
@@ -53,51 +215,262 @@ class ExternalToolExecutor:
         Returns:
             执行结果，包含 status, response, mapped_output
         """
+        call = self.prepare(operation_id, proposal, context, actor, triggered_by)
+        if self.autocommit:
+            # 执行日志先以 running 状态提交，请求期间不占用数据库连接
+            self.db.commit()
+        self.send(call)
+        return self.complete(call)
+
+    def prepare(
+        self,
+        operation_id: int,
+        proposal: Optional[Proposal] = None,
+        context: Optional[Dict[str, Any]] = None,
+        actor=None,
+        triggered_by: str = "manual",
+        state_name: Optional[str] = None,
+        execution: Optional[ExternalToolExecution] = None,
+        proposal_data: Optional[Dict[str, Any]] = None,
+    ) -> PreparedCall:
+        """
+        创建执行日志并构建请求参数
+
+        state_name 用于覆盖数据源中的 proposal.status（批量转换在状态写入前
+        准备请求时，传入目标状态以保持与逐个执行一致的请求内容）。
+        execution 为已存在的日志（如异步任务入队时创建的 queued 记录）时复用之。
+        proposal_data 为暂不写回 proposal.data 的工具输出（转换在重新加锁校验通过后
+        才写回）：数据源中的 proposal.data 合并其内容，本次调用映射到 proposal.data
+        的输出也写入该字典而不修改提案。
+        """
         operation = ExternalToolOperation.query.get_or_404(operation_id)
-        tool = operation.tool
-        context = context or {}
+        context = context if context is not None else {}
         
-        # 创建执行日志
-        execution = ExternalToolExecution(
-            operation_id=operation.id,
-            proposal_id=proposal.id if proposal else None,
-            triggered_by=triggered_by,
-            actor_id=actor.id if actor else None,
-            status="running",
-            started_at=datetime.utcnow(),
-        )
-        self.db.add(execution)
+        # 创建执行日志；缓冲模式下日志不进入会话，complete 后交给后台写入
+        log_writer = None
+        if execution is None:
+            execution = ExternalToolExecution(
+                operation_id=operation.id,
+                proposal_id=proposal.id if proposal else None,
+                triggered_by=triggered_by,
+                actor_id=actor.id if actor else None,
+            )
+            log_writer = self._log_writer(operation, triggered_by)
+            if log_writer is None:
+                self.db.add(execution)
+        execution.status = "running"
+        execution.started_at = datetime.utcnow()
+        execution.next_attempt_at = None
         self.db.flush()
         
         try:
             # 构建请求参数
             request_params = self._build_request_params(
-                operation, proposal, context
+                operation, proposal, context, state_name, proposal_data
             )
             
             # 记录请求详情
-            execution.request_url = request_params['url']
+            execution.request_url = _request_url(request_params)
             execution.request_method = operation.method
             execution.request_headers = self._sanitize_headers(request_params['headers'])
             execution.request_body = request_params.get('body', {})
-            
-            # 执行请求（带重试）
-            retry_config = operation.retry_config or {}
-            max_retries = retry_config.get('max_retries', 3)
-            retry_delay = retry_config.get('retry_delay', 5)
-            retryable_codes = retry_config.get('retryable_codes', [500, 502, 503, 504])
-            
-            response = self._execute_with_retry(
-                request_params,
-                operation.timeout,
-                max_retries,
-                retry_delay,
-                retryable_codes,
-                execution,
+        except Exception as e:
+            self._finish(execution, "failed", str(e))
+            if log_writer is not None:
+                log_writer.submit(execution)
+            raise
+        
+        call = PreparedCall(operation, proposal, context, execution, request_params)
+        call.log_writer = log_writer
+        call.proposal_data = proposal_data
+        return call
+
+    def send(self, call: PreparedCall) -> PreparedCall:
+        """执行一次 HTTP 请求；不访问数据库，异常记录在 call.error 中"""
+        if call.batch is not None:
+            self._send_batch([call])
+            return call
+        if self._use_cached(call):
+            return call
+        if call.flights is not None:
+            # 相同请求正在进行时等待并共享其结果（熔断统计与缓存写入只由领头调用完成）
+            outcome, call.coalesced = call.flights.do(
+                call.flight_key, lambda: self._attempt_inline(call), call.flight_wait
             )
+        else:
+            outcome = self._attempt_inline(call)
+        return self._settle(call, outcome)
+
+    def _send_batch(self, calls: List[PreparedCall]) -> None:
+        """把同一批量接口的调用合并为一次请求发送，再把结果拆回各调用"""
+        pending = [call for call in calls if not self._use_cached(call)]
+        if not pending:
+            return
+        request = batch_request(pending)
+        outcome = self._attempt(request)
+        for call, call_outcome in zip(pending, split_outcome(pending, outcome, request.response_ms)):
+            self._settle(call, call_outcome)
+
+    def _send_unit(self, unit) -> None:
+        if isinstance(unit, list):
+            self._send_batch(unit)
+        else:
+            self.send(unit)
+
+    def _use_cached(self, call: PreparedCall) -> bool:
+        if call.cache is None:
+            return False
+        cached = call.cache.get(call.cache_key)
+        if cached is None:
+            return False
+        call.response = cached
+        call.cache_hit = True
+        return True
+
+    def _reserve(self, call: PreparedCall):
+        """按工具限流预约发送时间，返回 (需等待的秒数, 拒绝时的异常)"""
+        if call.limiter is None:
+            return 0.0, None
+        try:
+            return call.limiter.acquire(call.tool_id, call.rate_limit), None
+        except RateLimitedError as e:
+            return 0.0, e
+
+    def _admit(self, call: PreparedCall) -> Optional[CircuitOpenError]:
+        """熔断器拒绝时返回对应的异常"""
+        breaker = call.breaker
+        if breaker is None or breaker.allow(call.tool_id, call.breaker_config):
+            return None
+        return CircuitOpenError(
+            f"External tool '{call.tool_name}' is temporarily unavailable (circuit open)"
+        )
+
+    def _record(self, call: PreparedCall, response, error: Optional[BaseException]):
+        """把一次请求的结果计入熔断器，返回 (response, error)"""
+        breaker = call.breaker
+        if breaker is None:
+            return response, error
+        if isinstance(error, requests.exceptions.RequestException):
+            breaker.record_failure(call.tool_id, call.breaker_config, str(error))
+        elif response is not None:
+            status_code = response.status_code
+            if status_code >= 500 or status_code in call.retryable_codes:
+                breaker.record_failure(call.tool_id, call.breaker_config, f"HTTP {status_code}")
+            else:
+                breaker.record_success(call.tool_id, call.breaker_config)
+        return response, error
+
+    def _attempt(self, call: PreparedCall):
+        """经过熔断器与限流发出一次请求，返回 (response, error)"""
+        # 先过熔断器再预约限流令牌，被熔断拒绝的调用不占用令牌
+        refused = self._admit(call)
+        if refused is not None:
+            return None, refused
+        wait, refused = self._reserve(call)
+        if refused is not None:
+            return None, refused
+        if wait:
+            time.sleep(wait)
+        started = time.monotonic()
+        try:
+            response = self._send_request(call)
+        except Exception as e:
+            return self._record(call, None, e)
+        call.response_ms = round((time.monotonic() - started) * 1000, 3)
+        return self._record(call, response, None)
+
+    def _attempt_inline(self, call: PreparedCall):
+        """发出请求；阻止型验证工具遇到可重试的失败时当场有限次重试"""
+        outcome = self._attempt(call)
+        while True:
+            delay = self._inline_retry_delay(call, outcome)
+            if delay is None:
+                return outcome
+            time.sleep(delay)
+            outcome = self._attempt(call)
+
+    def _inline_retry_delay(self, call: PreparedCall, outcome) -> Optional[float]:
+        """还可以当场重试时计入一次重试并返回等待秒数，否则返回 None（熔断、限流拒绝不重试）"""
+        if call.retry_count >= call.inline_retries:
+            return None
+        response, error = outcome
+        if error is not None:
+            retryable = isinstance(error, requests.exceptions.RequestException)
+        else:
+            retryable = response.status_code in call.retryable_codes
+        if not retryable:
+            return None
+        delay = min(call.retry_delay * (2 ** call.retry_count), call.inline_max_delay)
+        call.retry_count += 1
+        return delay
+
+    def _settle(self, call: PreparedCall, outcome) -> PreparedCall:
+        """根据请求结果标记是否需要重试，成功的响应写入缓存"""
+        call.response, call.error = outcome
+        if call.error is not None:
+            if isinstance(call.error, NOT_SENT_ERRORS + (requests.exceptions.RequestException,)):
+                call.retry_due = call.can_retry()
+            return call
+        if call.response.status_code in call.retryable_codes:
+            call.retry_due = call.can_retry()
+            return call
+        if call.cache is not None and not call.coalesced:
+            call.cache.store(call.cache_key, call.response, call.cache_ttl)
+        return call
+
+    def send_all(self, calls: List[PreparedCall], max_workers: Optional[int] = None) -> List[PreparedCall]:
+        """
+        并发发送多个已准备好的调用；max_workers 为 1 时串行执行
+
+        开启了 batch_config 的操作按批量接口合并后发送。EXTERNAL_TOOL_ENGINE=asyncio
+        时改由 AsyncToolEngine 在单个事件循环中发送。
+        """
+        if len(calls) > 1 and current_app.config.get('EXTERNAL_TOOL_ENGINE', 'threads') == 'asyncio':
+            from app.core.async_executor import AsyncToolEngine
+
+            AsyncToolEngine.from_config(self).send_all(calls)
+            return calls
+        if max_workers is None:
+            max_workers = current_app.config.get('EXTERNAL_TOOL_MAX_WORKERS', 8)
+        batches, singles = group_calls(calls)
+        units = batches + singles
+        if len(units) <= 1 or max_workers <= 1:
+            for unit in units:
+                self._send_unit(unit)
+            return calls
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(units))) as pool:
+            list(pool.map(self._send_unit, units))
+        return calls
+
+    def complete(self, call: PreparedCall) -> Dict[str, Any]:
+        """写回响应、校验结果与输出映射；send 阶段的异常在此重新抛出"""
+        try:
+            return self._complete(call)
+        finally:
+            if call.log_writer is not None and inspect(call.execution).transient:
+                call.log_writer.submit(call.execution)
+
+    def _complete(self, call: PreparedCall) -> Dict[str, Any]:
+        operation = call.operation
+        execution = call.execution
+        execution.retry_count = call.retry_count
+        execution.cache_hit = call.cache_hit
+        if call.retry_due:
+            return self._schedule_retry(call)
+        
+        if isinstance(call.error, NOT_SENT_ERRORS):
+            # 熔断或限流：请求未发出，按服务不可用处理
+            self._finish(execution, "failed", str(call.error))
+            return self._service_error_result(operation, execution)
+        
+        try:
+            if call.error is not None:
+                raise call.error
+            response = call.response
             
             # 记录响应
             execution.response_status = response.status_code
+            execution.response_ms = call.response_ms
             execution.response_headers = dict(response.headers)
             
             try:
@@ -108,29 +481,8 @@ class ExternalToolExecutor:
             
             # 检查 HTTP 状态码
             if response.status_code >= 400:
-                execution.status = "failed"
-                execution.error_message = f"HTTP {response.status_code}: {response.text[:500]}"
-                execution.completed_at = datetime.utcnow()
-                self.db.commit()
-                
-                # 对于验证类工具，区分服务错误和验证失败
-                if operation.tool_type == 'validation':
-                    validation_config = operation.validation_config or {}
-                    block_on_service_error = validation_config.get('block_on_service_error', False)
-                    
-                    return {
-                        'status': 'service_error',
-                        'error': execution.error_message,
-                        'execution_id': execution.id,
-                        'block_transition': block_on_service_error,
-                        'error_type': 'service_unavailable',
-                    }
-                
-                return {
-                    'status': 'failed',
-                    'error': execution.error_message,
-                    'execution_id': execution.id,
-                }
+                self._finish(execution, "failed", f"HTTP {response.status_code}: {response.text[:500]}")
+                return self._service_error_result(operation, execution)
             
             # 对于验证类工具，检查验证结果
             if operation.tool_type == 'validation':
@@ -143,10 +495,7 @@ class ExternalToolExecutor:
                     validation_config = operation.validation_config or {}
                     block_on_failure = validation_config.get('block_on_failure', True)
                     
-                    execution.status = "validation_failed"
-                    execution.error_message = validation_result['error_message']
-                    execution.completed_at = datetime.utcnow()
-                    self.db.commit()
+                    self._finish(execution, "validation_failed", validation_result['error_message'])
                     
                     return {
                         'status': 'validation_failed',
@@ -159,12 +508,10 @@ class ExternalToolExecutor:
             
             # 映射输出到 context
             mapped_output = self._map_output(
-                operation.output_mapping, response_body, proposal, context
+                operation, response_body, call.proposal, call.context, call.proposal_data
             )
             
-            execution.status = "success"
-            execution.completed_at = datetime.utcnow()
-            self.db.commit()
+            self._finish(execution, "success")
             
             return {
                 'status': 'success',
@@ -174,77 +521,92 @@ class ExternalToolExecutor:
             }
             
         except Exception as e:
-            execution.status = "failed"
-            execution.error_message = str(e)
-            execution.completed_at = datetime.utcnow()
-            self.db.commit()
+            self._finish(execution, "failed", str(e))
             raise
+
+    def _service_error_result(self, operation: ExternalToolOperation, execution: ExternalToolExecution) -> Dict[str, Any]:
+        # 对于验证类工具，区分服务错误和验证失败
+        if operation.tool_type == 'validation':
+            validation_config = operation.validation_config or {}
+            block_on_service_error = validation_config.get('block_on_service_error', False)
+            
+            return {
+                'status': 'service_error',
+                'error': execution.error_message,
+                'execution_id': execution.id,
+                'block_transition': block_on_service_error,
+                'error_type': 'service_unavailable',
+            }
+        
+        return {
+            'status': 'failed',
+            'error': execution.error_message,
+            'execution_id': execution.id,
+        }
+
+    def _log_writer(self, operation: ExternalToolOperation, triggered_by: str):
+        """缓冲写入日志的写入器；转换中的验证工具必须在转换提交前落库，始终同步写入"""
+        writer = get_log_writer()
+        if writer is not None and triggered_by == "workflow_transition" and operation.tool_type == 'validation':
+            return None
+        return writer
+
+    def _finish(self, execution: ExternalToolExecution, status: str, error_message: Optional[str] = None) -> None:
+        execution.status = status
+        if error_message is not None:
+            execution.error_message = error_message
+        execution.completed_at = datetime.utcnow()
+        if inspect(execution).transient:
+            return
+        store_execution_bodies(self.db, [execution])
+        if self.autocommit:
+            self.db.commit()
+        else:
+            self.db.flush()
     
     def _build_request_params(
         self,
         operation: ExternalToolOperation,
         proposal: Optional[Proposal],
         context: Dict[str, Any],
+        state_name: Optional[str] = None,
+        proposal_data: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        """根据 input_mapping 构建请求参数"""
+        """根据 input_mapping（预编译的取值函数）构建请求参数"""
         tool = operation.tool
-        input_mapping = operation.input_mapping or {}
+        mappings = compiled_mappings(operation)
         
-        # 构建数据源
+        # 构建数据源：只序列化映射实际引用到的 proposal 字段
         data_source = {
             'context': context,
         }
         if proposal:
-            data_source['proposal'] = {
-                'id': proposal.id,
-                'title': proposal.title,
-                'abstract': proposal.abstract,
-                'status': proposal.current_state.name if proposal.current_state else None,
-                'data': proposal.data or {},
-                'author': {
-                    'id': proposal.author.id,
-                    'username': proposal.author.username,
-                    'email': proposal.author.email,
-                } if proposal.author else None,
-                'phases': [
-                    {
-                        'phase': p.phase,
-                        'status': p.status,
-                        'payload': p.payload,
-                    }
-                    for p in proposal.phases
-                ],
-                'instruments': [
-                    {
-                        'code': pi.instrument.code,
-                        'status': pi.status,
-                        'form_data': pi.form_data,
-                        'scheduling_feedback': pi.scheduling_feedback,
-                    }
-                    for pi in proposal.instruments
-                ],
-            }
+            data_source['proposal'] = self._proposal_source(
+                proposal, mappings.proposal_fields, state_name
+            )
+            if proposal_data and 'data' in data_source['proposal']:
+                data_source['proposal']['data'] = {**data_source['proposal']['data'], **proposal_data}
         
         # 构建 URL
         url = tool.base_url + operation.path
         
         # 应用路径参数映射
         path_params = {}
-        for param_name, mapping in input_mapping.get('path', {}).items():
-            path_params[param_name] = self._resolve_mapping(mapping, data_source)
+        for param_name, resolve in mappings.path:
+            path_params[param_name] = resolve(data_source)
             url = url.replace(f'{{{param_name}}}', str(path_params[param_name]))
         
         # 应用查询参数映射
         query_params = {}
-        for param_name, mapping in input_mapping.get('query', {}).items():
-            value = self._resolve_mapping(mapping, data_source)
+        for param_name, resolve in mappings.query:
+            value = resolve(data_source)
             if value is not None:
                 query_params[param_name] = value
         
         # 应用请求体映射
         body = {}
-        for field_name, mapping in input_mapping.get('body', {}).items():
-            body[field_name] = self._resolve_mapping(mapping, data_source)
+        for field_name, resolve in mappings.body:
+            body[field_name] = resolve(data_source)
         
         # 构建请求头
         headers = {'Content-Type': 'application/json'}
@@ -265,8 +627,8 @@ class ExternalToolExecutor:
             headers['Authorization'] = f'Basic {credentials}'
         
         # 自定义请求头
-        for header_name, mapping in input_mapping.get('headers', {}).items():
-            headers[header_name] = self._resolve_mapping(mapping, data_source)
+        for header_name, resolve in mappings.headers:
+            headers[header_name] = resolve(data_source)
         
         return {
             'url': url,
@@ -276,127 +638,99 @@ class ExternalToolExecutor:
             'body': body,
         }
     
-    def _resolve_mapping(self, mapping, data_source: Dict[str, Any]) -> Any:
+    def _proposal_source(
+        self,
+        proposal: Proposal,
+        fields: Optional[FrozenSet[str]] = None,
+        state_name: Optional[str] = None,
+    ) -> Dict[str, Any]:
         """
-        解析映射配置，从数据源获取值
-        
-        映射格式示例：
-        - "proposal.id" -> data_source['proposal']['id']
-        - "proposal.data.field_name" -> data_source['proposal']['data']['field_name']
-        - "context.some_key" -> data_source['context']['some_key']
-        - {"literal": "fixed_value"} -> "fixed_value"
-        - {"template": "Proposal #{proposal.id}"} -> "Proposal #123"
+        构建数据源中的 proposal 部分
+
+        fields 为映射引用到的顶层字段，只加载这些字段（作者、阶段、仪器各需
+        额外查询，payload 也可能很大）；None 表示全部字段。
         """
-        if isinstance(mapping, dict):
-            if 'literal' in mapping:
-                return mapping['literal']
-            if 'template' in mapping:
-                template = mapping['template']
-                # 简单模板替换
-                import re
-                def replace_var(match):
-                    var_path = match.group(1)
-                    return str(self._get_nested_value(data_source, var_path.split('.')))
-                return re.sub(r'\{([^}]+)\}', replace_var, template)
-        
-        if isinstance(mapping, str):
-            return self._get_nested_value(data_source, mapping.split('.'))
-        
-        return mapping
+        if fields is None:
+            fields = PROPOSAL_SOURCE_FIELDS
+        source = {}
+        for field in fields:
+            build = _PROPOSAL_SOURCE_BUILDERS.get(field)
+            if build is not None:
+                source[field] = build(proposal, state_name)
+        return source
     
-    def _get_nested_value(self, data: Dict, keys: list) -> Any:
-        """从嵌套字典中获取值"""
-        current = data
-        for key in keys:
-            if isinstance(current, dict):
-                current = current.get(key)
-            elif hasattr(current, key):
-                current = getattr(current, key)
-            else:
-                return None
-            if current is None:
-                return None
-        return current
-    
-    def _execute_with_retry(
-        self,
-        request_params: Dict[str, Any],
-        timeout: int,
-        max_retries: int,
-        retry_delay: int,
-        retryable_codes: list,
-        execution: ExternalToolExecution,
-    ):
-        """带重试机制的请求执行"""
-        last_exception = None
-        
-        for attempt in range(max_retries + 1):
-            try:
-                response = requests.request(
-                    method=request_params['method'],
-                    url=request_params['url'],
-                    headers=request_params['headers'],
-                    params=request_params.get('params'),
-                    json=request_params.get('body') if request_params.get('body') else None,
-                    timeout=timeout,
-                )
-                
-                # 如果状态码不在可重试列表中，直接返回
-                if response.status_code not in retryable_codes:
-                    return response
-                
-                # 如果是最后一次尝试，返回结果
-                if attempt == max_retries:
-                    return response
-                
-                # 记录重试
-                execution.retry_count = attempt + 1
-                execution.status = "retrying"
-                self.db.commit()
-                
-                # 等待后重试
-                time.sleep(retry_delay * (2 ** attempt))  # 指数退避
-                
-            except requests.exceptions.RequestException as e:
-                last_exception = e
-                if attempt == max_retries:
-                    raise
-                
-                execution.retry_count = attempt + 1
-                execution.status = "retrying"
-                self.db.commit()
-                time.sleep(retry_delay * (2 ** attempt))
-        
-        if last_exception:
-            raise last_exception
+    def _send_request(self, call: PreparedCall):
+        """发出一次请求；重试由 complete 阶段调度到任务队列（阻止型验证工具见 _attempt_inline）"""
+        request_params = call.request_params
+        return call.session.request(
+            method=request_params['method'],
+            url=request_params['url'],
+            headers=request_params['headers'],
+            params=request_params.get('params'),
+            json=request_params.get('body') if request_params.get('body') else None,
+            timeout=call.timeout,
+        )
+
+    def _schedule_retry(self, call: PreparedCall) -> Dict[str, Any]:
+        """
+        把可重试的失败记为 retrying，并按带抖动的指数退避安排任务队列重新执行
+
+        返回 pending 结果，调用方无需等待。
+        """
+        execution = call.execution
+        if call.error is not None:
+            execution.error_message = str(call.error)
+        else:
+            response = call.response
+            execution.response_status = response.status_code
+            execution.error_message = f"HTTP {response.status_code}: {response.text[:500]}"
+        if inspect(execution).transient:
+            # 重试任务引用执行记录，缓冲模式下此时改为同步写入
+            self.db.add(execution)
+        delay = call.retry_delay * (2 ** call.retry_count) * random.uniform(0.5, 1.5)
+        execution.retry_count = call.retry_count + 1
+        execution.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        execution.status = "retrying"
+        job = schedule_retry(execution, call.context, execution.next_attempt_at, session=self.db)
+        if self.autocommit:
+            self.db.commit()
+        else:
+            self.db.flush()
+        return {
+            'status': 'pending',
+            'error': execution.error_message,
+            'execution_id': execution.id,
+            'job_id': job.id,
+            'next_attempt_at': execution.next_attempt_at.isoformat(),
+        }
     
     def _map_output(
         self,
-        output_mapping: Dict[str, Any],
+        operation: ExternalToolOperation,
         response_body: Any,
         proposal: Optional[Proposal],
         context: Dict[str, Any],
+        proposal_data: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
-        """将响应映射回 proposal/context"""
-        if not output_mapping:
-            return {}
-        
+        """将响应映射回 proposal/context；给出 proposal_data 时 proposal 部分写入其中"""
+        mappings = compiled_mappings(operation)
         result = {}
         
         # 映射到 context
-        for target_key, source_path in output_mapping.get('to_context', {}).items():
-            if isinstance(source_path, str):
-                value = self._get_nested_value({'response': response_body}, source_path.split('.'))
-                result[target_key] = value
-                context[target_key] = value
+        for target_key, get in mappings.to_context:
+            value = get(response_body)
+            result[target_key] = value
+            context[target_key] = value
         
-        # 映射到 proposal.data
-        if proposal and 'to_proposal_data' in output_mapping:
-            proposal_data = proposal.data or {}
-            for target_key, source_path in output_mapping['to_proposal_data'].items():
-                if isinstance(source_path, str):
-                    value = self._get_nested_value({'response': response_body}, source_path.split('.'))
-                    proposal_data[target_key] = value
+        # 暂不写回提案时由调用方在应用转换时写入
+        if proposal and mappings.to_proposal_data is not None and proposal_data is not None:
+            for target_key, get in mappings.to_proposal_data:
+                proposal_data[target_key] = get(response_body)
+        # 映射到 proposal.data（复制后整体赋值，JSON 列才能检测到变更）
+        elif proposal and mappings.to_proposal_data is not None:
+            proposal_data = dict(proposal.data or {})
+            for target_key, get in mappings.to_proposal_data:
+                proposal_data[target_key] = get(response_body)
             proposal.data = proposal_data
         
         return result
@@ -416,12 +750,10 @@ class ExternalToolExecutor:
                 'error_message': str (if not valid)
             }
         """
-        validation_config = operation.validation_config or {}
-        failure_conditions = validation_config.get('failure_conditions', [])
-        error_template = validation_config.get('error_message_template', 'Validation failed')
+        mappings = compiled_mappings(operation)
         
         # 如果没有配置失败条件，默认检查 HTTP 状态码
-        if not failure_conditions:
+        if not mappings.failure_conditions:
             if status_code >= 200 and status_code < 300:
                 return {'valid': True}
             else:
@@ -430,67 +762,16 @@ class ExternalToolExecutor:
                     'error_message': f'Validation service returned status {status_code}'
                 }
         
-        # 检查每个失败条件
-        for condition in failure_conditions:
-            path = condition.get('path', '')
-            operator = condition.get('operator', '==')
-            expected_value = condition.get('value')
-            
-            # 从响应中获取值
-            actual_value = self._get_nested_value({'response': response_body}, path.split('.'))
-            
-            # 评估条件
-            condition_met = False
-            if operator == '==':
-                condition_met = actual_value == expected_value
-            elif operator == '!=':
-                condition_met = actual_value != expected_value
-            elif operator == '>':
-                condition_met = actual_value > expected_value
-            elif operator == '<':
-                condition_met = actual_value < expected_value
-            elif operator == 'in':
-                condition_met = actual_value in expected_value
-            elif operator == 'not_in':
-                condition_met = actual_value not in expected_value
-            
-            # 如果条件满足，说明验证失败
-            if condition_met:
-                # 生成错误消息
-                error_message = self._format_error_message(
-                    error_template, response_body, path, actual_value
-                )
-                return {
-                    'valid': False,
-                    'error_message': error_message
-                }
+        # 检查每个失败条件，命中即验证失败
+        error_message = mappings.validation_error(response_body)
+        if error_message is not None:
+            return {
+                'valid': False,
+                'error_message': error_message
+            }
         
         return {'valid': True}
     
-    def _format_error_message(
-        self,
-        template: str,
-        response_body: Any,
-        failed_path: str,
-        failed_value: Any
-    ) -> str:
-        """格式化错误消息，支持模板变量"""
-        import re
-        
-        # 替换 {response.xxx} 格式的变量
-        def replace_var(match):
-            var_path = match.group(1)
-            value = self._get_nested_value({'response': response_body}, var_path.split('.'))
-            return str(value) if value is not None else 'N/A'
-        
-        message = re.sub(r'\{([^}]+)\}', replace_var, template)
-        
-        # 如果没有替换任何变量，添加默认信息
-        if message == template:
-            message = f"Validation failed: {failed_path} = {failed_value}"
-        
-        return message
-    
     def _sanitize_headers(self, headers: Dict[str, str]) -> Dict[str, str]:
         """脱敏请求头（隐藏认证信息）"""
         sanitized = {}
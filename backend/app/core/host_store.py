@@ -0,0 +1,79 @@
+"""
+Host-local shared state
+同一台机器上多个 worker 进程共享的小型状态库（SQLite 文件，WAL 模式）
+用于响应缓存、熔断器等需要跨进程可见但不值得引入外部服务的状态
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from flask import current_app
+
+
+class HostStore:
+    """
+    基于 SQLite 文件的本机共享存储
+
+    每个线程持有自己的连接；transaction() 以 BEGIN IMMEDIATE 开启写事务，
+    同一时刻只有一个进程能写，适合做原子的读-改-写。
+    """
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schemas = set()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def ensure_schema(self, name: str, ddl: str) -> None:
+        """首次使用时执行建表语句（每个进程每个 name 只执行一次）"""
+        if name in self._schemas:
+            return
+        with self._schema_lock:
+            if name in self._schemas:
+                return
+            self._connection().executescript(ddl)
+            self._schemas.add(name)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+
+    def execute(self, sql: str, params=()):
+        return self._connection().execute(sql, params)
+
+
+_stores: Dict[str, HostStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_host_store(path: str = None) -> HostStore:
+    """按路径复用 HostStore；缺省路径取自 HOST_STATE_PATH 配置"""
+    path = path or current_app.config["HOST_STATE_PATH"]
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = HostStore(path)
+    return store
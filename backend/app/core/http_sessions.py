@@ -0,0 +1,89 @@
+"""
+HTTP session registry
+按 ExternalTool.id 复用 requests.Session，保持连接池与 keep-alive
+"""
+import http.cookiejar
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.models.models import ExternalTool
+
+
+DEFAULT_HTTP_CONFIG = {
+    "pool_connections": 4,
+    "pool_maxsize": 16,
+    "pool_block": False,
+    "keep_alive": True,
+}
+
+
+def http_config(tool: ExternalTool) -> Dict[str, Any]:
+    config = dict(DEFAULT_HTTP_CONFIG)
+    config.update((tool.config or {}).get("http") or {})
+    return config
+
+
+def tool_fingerprint(tool: ExternalTool) -> str:
+    """连接相关配置的指纹；变化时需要重建会话（异步引擎的 AsyncClient 同样按此复用）"""
+    return json.dumps(
+        [tool.base_url, tool.auth_type, tool.auth_config or {}, http_config(tool)],
+        sort_keys=True,
+        default=str,
+    )
+
+
+class SessionRegistry:
+    """
+    每个外部工具一个长连接会话
+
+    会话按工具的 base_url、认证配置与 config["http"] 计算指纹，指纹变化时
+    重建；update_tool 也会主动失效。旧会话可能仍被其他线程用于进行中的请求，
+    因此只丢弃引用、不主动关闭，由垃圾回收释放连接。send 阶段在线程池中并发
+    使用同一会话，连接池大小由 pool_maxsize 控制。会话不保存 Cookie，上游的
+    Set-Cookie 不会带到其他用户或提案的调用中。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[int, Tuple[str, requests.Session]] = {}
+
+    def get(self, tool: ExternalTool) -> requests.Session:
+        fingerprint = tool_fingerprint(tool)
+        with self._lock:
+            cached = self._sessions.get(tool.id)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+            session = self._build(tool)
+            self._sessions[tool.id] = (fingerprint, session)
+        return session
+
+    def invalidate(self, tool_id: Optional[int] = None) -> None:
+        with self._lock:
+            if tool_id is None:
+                self._sessions.clear()
+            else:
+                self._sessions.pop(tool_id, None)
+
+    def _build(self, tool: ExternalTool) -> requests.Session:
+        config = http_config(tool)
+        adapter = HTTPAdapter(
+            pool_connections=int(config["pool_connections"]),
+            pool_maxsize=int(config["pool_maxsize"]),
+            pool_block=bool(config["pool_block"]),
+            max_retries=0,  # 重试由执行器按 retry_config 处理
+        )
+        session = requests.Session()
+        # 拒绝所有 Cookie，与原先每次独立的 requests.request 行为一致
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if not config["keep_alive"]:
+            session.headers["Connection"] = "close"
+        return session
+
+
+http_sessions = SessionRegistry()
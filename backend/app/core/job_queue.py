@@ -0,0 +1,393 @@
+"""
+External tool job queue
+基于数据库表的异步任务队列：入队、认领（租约）、执行与本机 worker 池
+无需 Celery / Redis 等外部代理
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from flask import current_app
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db
+from app.core.tool_batching import batch_config, window_run_after
+from app.models.models import ExternalToolExecution, ExternalToolJob, ExternalToolOperation, Proposal, User
+
+logger = logging.getLogger(__name__)
+
+# 基础设施错误（数据库连接、死锁等）：任务在 JOB_MAX_ATTEMPTS 内放回队列；
+# 外部服务的失败由执行器按操作的 retry_config 重试，任务队列不再叠加重试
+INFRASTRUCTURE_ERRORS = (SQLAlchemyError,)
+
+
+def enqueue_tool_execution(
+    operation,
+    proposal=None,
+    context: Optional[Dict[str, Any]] = None,
+    actor=None,
+    triggered_by: str = "manual",
+    run_after: Optional[datetime] = None,
+    max_attempts: Optional[int] = None,
+    session=None,
+) -> ExternalToolJob:
+    """
+    创建 queued 状态的执行日志与对应任务
+
+    只 flush 不提交：任务随调用方事务一起提交，转换回滚时任务也不会残留。
+    """
+    session = session or db.session
+    execution = ExternalToolExecution(
+        operation_id=operation.id,
+        proposal_id=proposal.id if proposal else None,
+        triggered_by=triggered_by,
+        actor_id=actor.id if actor else None,
+        status="queued",
+    )
+    job = ExternalToolJob(
+        execution=execution,
+        operation_id=operation.id,
+        proposal_id=proposal.id if proposal else None,
+        actor_id=actor.id if actor else None,
+        triggered_by=triggered_by,
+        context=dict(context or {}),
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts or current_app.config.get("JOB_MAX_ATTEMPTS", 3),
+        run_after=run_after or _batch_run_after(operation) or datetime.utcnow(),
+    )
+    session.add_all([execution, job])
+    session.flush()
+    return job
+
+
+def _batch_run_after(operation) -> Optional[datetime]:
+    # 批量操作对齐到窗口边界，同一窗口内入队的任务会被一起认领、合并发送
+    config = batch_config(operation)
+    return window_run_after(config) if config else None
+
+
+def schedule_retry(
+    execution: ExternalToolExecution,
+    context: Optional[Dict[str, Any]],
+    run_after: datetime,
+    session=None,
+) -> ExternalToolJob:
+    """
+    安排一次已有执行记录的重试
+
+    执行记录已有任务（在 worker 中运行）时把该任务放回队列，否则新建任务。
+    与 enqueue_tool_execution 一样只 flush。
+    """
+    session = session or db.session
+    job = execution.job
+    if job is None:
+        job = ExternalToolJob(
+            execution=execution,
+            operation_id=execution.operation_id,
+            proposal_id=execution.proposal_id,
+            actor_id=execution.actor_id,
+            triggered_by=execution.triggered_by,
+            context=dict(context or {}),
+            attempts=0,
+            max_attempts=current_app.config.get("JOB_MAX_ATTEMPTS", 3),
+        )
+        session.add(job)
+    job.status = "queued"
+    job.run_after = run_after
+    job.lease_owner = None
+    job.lease_expires_at = None
+    session.flush()
+    return job
+
+
+def _claimable(now: datetime):
+    return or_(
+        and_(ExternalToolJob.status == "queued", ExternalToolJob.run_after <= now),
+        and_(ExternalToolJob.status == "running", ExternalToolJob.lease_expires_at < now),
+    )
+
+
+def claim_jobs(
+    worker_id: str,
+    limit: int = 1,
+    lease_seconds: Optional[int] = None,
+    session=None,
+    operation_id: Optional[int] = None,
+) -> List[int]:
+    """
+    认领最多 limit 个到期任务（可限定为某个操作的任务）
+
+    每个任务用带条件的 UPDATE 抢占，只有一个 worker 能成功；租约过期的
+    running 任务（worker 崩溃）会被重新认领。
+    """
+    session = session or db.session
+    if lease_seconds is None:
+        lease_seconds = current_app.config.get("JOB_LEASE_SECONDS", 300)
+    now = datetime.utcnow()
+    query = session.query(ExternalToolJob.id).filter(_claimable(now))
+    if operation_id is not None:
+        query = query.filter(ExternalToolJob.operation_id == operation_id)
+    candidates = [
+        row.id
+        for row in query
+        .order_by(ExternalToolJob.run_after, ExternalToolJob.id)
+        .limit(limit * 4)
+        .all()
+    ]
+    claimed: List[int] = []
+    for job_id in candidates:
+        if len(claimed) >= limit:
+            break
+        updated = (
+            session.query(ExternalToolJob)
+            .filter(ExternalToolJob.id == job_id, _claimable(now))
+            .update(
+                {
+                    ExternalToolJob.status: "running",
+                    ExternalToolJob.lease_owner: worker_id,
+                    ExternalToolJob.lease_expires_at: now + timedelta(seconds=lease_seconds),
+                    ExternalToolJob.attempts: ExternalToolJob.attempts + 1,
+                    ExternalToolJob.updated_at: now,
+                },
+                synchronize_session=False,
+            )
+        )
+        if updated:
+            claimed.append(job_id)
+    session.commit()
+    return claimed
+
+
+def claim_batch_siblings(worker_id: str, job_ids: List[int], session=None) -> List[int]:
+    """
+    为已认领的批量操作任务补认领同一操作的其他到期任务（每个操作凑满 max_size）
+
+    这些任务在 run_jobs 中与已认领的任务一起发送，合并为尽量少的上游请求。
+    """
+    session = session or db.session
+    if not job_ids:
+        return []
+    claimed_by_operation: Dict[int, int] = {}
+    for job in session.query(ExternalToolJob).filter(ExternalToolJob.id.in_(job_ids)):
+        claimed_by_operation[job.operation_id] = claimed_by_operation.get(job.operation_id, 0) + 1
+    siblings: List[int] = []
+    for operation_id, count in claimed_by_operation.items():
+        config = batch_config(session.get(ExternalToolOperation, operation_id))
+        if config is None or count >= config["max_size"]:
+            continue
+        siblings.extend(
+            claim_jobs(worker_id, limit=config["max_size"] - count, session=session, operation_id=operation_id)
+        )
+    return siblings
+
+
+def run_job(job_id: int, worker_id: str, session=None) -> Optional[Dict[str, Any]]:
+    """
+    执行一个已认领的任务；返回执行器结果，任务失败时返回 None
+
+    外部服务返回可重试的错误时执行器会重新安排本任务（结果为 pending）。
+    """
+    return run_jobs([job_id], worker_id, session=session).get(job_id)
+
+
+def run_jobs(job_ids: List[int], worker_id: str, session=None) -> Dict[int, Optional[Dict[str, Any]]]:
+    """
+    执行一批已认领的任务，返回 {job_id: 执行器结果或 None}
+
+    先逐个 prepare 并提交，再通过 ExternalToolExecutor.send_all 一起发送
+    （EXTERNAL_TOOL_ENGINE=asyncio 时在单个事件循环中并发），最后逐个 complete。
+    complete 与任务状态在同一事务中提交，且只在本 worker 仍持有认领时的租约时提交：
+    租约过期后被其他 worker 重新认领的任务由新的持有者完成。
+    """
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    session = session or db.session
+    executor = ExternalToolExecutor(session, autocommit=False)
+    results: Dict[int, Optional[Dict[str, Any]]] = {}
+    prepared = []
+    leases: Dict[int, int] = {}
+    for job_id in job_ids:
+        results[job_id] = None
+        job = session.get(ExternalToolJob, job_id)
+        if job is None or job.status != "running" or job.lease_owner != worker_id:
+            continue
+        leases[job_id] = job.attempts
+        proposal = session.get(Proposal, job.proposal_id) if job.proposal_id else None
+        actor = session.get(User, job.actor_id) if job.actor_id else None
+        try:
+            call = executor.prepare(
+                operation_id=job.operation_id,
+                proposal=proposal,
+                context=dict(job.context or {}),
+                actor=actor,
+                triggered_by=job.triggered_by,
+                execution=job.execution,
+            )
+            session.commit()
+        except Exception as exc:
+            session.rollback()
+            _fail_or_requeue(session, job_id, exc, worker_id, leases[job_id])
+            continue
+        prepared.append((job_id, call))
+
+    executor.send_all([call for _, call in prepared])
+
+    for job_id, call in prepared:
+        if not _hold_lease(session, job_id, worker_id, leases[job_id]):
+            session.rollback()
+            logger.warning("External tool job %s lease lost before completion; result discarded", job_id)
+            continue
+        try:
+            result = executor.complete(call)
+        except Exception as exc:
+            session.rollback()
+            _fail_or_requeue(session, job_id, exc, worker_id, leases[job_id])
+            continue
+        job = session.get(ExternalToolJob, job_id)
+        if result.get("status") != "pending":
+            # pending 为可重试的失败：执行器已把任务放回队列
+            job.status = "done"
+            job.lease_owner = None
+            job.lease_expires_at = None
+        session.commit()
+        results[job_id] = result
+    return results
+
+
+def _hold_lease(session, job_id: int, worker_id: str, attempts: int) -> bool:
+    """
+    确认任务仍由本 worker 以认领时的那次尝试持有，并锁定任务行直到事务结束
+
+    带条件的 UPDATE 没有匹配行时说明租约已被其他 worker 重新认领（认领会更换
+    lease_owner 并增加 attempts），调用方应放弃本次结果。
+    """
+    updated = (
+        session.query(ExternalToolJob)
+        .filter(
+            ExternalToolJob.id == job_id,
+            ExternalToolJob.status == "running",
+            ExternalToolJob.lease_owner == worker_id,
+            ExternalToolJob.attempts == attempts,
+        )
+        .update({ExternalToolJob.updated_at: datetime.utcnow()}, synchronize_session=False)
+    )
+    return bool(updated)
+
+
+def _fail_or_requeue(session, job_id: int, exc: Exception, worker_id: str, attempts: int) -> None:
+    """
+    处理 prepare / complete 抛出的异常
+
+    执行器已结束的执行记录（如 retry_config.max_retries 用尽后的 failed）保持原样，任务标记为
+    failed；尚未结束的执行只有遇到基础设施错误才放回队列，其余错误连同执行记录一起标记为 failed。
+    租约已被其他 worker 重新认领时不做任何修改。
+    """
+    if not _hold_lease(session, job_id, worker_id, attempts):
+        session.rollback()
+        logger.warning("External tool job %s lease lost; failure not recorded: %s", job_id, exc)
+        return
+    job = session.get(ExternalToolJob, job_id)
+    execution = job.execution
+    finished = execution is not None and execution.completed_at is not None
+    job.last_error = str(exc)
+    job.lease_owner = None
+    job.lease_expires_at = None
+    if not finished and isinstance(exc, INFRASTRUCTURE_ERRORS) and job.attempts < job.max_attempts:
+        delay = current_app.config.get("JOB_RETRY_DELAY", 30) * (2 ** (job.attempts - 1))
+        job.status = "queued"
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        if execution is not None:
+            execution.status = "queued"
+    else:
+        job.status = "failed"
+        if execution is not None and not finished:
+            execution.status = "failed"
+            execution.error_message = str(exc)
+            execution.completed_at = datetime.utcnow()
+    session.commit()
+    logger.warning("External tool job %s failed (attempt %s): %s", job_id, job.attempts, exc)
+
+
+class JobWorker:
+    """
+    本机 worker 池
+
+    每个线程持有独立的应用上下文（从而有独立的数据库会话），循环认领并执行
+    任务；没有任务时按 poll_interval 休眠。EXTERNAL_TOOL_ENGINE=asyncio 时
+    每个线程一次认领 JOB_ASYNC_BATCH 个任务，在该线程长期保留的事件循环中并发发送，
+    各工具的 AsyncClient 在批次之间复用。
+    """
+
+    def __init__(self, app, concurrency: Optional[int] = None, poll_interval: Optional[float] = None):
+        self.app = app
+        self.concurrency = concurrency or app.config.get("JOB_WORKER_CONCURRENCY", 4)
+        self.poll_interval = poll_interval or app.config.get("JOB_POLL_INTERVAL", 1.0)
+        if app.config.get("EXTERNAL_TOOL_ENGINE", "threads") == "asyncio":
+            self.batch_size = app.config.get("JOB_ASYNC_BATCH", 200)
+        else:
+            self.batch_size = 1
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def run_once(self, limit: int = 10) -> int:
+        """认领并在当前线程执行一批任务，返回处理数量（当前线程保留异步引擎的客户端，stop 时关闭）"""
+        from app.core.async_executor import retain_async_clients
+
+        retain_async_clients()
+        with self.app.app_context():
+            job_ids = claim_jobs(self.worker_id, limit=limit)
+            job_ids += claim_batch_siblings(self.worker_id, job_ids)
+            if job_ids:
+                run_jobs(job_ids, self.worker_id)
+            db.session.remove()
+        return len(job_ids)
+
+    def start(self) -> None:
+        for index in range(self.concurrency):
+            thread = threading.Thread(
+                target=self._loop, name=f"tool-worker-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        from app.core.async_executor import close_async_clients
+
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        # run_once 在调用线程中使用过异步引擎时，关闭该线程保留的客户端
+        close_async_clients()
+
+    def run_forever(self) -> None:
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _loop(self) -> None:
+        from app.core.async_executor import close_async_clients
+
+        try:
+            while not self._stop.is_set():
+                try:
+                    processed = self.run_once(limit=self.batch_size)
+                except Exception:
+                    logger.exception("Tool worker loop error")
+                    processed = 0
+                if not processed:
+                    self._stop.wait(self.poll_interval)
+        finally:
+            # 异步引擎的 AsyncClient 在本线程的批次之间复用，线程退出时关闭
+            close_async_clients()
@@ -0,0 +1,182 @@
+"""
+Proposal aggregate counters
+仪表盘按工作流状态、提案类型、仪器与阶段状态的计数（ProposalCounter）
+
+计数由 ProposalSummary 推导：refresh_summary 比较读模型行更新前后对应的计数键，在同一事务中
+对差值做原子增减（UPDATE count = count + delta）；批量转换把一块内所有提案的差值合并后按键序
+一次写入，并发的批量事务以相同顺序加锁。通过 db.session 删除提案（连带读模型行）时减去其计数，
+状态、提案类型或仪器改名时随读模型一起调整（见 app.core.proposal_summary）。绕过这些路径的修改
+（Query.delete / Query.update 等批量语句、其他会话）不会调整计数，之后需运行 reconcile_counters：
+它用 GROUP BY 从提案表重新计算并整体替换，修正可能的漂移（flask reconcile-counters）。
+"""
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, text
+
+from app import db
+from app.models.models import (
+    Instrument,
+    Proposal,
+    ProposalCounter,
+    ProposalInstrument,
+    ProposalPhase,
+    ProposalType,
+    WorkflowState,
+)
+
+
+DIMENSIONS = ("state", "proposal_type", "instrument", "phase_status", "instrument_status")
+
+# 计数键：(season_id, dimension, key)
+CounterKey = Tuple[int, str, str]
+
+
+def summary_keys(summary) -> Counter:
+    """读模型行贡献的计数键；取值为空的项不计数"""
+    season = summary.season_id or 0
+    keys: Counter = Counter()
+    if summary.state_name:
+        keys[(season, "state", summary.state_name)] += 1
+    if summary.proposal_type_name:
+        keys[(season, "proposal_type", summary.proposal_type_name)] += 1
+    for phase in summary.phases or []:
+        if phase.get("phase") and phase.get("status"):
+            keys[(season, "phase_status", f"{phase['phase']}:{phase['status']}")] += 1
+    for entry in summary.instruments or []:
+        code = entry.get("instrument")
+        if not code:
+            continue
+        keys[(season, "instrument", code)] += 1
+        if entry.get("status"):
+            keys[(season, "instrument_status", f"{code}:{entry['status']}")] += 1
+    return keys
+
+
+def add_deltas(deltas: Counter, before: Counter, after: Counter) -> None:
+    """把前后计数键的差值累加到 deltas（可为负），稍后用 apply_deltas(session, Counter(), deltas) 一次写入"""
+    deltas.update(after)
+    deltas.subtract(before)
+
+
+def apply_deltas(session, before: Counter, after: Counter) -> None:
+    """按前后计数键的差值增减计数（不提交）；键按序写入，并发事务的加锁顺序一致"""
+    rows = []
+    for season_id, dimension, key in sorted(set(before) | set(after)):
+        delta = after[(season_id, dimension, key)] - before[(season_id, dimension, key)]
+        if delta:
+            rows.append({"season_id": season_id, "dimension": dimension, "key": key, "count": delta})
+    if not rows:
+        return
+    table = ProposalCounter.__table__
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["season_id", "dimension", "key"],
+            set_={"count": table.c.count + stmt.excluded.count},
+        )
+        session.execute(stmt, rows)
+        return
+    for row in rows:
+        updated = session.execute(
+            table.update()
+            .where(
+                table.c.season_id == row["season_id"],
+                table.c.dimension == row["dimension"],
+                table.c.key == row["key"],
+            )
+            .values(count=table.c.count + row["count"])
+        ).rowcount
+        if not updated:
+            session.execute(table.insert().values(**row))
+
+
+def compute_counters() -> Counter:
+    """用 GROUP BY 从提案表计算全部计数"""
+    season = func.coalesce(ProposalType.season_id, 0)
+    counts: Counter = Counter()
+    for season_id, name, count in (
+        db.session.query(season, WorkflowState.name, func.count(Proposal.id))
+        .join(ProposalType, Proposal.proposal_type_id == ProposalType.id)
+        .join(WorkflowState, Proposal.current_state_id == WorkflowState.id)
+        .group_by(season, WorkflowState.name)
+    ):
+        counts[(season_id, "state", name)] += count
+    for season_id, name, count in (
+        db.session.query(season, ProposalType.name, func.count(Proposal.id))
+        .join(ProposalType, Proposal.proposal_type_id == ProposalType.id)
+        .group_by(season, ProposalType.name)
+    ):
+        counts[(season_id, "proposal_type", name)] += count
+    for season_id, phase, status, count in (
+        db.session.query(season, ProposalPhase.phase, ProposalPhase.status, func.count(ProposalPhase.id))
+        .join(Proposal, ProposalPhase.proposal_id == Proposal.id)
+        .join(ProposalType, Proposal.proposal_type_id == ProposalType.id)
+        .filter(ProposalPhase.status.isnot(None))
+        .group_by(season, ProposalPhase.phase, ProposalPhase.status)
+    ):
+        counts[(season_id, "phase_status", f"{phase}:{status}")] += count
+    for season_id, code, status, count in (
+        db.session.query(season, Instrument.code, ProposalInstrument.status, func.count(ProposalInstrument.id))
+        .join(Instrument, ProposalInstrument.instrument_id == Instrument.id)
+        .join(Proposal, ProposalInstrument.proposal_id == Proposal.id)
+        .join(ProposalType, Proposal.proposal_type_id == ProposalType.id)
+        .group_by(season, Instrument.code, ProposalInstrument.status)
+    ):
+        counts[(season_id, "instrument", code)] += count
+        if status:
+            counts[(season_id, "instrument_status", f"{code}:{status}")] += count
+    return counts
+
+
+def reconcile_counters() -> Dict[CounterKey, Tuple[int, int]]:
+    """
+    重新计算并替换全部计数，返回发生漂移的键 {键: (原计数, 实际计数)}
+
+    PostgreSQL 上先锁定计数表：正在更新计数的事务提交后才开始计算，计算期间的增量不会丢失。
+    """
+    session = db.session
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("LOCK TABLE proposal_counter IN SHARE ROW EXCLUSIVE MODE"))
+    stored = Counter(
+        {(row.season_id, row.dimension, row.key): row.count for row in ProposalCounter.query if row.count}
+    )
+    actual = compute_counters()
+    drift = {key: (stored[key], actual[key]) for key in set(stored) | set(actual) if stored[key] != actual[key]}
+    ProposalCounter.query.delete(synchronize_session=False)
+    if actual:
+        session.execute(
+            ProposalCounter.__table__.insert(),
+            [
+                {"season_id": season_id, "dimension": dimension, "key": key, "count": count}
+                for (season_id, dimension, key), count in sorted(actual.items())
+            ],
+        )
+    session.commit()
+    return drift
+
+
+def aggregates(season_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    各维度的计数；season_id 为空时合计所有季度
+
+    phase_status / instrument_status 按阶段或仪器嵌套：{"phase1": {"submitted": 3}}
+    """
+    query = db.session.query(
+        ProposalCounter.dimension, ProposalCounter.key, func.sum(ProposalCounter.count)
+    ).filter(ProposalCounter.count != 0)
+    if season_id is not None:
+        query = query.filter(ProposalCounter.season_id == season_id)
+    result: Dict[str, Any] = {dimension: {} for dimension in DIMENSIONS}
+    for dimension, key, count in query.group_by(ProposalCounter.dimension, ProposalCounter.key):
+        if dimension in ("phase_status", "instrument_status"):
+            group, _, status = key.partition(":")
+            result[dimension].setdefault(group, {})[status] = int(count)
+        else:
+            result[dimension][key] = int(count)
+    return result
@@ -0,0 +1,193 @@
+"""
+Proposal export
+按 id 分块流式导出提案（含阶段、仪器分配，可选各阶段 payload），输出 NDJSON 或 CSV
+
+每块一次提案查询（键集 id > 上一块末尾）加一次阶段、一次仪器分配查询，产出后即从
+会话中移除，内存占用只与块大小有关，与导出的提案总数无关。API 与 flask export-proposals
+共用同一个生成器。
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from flask import current_app
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models.models import Proposal, ProposalInstrument, ProposalPhase, ProposalType, WorkflowState
+
+
+EXPORT_COLUMNS = (
+    "id",
+    "title",
+    "abstract",
+    "status",
+    "proposal_type",
+    "season_id",
+    "author",
+    "timestamp",
+    "data",
+    "phases",
+    "instruments",
+)
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+
+def filter_proposals(query, state: Optional[str] = None, proposal_type_id: Optional[int] = None,
+                     season_id: Optional[int] = None):
+    """按当前状态名、提案类型与季度（经由提案类型）过滤提案查询"""
+    if state:
+        query = query.join(WorkflowState, Proposal.current_state_id == WorkflowState.id).filter(
+            WorkflowState.name == state
+        )
+    if proposal_type_id:
+        query = query.filter(Proposal.proposal_type_id == proposal_type_id)
+    if season_id:
+        query = query.join(ProposalType, Proposal.proposal_type_id == ProposalType.id).filter(
+            ProposalType.season_id == season_id
+        )
+    return query
+
+
+def resolve_columns(columns: Optional[Sequence[str]]) -> List[str]:
+    """导出的列（缺省为全部）；包含未知列时抛出 ValueError"""
+    if not columns:
+        return list(EXPORT_COLUMNS)
+    unknown = [column for column in columns if column not in EXPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown export column(s): {', '.join(unknown)}")
+    return list(columns)
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _phase_record(phase: ProposalPhase, payloads: bool) -> Dict[str, Any]:
+    record = {
+        "phase": phase.phase,
+        "status": phase.status,
+        "submitted_at": _iso(phase.submitted_at),
+        "confirmed_at": _iso(phase.confirmed_at),
+        "deadline": _iso(phase.deadline),
+    }
+    if payloads:
+        record["payload"] = phase.payload
+    return record
+
+
+def _instrument_record(pi: ProposalInstrument, payloads: bool) -> Dict[str, Any]:
+    record = {
+        "instrument": pi.instrument.code,
+        "phase": pi.phase,
+        "status": pi.status,
+        "confirmed_at": _iso(pi.confirmed_at),
+    }
+    if payloads:
+        record["form_data"] = pi.form_data
+        record["scheduling_feedback"] = pi.scheduling_feedback
+    return record
+
+
+def _proposal_record(proposal: Proposal, phases, instruments, columns: List[str], payloads: bool) -> Dict[str, Any]:
+    values = {
+        "id": lambda: proposal.id,
+        "title": lambda: proposal.title,
+        "abstract": lambda: proposal.abstract,
+        "status": lambda: proposal.current_state.name if proposal.current_state else "N/A",
+        "proposal_type": lambda: proposal.proposal_type.name,
+        "season_id": lambda: proposal.proposal_type.season_id,
+        "author": lambda: proposal.author.username,
+        "timestamp": lambda: _iso(proposal.timestamp),
+        "data": lambda: proposal.data,
+        "phases": lambda: [_phase_record(phase, payloads) for phase in phases],
+        "instruments": lambda: [_instrument_record(pi, payloads) for pi in instruments],
+    }
+    return {column: values[column]() for column in columns}
+
+
+def iter_proposal_records(
+    columns: Optional[Sequence[str]] = None,
+    payloads: bool = False,
+    chunk_size: Optional[int] = None,
+    **filters,
+) -> Iterator[Dict[str, Any]]:
+    """按 id 顺序逐个产出提案记录；filters 同 filter_proposals，chunk_size 限制在 [1, PROPOSAL_EXPORT_CHUNK_SIZE]"""
+    columns = resolve_columns(columns)
+    max_chunk = current_app.config.get("PROPOSAL_EXPORT_CHUNK_SIZE", 500)
+    chunk_size = max(1, min(chunk_size or max_chunk, max_chunk))
+    base = filter_proposals(Proposal.query, **filters).options(
+        joinedload(Proposal.current_state),
+        joinedload(Proposal.proposal_type),
+        joinedload(Proposal.author),
+    )
+    last_id = 0
+    while True:
+        proposals = base.filter(Proposal.id > last_id).order_by(Proposal.id).limit(chunk_size).all()
+        if not proposals:
+            return
+        last_id = proposals[-1].id
+        ids = [proposal.id for proposal in proposals]
+
+        phases = defaultdict(list)
+        instruments = defaultdict(list)
+        if "phases" in columns:
+            for phase in ProposalPhase.query.filter(ProposalPhase.proposal_id.in_(ids)).order_by(ProposalPhase.id):
+                phases[phase.proposal_id].append(phase)
+        if "instruments" in columns:
+            for pi in (
+                ProposalInstrument.query.options(joinedload(ProposalInstrument.instrument))
+                .filter(ProposalInstrument.proposal_id.in_(ids))
+                .order_by(ProposalInstrument.id)
+            ):
+                instruments[pi.proposal_id].append(pi)
+
+        for proposal in proposals:
+            yield _proposal_record(proposal, phases[proposal.id], instruments[proposal.id], columns, payloads)
+
+        # 已产出的对象移出会话，身份映射不随导出增长（状态、类型、仪器等共享对象保留）
+        for obj in proposals + [item for group in phases.values() for item in group] + [
+            item for group in instruments.values() for item in group
+        ]:
+            db.session.expunge(obj)
+        if len(proposals) < chunk_size:
+            return
+
+
+def _csv_cell(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+def iter_export(fmt: str, columns: Optional[Sequence[str]] = None, payloads: bool = False,
+                chunk_size: Optional[int] = None, **filters) -> Iterator[str]:
+    """
+    导出文本流：ndjson 每行一个提案；csv 每行一个提案，嵌套值（阶段、仪器、data）为 JSON 字符串
+
+    列名与格式在产出第一行之前校验，错误以 ValueError 抛出。
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'")
+    columns = resolve_columns(columns)
+    records = iter_proposal_records(columns, payloads=payloads, chunk_size=chunk_size, **filters)
+    if fmt == "ndjson":
+        return (json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+    return _iter_csv(records, columns)
+
+
+def _iter_csv(records: Iterator[Dict[str, Any]], columns: List[str]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for record in records:
+        writer.writerow([_csv_cell(record[column]) for column in columns])
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,255 @@
+"""
+Proposal summary read model
+维护 ProposalSummary：每个提案一行，冗余存储列表视图所需的状态名、类型、季度与各阶段 /
+仪器分配状态
+
+写路径（创建提案、工作流转换、更新阶段、仪器反馈与确认）在提交前调用 refresh_summary，
+读模型与提案在同一事务中更新（仪表盘计数见 app.core.proposal_counters）；
+其他途径（脚本、导入、直接使用 ORM）新建的提案由 db.session 的 flush 事件补写读模型行，
+不会从列表中消失；工作流状态、提案类型（名称与季度）或仪器代码改名时同样由 flush 事件
+更新冗余的名称与计数。这些事件只挂在 db.session 上，worker 等自建的会话不受影响。
+flask rebuild-summaries 按块整体重建。
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.core.proposal_counters import add_deltas, apply_deltas, reconcile_counters, summary_keys
+from app.models.models import (
+    Instrument,
+    Proposal,
+    ProposalInstrument,
+    ProposalPhase,
+    ProposalSummary,
+    ProposalType,
+    WorkflowState,
+)
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _by_id(items: Iterable) -> List:
+    # 尚未 flush 的新对象没有 id，排在最后
+    return sorted(items, key=lambda item: (item.id is None, item.id or 0))
+
+
+def phase_entries(phases: Iterable[ProposalPhase]) -> List[Dict[str, Any]]:
+    return [
+        {"phase": phase.phase, "status": phase.status, "submitted_at": _iso(phase.submitted_at)}
+        for phase in _by_id(phases)
+    ]
+
+
+def instrument_entries(assignments: Iterable[ProposalInstrument]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "instrument": pi.instrument.code,
+            "status": pi.status,
+            "phase": pi.phase,
+            "confirmed_at": _iso(pi.confirmed_at),
+        }
+        for pi in _by_id(assignments)
+    ]
+
+
+def _fill(summary: ProposalSummary, proposal: Proposal, phases, instruments) -> None:
+    state = proposal.current_state
+    proposal_type = proposal.proposal_type
+    summary.user_id = proposal.user_id
+    summary.title = proposal.title
+    summary.abstract = proposal.abstract
+    summary.timestamp = proposal.timestamp
+    summary.state_id = state.id if state else None
+    summary.state_name = state.name if state else None
+    summary.proposal_type_id = proposal.proposal_type_id
+    summary.proposal_type_name = proposal_type.name if proposal_type else None
+    summary.season_id = proposal_type.season_id if proposal_type else None
+    summary.phases = phase_entries(phases)
+    summary.instruments = instrument_entries(instruments)
+    summary.updated_at = datetime.utcnow()
+
+
+def refresh_summary(
+    session,
+    proposal: Proposal,
+    phases: Optional[Iterable[ProposalPhase]] = None,
+    instruments: Optional[Iterable[ProposalInstrument]] = None,
+    deltas: Optional[Counter] = None,
+) -> ProposalSummary:
+    """
+    按提案当前内容写入读模型行（不提交）
+
+    phases / instruments 为已加载的该提案全部阶段与仪器分配；缺省时各查询一次。
+    给出 deltas 时计数差值累加到其中由调用方一起写入，否则立即写入。
+    """
+    if phases is None:
+        phases = proposal.phases.all()
+    if instruments is None:
+        instruments = proposal.instruments.all()
+    if proposal.id is None:
+        session.flush()
+    summary = session.get(ProposalSummary, proposal.id)
+    if summary is None:
+        # 先填充再加入会话，避免填充时的惰性加载自动 flush 出不完整的行
+        before = Counter()
+        summary = ProposalSummary(proposal_id=proposal.id)
+        _fill(summary, proposal, phases, instruments)
+        session.add(summary)
+    else:
+        before = summary_keys(summary)
+        _fill(summary, proposal, phases, instruments)
+    # 仪表盘计数随读模型在同一事务中增减
+    if deltas is not None:
+        add_deltas(deltas, before, summary_keys(summary))
+    else:
+        apply_deltas(session, before, summary_keys(summary))
+    return summary
+
+
+_NEW_PROPOSALS = "proposal_summary.new_proposals"
+_RENAMED = "proposal_summary.renamed"
+# 读模型中冗余存储的字段：模型 -> 需要跟随的属性
+_DENORMALIZED = {WorkflowState: ("name",), ProposalType: ("name", "season_id"), Instrument: ("code",)}
+
+
+@event.listens_for(db.session, "before_flush")
+def _count_deleted_summaries(session, flush_context, instances) -> None:
+    """通过 ORM 删除的提案连带删除读模型行，同时减去其计数"""
+    removed = Counter()
+    for obj in session.deleted:
+        if isinstance(obj, ProposalSummary):
+            removed.update(summary_keys(obj))
+    if removed:
+        apply_deltas(session, removed, Counter())
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_changes(session, flush_context) -> None:
+    new = [obj for obj in session.new if isinstance(obj, Proposal)]
+    if new:
+        session.info.setdefault(_NEW_PROPOSALS, []).extend(new)
+    for obj in session.dirty:
+        fields = _DENORMALIZED.get(type(obj))
+        if fields is None:
+            continue
+        # 修改前属性可能已过期，旧值未知，只判断是否有变更
+        state = inspect(obj)
+        if any(state.attrs[field].history.has_changes() for field in fields):
+            session.info.setdefault(_RENAMED, []).append(obj)
+
+
+@event.listens_for(db.session, "after_flush_postexec")
+def _follow_renames(session, flush_context) -> None:
+    """
+    状态、提案类型或仪器改名后更新受影响的读模型行，计数差值按键序一次写入
+
+    与新建提案一样，修改后的行由提交时的下一轮 flush 写入。
+    """
+    renamed = session.info.pop(_RENAMED, None)
+    if not renamed:
+        return
+    deltas = Counter()
+    with session.no_autoflush:
+        for obj in renamed:
+            if isinstance(obj, WorkflowState):
+                summaries = session.query(ProposalSummary).filter(ProposalSummary.state_id == obj.id)
+            elif isinstance(obj, ProposalType):
+                summaries = session.query(ProposalSummary).filter(ProposalSummary.proposal_type_id == obj.id)
+            else:
+                summaries = session.query(ProposalSummary).filter(
+                    ProposalSummary.proposal_id.in_(
+                        session.query(ProposalInstrument.proposal_id).filter(
+                            ProposalInstrument.instrument_id == obj.id
+                        )
+                    )
+                )
+            summaries = summaries.all()
+            assignments = defaultdict(list)
+            if isinstance(obj, Instrument) and summaries:
+                for pi in session.query(ProposalInstrument).options(joinedload(ProposalInstrument.instrument)).filter(
+                    ProposalInstrument.proposal_id.in_([summary.proposal_id for summary in summaries])
+                ):
+                    assignments[pi.proposal_id].append(pi)
+            for summary in summaries:
+                before = summary_keys(summary)
+                if isinstance(obj, WorkflowState):
+                    summary.state_name = obj.name
+                elif isinstance(obj, ProposalType):
+                    summary.proposal_type_name = obj.name
+                    summary.season_id = obj.season_id
+                else:
+                    summary.instruments = instrument_entries(assignments[summary.proposal_id])
+                add_deltas(deltas, before, summary_keys(summary))
+    apply_deltas(session, Counter(), deltas)
+
+
+@event.listens_for(db.session, "after_flush_postexec")
+def _fill_missing_summaries(session, flush_context) -> None:
+    """
+    为本次 flush 新插入、但写路径没有调用 refresh_summary 的提案补写读模型行
+
+    新行留在会话中，由提交时的下一轮 flush 写入，与提案在同一事务中；flush 进行中
+    不能再触发自动 flush。
+    """
+    proposals = session.info.pop(_NEW_PROPOSALS, None)
+    if not proposals:
+        return
+    with session.no_autoflush:
+        for proposal in proposals:
+            if proposal.id is not None and session.get(ProposalSummary, proposal.id) is None:
+                refresh_summary(session, proposal)
+
+
+def rebuild_summaries(chunk_size: Optional[int] = None) -> int:
+    """按 id 分块重建全部提案的读模型，每块一个事务；返回处理的提案数"""
+    chunk_size = chunk_size or current_app.config.get("PROPOSAL_EXPORT_CHUNK_SIZE", 500)
+    base = Proposal.query.options(joinedload(Proposal.current_state), joinedload(Proposal.proposal_type))
+    last_id = 0
+    total = 0
+    while True:
+        proposals = base.filter(Proposal.id > last_id).order_by(Proposal.id).limit(chunk_size).all()
+        if not proposals:
+            break
+        last_id = proposals[-1].id
+        ids = [proposal.id for proposal in proposals]
+        phases = defaultdict(list)
+        for phase in ProposalPhase.query.filter(ProposalPhase.proposal_id.in_(ids)):
+            phases[phase.proposal_id].append(phase)
+        instruments = defaultdict(list)
+        for pi in ProposalInstrument.query.options(joinedload(ProposalInstrument.instrument)).filter(
+            ProposalInstrument.proposal_id.in_(ids)
+        ):
+            instruments[pi.proposal_id].append(pi)
+        summaries = {
+            summary.proposal_id: summary
+            for summary in ProposalSummary.query.filter(ProposalSummary.proposal_id.in_(ids))
+        }
+        for proposal in proposals:
+            summary = summaries.get(proposal.id)
+            if summary is None:
+                summary = summaries[proposal.id] = ProposalSummary(proposal_id=proposal.id)
+                _fill(summary, proposal, phases[proposal.id], instruments[proposal.id])
+                db.session.add(summary)
+            else:
+                _fill(summary, proposal, phases[proposal.id], instruments[proposal.id])
+        db.session.commit()
+        for obj in proposals + list(summaries.values()) + [item for group in phases.values() for item in group] + [
+            item for group in instruments.values() for item in group
+        ]:
+            db.session.expunge(obj)
+        total += len(proposals)
+    # 删除提案已不存在的行
+    ProposalSummary.query.filter(~ProposalSummary.proposal_id.in_(db.session.query(Proposal.id))).delete(
+        synchronize_session=False
+    )
+    db.session.commit()
+    # 重建绕过了增量计数，按提案表重新计算
+    reconcile_counters()
+    return total
@@ -0,0 +1,144 @@
+"""
+Per-tool rate limiter
+按 ExternalTool 的令牌桶限制发往上游的请求速率（配置见 tool.config["rate_limit"]）
+状态保存在 HostStore 中，同一台机器上的多个 worker 进程共享同一个桶
+"""
+import math
+import time
+from typing import Any, Dict, Optional
+
+from flask import current_app
+
+from app.core.host_store import get_host_store
+from app.models.models import ExternalTool
+
+
+DEFAULT_RATE_LIMIT = {
+    "rate": None,  # 每秒补充的令牌数；未配置时不限流
+    "burst": None,  # 桶容量，缺省等于 rate（至少 1）
+    "max_wait": 10,  # 排队等待令牌的最长秒数，超过则拒绝
+    "max_queue": 100,  # 同时排队等待的请求数上限
+    "reject": False,  # True 时没有可用令牌立即拒绝，不排队
+}
+
+
+class RateLimitedError(Exception):
+    """超出工具的速率限制（排队已满或等待过久），请求未发出"""
+
+
+def rate_limit_config(tool: ExternalTool) -> Optional[Dict[str, Any]]:
+    """工具的限流配置；未配置 rate 时返回 None"""
+    configured = (tool.config or {}).get("rate_limit") or {}
+    if not configured.get("rate"):
+        return None
+    config = dict(DEFAULT_RATE_LIMIT)
+    config.update(configured)
+    config["rate"] = float(config["rate"])
+    config["burst"] = float(config["burst"] or max(config["rate"], 1.0))
+    return config
+
+
+class RateLimiter:
+    """
+    令牌桶（预约式）
+
+    acquire 在一个写事务中补充令牌并预约一个：令牌不足时余额记为负数，调用方按
+    欠额 / rate 计算出的时间等待后再发送，欠下的令牌数即当前排队深度。等待时间超过
+    max_wait、排队深度达到 max_queue 或配置了 reject 时拒绝且不消耗令牌。
+    与熔断器一样不依赖应用上下文，可在 send 线程中调用；等待由调用方完成
+    （同步引擎 time.sleep，asyncio 引擎 asyncio.sleep）。
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rate_limiter (
+        tool_id INTEGER PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        admitted INTEGER NOT NULL DEFAULT 0,
+        rejected INTEGER NOT NULL DEFAULT 0,
+        waited INTEGER NOT NULL DEFAULT 0,
+        wait_total REAL NOT NULL DEFAULT 0,
+        wait_max REAL NOT NULL DEFAULT 0
+    );
+    """
+
+    def __init__(self, store):
+        self.store = store
+        store.ensure_schema("rate_limiter", self.SCHEMA)
+
+    def _row(self, conn, tool_id: int, config: Dict[str, Any], now: float) -> Dict[str, Any]:
+        row = conn.execute(
+            "SELECT tokens, updated_at, admitted, rejected, waited, wait_total, wait_max "
+            "FROM rate_limiter WHERE tool_id = ?",
+            (tool_id,),
+        ).fetchone()
+        if row is None:
+            row = (config["burst"], now, 0, 0, 0, 0.0, 0.0)
+        row = dict(zip(("tokens", "updated_at", "admitted", "rejected", "waited", "wait_total", "wait_max"), row))
+        row["tokens"] = min(config["burst"], row["tokens"] + (now - row["updated_at"]) * config["rate"])
+        row["updated_at"] = now
+        return row
+
+    def _save(self, conn, tool_id: int, row: Dict[str, Any]) -> None:
+        conn.execute(
+            "INSERT OR REPLACE INTO rate_limiter "
+            "(tool_id, tokens, updated_at, admitted, rejected, waited, wait_total, wait_max) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                tool_id, row["tokens"], row["updated_at"], row["admitted"], row["rejected"],
+                row["waited"], row["wait_total"], row["wait_max"],
+            ),
+        )
+
+    def acquire(self, tool_id: int, config: Dict[str, Any]) -> float:
+        """预约一个令牌，返回发送前需要等待的秒数；被拒绝时抛出 RateLimitedError"""
+        now = time.time()
+        with self.store.transaction() as conn:
+            row = self._row(conn, tool_id, config, now)
+            wait = 0.0
+            if row["tokens"] < 1:
+                wait = (1 - row["tokens"]) / config["rate"]
+                depth = math.ceil(-row["tokens"]) if row["tokens"] < 0 else 0
+                rejected = config["reject"] or wait > config["max_wait"] or depth >= config["max_queue"]
+                if rejected:
+                    row["rejected"] += 1
+                else:
+                    row["waited"] += 1
+                    row["wait_total"] += wait
+                    row["wait_max"] = max(row["wait_max"], wait)
+            else:
+                rejected = False
+            if not rejected:
+                row["tokens"] -= 1
+                row["admitted"] += 1
+            self._save(conn, tool_id, row)
+        if rejected:
+            raise RateLimitedError(f"Rate limit exceeded ({config['rate']:g}/s, {depth} request(s) queued)")
+        return wait
+
+    def status(self, tool: ExternalTool) -> Dict[str, Any]:
+        config = rate_limit_config(tool)
+        if config is None:
+            return {"enabled": False}
+        row = self._row(self.store, tool.id, config, time.time())
+        return {
+            "enabled": True,
+            "rate": config["rate"],
+            "burst": config["burst"],
+            "tokens": round(max(row["tokens"], 0.0), 3),
+            "queue_depth": math.ceil(-row["tokens"]) if row["tokens"] < 0 else 0,
+            "admitted": row["admitted"],
+            "rejected": row["rejected"],
+            "waited": row["waited"],
+            "avg_wait": round(row["wait_total"] / row["waited"], 3) if row["waited"] else 0.0,
+            "max_wait": round(row["wait_max"], 3),
+        }
+
+
+def get_rate_limiter() -> RateLimiter:
+    """当前应用的限流器（状态存放在 HOST_STATE_PATH 指向的本机共享库中）"""
+    app = current_app._get_current_object()
+    limiter = app.extensions.get("tool_rate_limiter")
+    if limiter is None:
+        limiter = app.extensions["tool_rate_limiter"] = RateLimiter(get_host_store())
+    return limiter
@@ -0,0 +1,289 @@
+"""
+Single-flight request coalescing
+同时发起的相同外部工具请求只向上游发出一次，所有调用方共享其结果
+
+process 模式在进程内合并；host 模式在进程内合并之后，再通过 HostStore 在同一台机器的
+多个 worker 进程之间合并（领头进程把结果写入共享库，请求进行中加入的其余进程轮询读取）。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import requests
+from flask import current_app
+
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.host_store import get_host_store
+from app.core.rate_limiter import RateLimitedError
+from app.core.tool_cache import CachedResponse, serialize_response
+
+
+# (response, error)：send 阶段一次尝试的结果
+Outcome = Tuple[Any, Optional[BaseException]]
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def coalesce_enabled(operation) -> bool:
+    """
+    是否合并该操作的并发请求
+
+    cache_config.coalesce 显式配置时以其为准；否则幂等方法、验证类工具与开启了
+    响应缓存的操作默认合并（重复发送不会产生额外副作用）。
+    """
+    cache_config = operation.cache_config or {}
+    if 'coalesce' in cache_config:
+        return bool(cache_config['coalesce'])
+    return (
+        (operation.method or '').upper() in IDEMPOTENT_METHODS
+        or operation.tool_type == 'validation'
+        or bool(cache_config.get('enabled'))
+    )
+
+
+def flight_key(operation_id: int, request_params: Dict[str, Any]) -> str:
+    """解析后的完整请求（含请求头）的哈希"""
+    payload = json.dumps(
+        [
+            operation_id,
+            request_params.get('method'),
+            request_params.get('url'),
+            request_params.get('headers') or {},
+            request_params.get('params') or {},
+            request_params.get('body') or {},
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def encode_outcome(outcome: Outcome) -> str:
+    response, error = outcome
+    if error is None:
+        return json.dumps({'response': serialize_response(response)}, default=str)
+    if isinstance(error, CircuitOpenError):
+        kind = 'circuit_open'
+    elif isinstance(error, RateLimitedError):
+        kind = 'rate_limited'
+    elif isinstance(error, requests.exceptions.RequestException):
+        kind = 'request'
+    else:
+        kind = 'error'
+    return json.dumps({'error': {'kind': kind, 'message': str(error)}})
+
+
+def decode_outcome(value: str) -> Outcome:
+    data = json.loads(value)
+    if 'response' in data:
+        return CachedResponse(data['response']), None
+    error = data['error']
+    error_class = {
+        'circuit_open': CircuitOpenError,
+        'rate_limited': RateLimitedError,
+        'request': requests.exceptions.RequestException,
+    }.get(error['kind'], RuntimeError)
+    return None, error_class(error['message'])
+
+
+class _Flight:
+    __slots__ = ('done', 'outcome', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.outcome: Optional[Outcome] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    进程内的请求合并
+
+    每个 key 同一时刻只有一个领头线程执行 fn，其余线程等待并拿到同一结果；
+    等待超过 wait 秒时自行执行 fn。host 不为 None 时领头线程再经由 HostFlight 跨进程合并。
+    """
+
+    def __init__(self, host: Optional['HostFlight'] = None):
+        self.host = host
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.shared = 0
+        self.timeouts = 0
+
+    def do(self, key: str, fn: Callable[[], Outcome], wait: float) -> Tuple[Outcome, bool]:
+        """返回 (结果, 是否为共享的结果)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            if flight.done.wait(wait):
+                if flight.error is not None:
+                    raise flight.error
+                with self._lock:
+                    self.shared += 1
+                return flight.outcome, True
+            with self._lock:
+                self.timeouts += 1
+            return fn(), False
+
+        try:
+            if self.host is not None:
+                flight.outcome, shared = self.host.do(key, fn, wait)
+            else:
+                flight.outcome, shared = fn(), False
+            return flight.outcome, shared
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                'mode': 'host' if self.host is not None else 'process',
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'shared': self.shared,
+                'timeouts': self.timeouts,
+            }
+        if self.host is not None:
+            stats.update(self.host.stats())
+        return stats
+
+
+class HostFlight:
+    """
+    本机多进程之间的请求合并（HostStore 中的租约行 + 结果行）
+
+    领头进程持有 key 的租约（wait 秒后过期），完成后删除租约并按自己的 owner 写入结果。
+    只有在租约进行中就已加入、记下领头方的等待者才会读取该结果；领头方完成之后才到达的
+    请求不与它并发，取得新租约自行请求（跨请求的复用交给响应缓存）。结果行保留 result_ttl
+    秒供轮询中的等待者读取；租约过期仍无结果时由等待方自行请求。
+    """
+
+    # 表名随布局变化而更换，旧版本的 single_flight 表不再使用；这里不删除任何表，
+    # 以免进程启动时清掉其他进程持有的租约
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS single_flight_lease (
+        key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        lease_expires REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS single_flight_result (
+        key TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        result TEXT NOT NULL,
+        expires REAL NOT NULL,
+        PRIMARY KEY (key, owner)
+    );
+    """
+
+    def __init__(self, store, result_ttl: float = 2.0, poll_interval: float = 0.05):
+        self.store = store
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self.host_leaders = 0
+        self.host_shared = 0
+        self.host_timeouts = 0
+        store.ensure_schema('single_flight', self.SCHEMA)
+
+    def _claim(self, key: str, owner: str, wait: float, joined: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+        """
+        返回 (结果, 领头方)
+
+        joined 为已加入的飞行的领头方，其结果已写入时返回 (结果, joined)；有进行中的租约时
+        返回 (None, 该租约的领头方)，调用方加入并等待；否则取得租约，返回 (None, None)。
+        """
+        now = time.time()
+        with self.store.transaction() as conn:
+            if joined is not None:
+                row = conn.execute(
+                    'SELECT result FROM single_flight_result WHERE key = ? AND owner = ?', (key, joined)
+                ).fetchone()
+                if row is not None:
+                    return row[0], joined
+            row = conn.execute('SELECT owner, lease_expires FROM single_flight_lease WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[1] > now:
+                return None, row[0]
+            conn.execute(
+                'INSERT OR REPLACE INTO single_flight_lease (key, owner, lease_expires) VALUES (?, ?, ?)',
+                (key, owner, now + wait),
+            )
+            conn.execute('DELETE FROM single_flight_result WHERE expires < ?', (now,))
+        return None, None
+
+    def do(self, key: str, fn: Callable[[], Outcome], wait: float) -> Tuple[Outcome, bool]:
+        owner = f'{os.getpid()}:{uuid.uuid4().hex}'
+        deadline = time.monotonic() + wait
+        joined = None
+        while True:
+            result, joined = self._claim(key, owner, wait, joined)
+            if joined is None:
+                break
+            if result is not None:
+                with self._lock:
+                    self.host_shared += 1
+                return decode_outcome(result), True
+            if time.monotonic() >= deadline:
+                with self._lock:
+                    self.host_timeouts += 1
+                return fn(), False
+            time.sleep(self.poll_interval)
+
+        with self._lock:
+            self.host_leaders += 1
+        try:
+            outcome = fn()
+        except BaseException:
+            self.store.execute('DELETE FROM single_flight_lease WHERE key = ? AND owner = ?', (key, owner))
+            raise
+        with self.store.transaction() as conn:
+            conn.execute('DELETE FROM single_flight_lease WHERE key = ? AND owner = ?', (key, owner))
+            conn.execute(
+                'INSERT OR REPLACE INTO single_flight_result (key, owner, result, expires) VALUES (?, ?, ?, ?)',
+                (key, owner, encode_outcome(outcome), time.time() + self.result_ttl),
+            )
+        return outcome, False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'host_leaders': self.host_leaders,
+                'host_shared': self.host_shared,
+                'host_timeouts': self.host_timeouts,
+            }
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """当前应用的请求合并器；TOOL_COALESCE_MODE 为 off 时返回 None"""
+    app = current_app._get_current_object()
+    mode = app.config.get('TOOL_COALESCE_MODE', 'process')
+    if mode == 'off':
+        return None
+    flights = app.extensions.get('tool_single_flight')
+    if flights is None:
+        host = None
+        if mode == 'host':
+            host = HostFlight(get_host_store(), result_ttl=app.config.get('TOOL_COALESCE_RESULT_TTL', 2.0))
+        flights = app.extensions['tool_single_flight'] = SingleFlight(host)
+    return flights
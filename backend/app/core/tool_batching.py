@@ -0,0 +1,139 @@
+"""
+Upstream request batching
+把同一批次中发往同一批量接口的多个调用合并为一次上游请求，再把响应按条目拆回各调用
+
+配置见 ExternalToolOperation.batch_config。合并只改变 send 阶段：每个调用仍有自己的
+执行日志、验证与输出映射（complete 阶段看到的是属于自己的那一条结果）。
+
+合并只对异步任务有意义：window 把同一窗口内入队的任务对齐到同一执行时间，由同一次
+run_jobs 一起发送。同步的状态流转（交互路径）每次只发出自己的调用，总是一个只有一条
+的批次，不会等待窗口；仍按批量格式发送是因为上游是批量接口，不接受单条请求体。
+"""
+import copy
+import json
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.tool_cache import CachedResponse
+from app.core.tool_mapping import compile_response_path
+
+
+DEFAULT_BATCH_CONFIG = {
+    "enabled": False,
+    "max_size": 100,
+    "window": 0,
+    "items_field": "items",
+    "response_items": "response",
+    "match_on": None,
+}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def batch_config(operation) -> Optional[Dict[str, Any]]:
+    """操作的批量配置；未开启时返回 None"""
+    configured = operation.batch_config or {}
+    if not configured.get("enabled"):
+        return None
+    config = dict(DEFAULT_BATCH_CONFIG)
+    config.update(configured)
+    config["max_size"] = max(int(config["max_size"]), 1)
+    return config
+
+
+def window_run_after(config: Dict[str, Any], now: Optional[datetime] = None) -> Optional[datetime]:
+    """异步任务的执行时间对齐到下一个窗口边界，同一窗口内入队的任务同时到期"""
+    window = float(config.get("window") or 0)
+    if window <= 0:
+        return None
+    elapsed = ((now or datetime.utcnow()) - _EPOCH).total_seconds()
+    return _EPOCH + timedelta(seconds=math.ceil(elapsed / window) * window)
+
+
+def _group_key(call) -> str:
+    request_params = call.request_params
+    return json.dumps(
+        [
+            call.operation_id,
+            request_params.get("method"),
+            request_params.get("url"),
+            request_params.get("headers") or {},
+            request_params.get("params") or {},
+        ],
+        sort_keys=True,
+        default=str,
+    )
+
+
+def group_calls(calls: List) -> Tuple[List[List], List]:
+    """
+    把可合并的调用按 (操作, URL, 查询参数, 请求头) 分组，每组最多 max_size 个
+
+    返回 (批次列表, 不参与合并的调用)。只有一个调用的组仍按批量格式发送，
+    保证同一操作的上游接口格式一致。
+    """
+    groups: Dict[str, List] = {}
+    singles = []
+    for call in calls:
+        if call.batch is None:
+            singles.append(call)
+        else:
+            groups.setdefault(_group_key(call), []).append(call)
+    batches = []
+    for members in groups.values():
+        size = members[0].batch["max_size"]
+        batches.extend(members[i:i + size] for i in range(0, len(members), size))
+    return batches, singles
+
+
+def batch_request(calls: List):
+    """以第一个调用为模板构造合并后的请求（请求体为各调用请求体的列表）"""
+    lead = copy.copy(calls[0])
+    config = lead.batch
+    request_params = dict(lead.request_params)
+    request_params["body"] = {config["items_field"]: [call.request_params.get("body") or {} for call in calls]}
+    lead.request_params = request_params
+    return lead
+
+
+def split_outcome(calls: List, outcome, response_ms: Optional[float] = None) -> List:
+    """
+    把合并请求的结果拆回各调用，返回与 calls 对应的 (response, error) 列表
+
+    请求失败或 HTTP 状态 >= 400 时每个调用得到同样的结果；成功时每个调用得到一个
+    只含自己那条结果的响应，缺少对应结果的调用记为错误。合并请求的耗时 response_ms
+    记到每个调用上（各自的执行日志与回放延迟用的都是这次上游请求的耗时）。
+    """
+    for call in calls:
+        call.response_ms = response_ms
+    response, error = outcome
+    if error is not None or response.status_code >= 400:
+        return [outcome] * len(calls)
+    config = calls[0].batch
+    try:
+        items = compile_response_path(config["response_items"])(response.json())
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        error = RuntimeError(f"Batch response has no list at '{config['response_items']}'")
+        return [(None, error)] * len(calls)
+
+    match_on = config.get("match_on")
+    if match_on:
+        by_key = {item.get(match_on): item for item in items if isinstance(item, dict)}
+        matched = [by_key.get((call.request_params.get("body") or {}).get(match_on)) for call in calls]
+    else:
+        matched = [items[i] if i < len(items) else None for i in range(len(calls))]
+
+    headers = dict(response.headers)
+    outcomes = []
+    for item in matched:
+        if item is None:
+            outcomes.append((None, RuntimeError("Batch response has no result for this item")))
+        else:
+            outcomes.append((
+                CachedResponse({"status_code": response.status_code, "headers": headers, "body": item}),
+                None,
+            ))
+    return outcomes
@@ -0,0 +1,209 @@
+"""
+External tool response cache
+按解析后的请求（method、URL、query、body）缓存幂等/校验类操作的响应
+支持 TTL、LRU 淘汰、容量上限与命中统计；后端可替换
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from flask import current_app
+
+from app.core.host_store import get_host_store
+
+
+def cache_key(operation_id: int, request_params: Dict[str, Any]) -> str:
+    payload = json.dumps(
+        [
+            operation_id,
+            request_params.get('method'),
+            request_params.get('url'),
+            request_params.get('params') or {},
+            request_params.get('body') or {},
+        ],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CachedResponse:
+    """缓存命中时交给 complete 阶段的响应对象，接口与 requests.Response 的用到部分一致"""
+
+    def __init__(self, entry: Dict[str, Any]):
+        self.status_code = entry['status_code']
+        self.headers = entry.get('headers') or {}
+        self.text = entry.get('text') or ''
+        self._body = entry.get('body')
+
+    def json(self):
+        if self._body is None:
+            raise ValueError('Cached response has no JSON body')
+        return self._body
+
+
+def serialize_response(response) -> Dict[str, Any]:
+    try:
+        body = response.json()
+    except Exception:
+        body = None
+    return {
+        'status_code': response.status_code,
+        'headers': dict(response.headers),
+        'text': response.text if body is None else '',
+        'body': body,
+    }
+
+
+class InProcessBackend:
+    """进程内 LRU：OrderedDict 按访问顺序排列，超过 max_entries 时淘汰最久未用的条目"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class HostBackend:
+    """本机多进程共享的缓存，存放在 HostStore（SQLite）中，LRU 以 last_used 近似"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS tool_response_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_tool_response_cache_last_used ON tool_response_cache (last_used);
+    """
+
+    def __init__(self, store, max_entries: int = 1024):
+        self.store = store
+        self.max_entries = max_entries
+        self.evictions = 0
+        store.ensure_schema('tool_response_cache', self.SCHEMA)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        row = self.store.execute(
+            'SELECT value, expires_at FROM tool_response_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self.store.execute('DELETE FROM tool_response_cache WHERE key = ?', (key,))
+            return None
+        self.store.execute('UPDATE tool_response_cache SET last_used = ? WHERE key = ?', (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        now = time.time()
+        with self.store.transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO tool_response_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(value, default=str), now + ttl, now),
+            )
+            count = conn.execute('SELECT COUNT(*) FROM tool_response_cache').fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    'DELETE FROM tool_response_cache WHERE key IN '
+                    '(SELECT key FROM tool_response_cache ORDER BY expires_at <= ? DESC, last_used LIMIT ?)',
+                    (now, overflow),
+                )
+                self.evictions += overflow
+
+    def clear(self) -> None:
+        self.store.execute('DELETE FROM tool_response_cache')
+
+    def __len__(self) -> int:
+        return self.store.execute('SELECT COUNT(*) FROM tool_response_cache').fetchone()[0]
+
+
+class ResponseCache:
+    """带命中统计的缓存门面；只缓存状态码 < 400 的响应"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self.backend.get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return CachedResponse(entry) if entry is not None else None
+
+    def store(self, key: str, response, ttl: float) -> None:
+        if ttl <= 0 or response.status_code >= 400:
+            return
+        self.backend.set(key, serialize_response(response), ttl)
+        with self._lock:
+            self.stores += 1
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'max_entries': self.backend.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'stores': self.stores,
+            'evictions': self.backend.evictions,
+        }
+
+
+def get_response_cache() -> ResponseCache:
+    """当前应用的响应缓存（按 TOOL_CACHE_BACKEND 创建，存放在 app.extensions）"""
+    app = current_app._get_current_object()
+    cache = app.extensions.get('tool_response_cache')
+    if cache is None:
+        max_entries = app.config.get('TOOL_CACHE_MAX_ENTRIES', 1024)
+        if app.config.get('TOOL_CACHE_BACKEND', 'memory') == 'host':
+            backend = HostBackend(get_host_store(), max_entries)
+        else:
+            backend = InProcessBackend(max_entries)
+        cache = app.extensions['tool_response_cache'] = ResponseCache(backend)
+    return cache
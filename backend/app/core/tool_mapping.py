@@ -0,0 +1,266 @@
+"""
+Compiled external tool mappings
+把 ExternalToolOperation 的 input_mapping、output_mapping 与
+validation_config.failure_conditions 预编译为取值闭包，按操作版本缓存
+
+映射格式示例：
+- "proposal.id" -> data_source['proposal']['id']
+- "proposal.data.field_name" -> data_source['proposal']['data']['field_name']
+- "context.some_key" -> data_source['context']['some_key']
+- {"literal": "fixed_value"} -> "fixed_value"
+- {"template": "Proposal #{proposal.id}"} -> "Proposal #123"
+"""
+import hashlib
+import json
+import operator
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+
+from flask import current_app
+
+
+DEFAULT_CACHE_TTL = 60  # 秒；超过后重新核对操作配置的内容哈希
+
+_TEMPLATE_VAR = re.compile(r'\{([^}]+)\}')
+
+Accessor = Callable[[Any], Any]
+
+
+def compile_path(path: str) -> Accessor:
+    """点分路径 -> 取值函数；逐级取 dict 键或对象属性，遇到 None 即返回 None"""
+    keys = tuple(path.split('.'))
+
+    def get(data):
+        current = data
+        for key in keys:
+            if isinstance(current, dict):
+                current = current.get(key)
+            elif hasattr(current, key):
+                current = getattr(current, key)
+            else:
+                return None
+            if current is None:
+                return None
+        return current
+
+    return get
+
+
+def compile_response_path(path: str) -> Accessor:
+    """响应路径（以 response. 开头）-> 直接作用于响应体的取值函数"""
+    keys = path.split('.')
+    if keys[0] != 'response':
+        return lambda body: None
+    if len(keys) == 1:
+        return lambda body: body
+    return compile_path('.'.join(keys[1:]))
+
+
+def referenced_paths(mapping) -> Tuple[str, ...]:
+    """单个输入映射引用的数据源路径（模板中的每个变量各算一个）"""
+    if isinstance(mapping, dict):
+        if 'literal' in mapping:
+            return ()
+        if 'template' in mapping:
+            return tuple(match.group(1) for match in _TEMPLATE_VAR.finditer(mapping['template']))
+    if isinstance(mapping, str):
+        return (mapping,)
+    return ()
+
+
+def _compile_template(template: str, compile_var: Callable[[str], Accessor], missing: Optional[str] = None):
+    parts = []
+    position = 0
+    for match in _TEMPLATE_VAR.finditer(template):
+        if match.start() > position:
+            parts.append(template[position:match.start()])
+        parts.append(compile_var(match.group(1)))
+        position = match.end()
+    if position < len(template):
+        parts.append(template[position:])
+    parts = tuple(parts)
+
+    def render(data) -> str:
+        out = []
+        for part in parts:
+            if isinstance(part, str):
+                out.append(part)
+            else:
+                value = part(data)
+                out.append(missing if value is None and missing is not None else str(value))
+        return ''.join(out)
+
+    return render
+
+
+def compile_mapping(mapping) -> Accessor:
+    """单个输入映射 -> 以 data_source 为参数的取值函数"""
+    if isinstance(mapping, dict):
+        if 'literal' in mapping:
+            value = mapping['literal']
+            return lambda data: value
+        if 'template' in mapping:
+            return _compile_template(mapping['template'], compile_path)
+    if isinstance(mapping, str):
+        return compile_path(mapping)
+    return lambda data: mapping
+
+
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>': operator.gt,
+    '<': operator.lt,
+    'in': lambda actual, expected: actual in expected,
+    'not_in': lambda actual, expected: actual not in expected,
+}
+
+
+def _compile_condition(condition: Dict[str, Any]):
+    path = condition.get('path', '')
+    compare = _OPERATORS.get(condition.get('operator', '=='))
+    expected = condition.get('value')
+    get = compile_response_path(path)
+    if compare is None:
+        return path, get, lambda actual: False
+    return path, get, lambda actual: compare(actual, expected)
+
+
+@dataclass(frozen=True)
+class CompiledMappings:
+    path: Tuple[Tuple[str, Accessor], ...]
+    query: Tuple[Tuple[str, Accessor], ...]
+    body: Tuple[Tuple[str, Accessor], ...]
+    headers: Tuple[Tuple[str, Accessor], ...]
+    to_context: Tuple[Tuple[str, Accessor], ...]
+    # None 表示 output_mapping 中没有 to_proposal_data（不改写 proposal.data）
+    to_proposal_data: Optional[Tuple[Tuple[str, Accessor], ...]]
+    failure_conditions: Tuple[Tuple[str, Accessor, Callable[[Any], bool]], ...]
+    error_template: str
+    render_error: Callable[[Any], str]
+    # 输入映射引用到的 proposal 顶层字段；None 表示引用了整个 proposal
+    proposal_fields: Optional[FrozenSet[str]] = frozenset()
+
+    def validation_error(self, response_body: Any) -> Optional[str]:
+        """按 failure_conditions 检查响应，命中时返回错误消息"""
+        for path, get, failed in self.failure_conditions:
+            actual_value = get(response_body)
+            if failed(actual_value):
+                message = self.render_error(response_body)
+                # 如果没有替换任何变量，添加默认信息
+                if message == self.error_template:
+                    message = f"Validation failed: {path} = {actual_value}"
+                return message
+        return None
+
+
+def _compile_section(section) -> Tuple[Tuple[str, Accessor], ...]:
+    return tuple((name, compile_mapping(mapping)) for name, mapping in (section or {}).items())
+
+
+def _compile_output(section) -> Tuple[Tuple[str, Accessor], ...]:
+    return tuple(
+        (name, compile_response_path(path))
+        for name, path in (section or {}).items()
+        if isinstance(path, str)
+    )
+
+
+def _proposal_fields(input_mapping: Dict[str, Any]) -> Optional[FrozenSet[str]]:
+    fields = set()
+    for section in ('path', 'query', 'body', 'headers'):
+        for mapping in (input_mapping.get(section) or {}).values():
+            for path in referenced_paths(mapping):
+                keys = path.split('.')
+                if keys[0] != 'proposal':
+                    continue
+                if len(keys) == 1:
+                    return None
+                fields.add(keys[1])
+    return frozenset(fields)
+
+
+def compile_operation(operation) -> CompiledMappings:
+    input_mapping = operation.input_mapping or {}
+    output_mapping = operation.output_mapping or {}
+    validation_config = operation.validation_config or {}
+    error_template = validation_config.get('error_message_template', 'Validation failed')
+    return CompiledMappings(
+        path=_compile_section(input_mapping.get('path')),
+        query=_compile_section(input_mapping.get('query')),
+        body=_compile_section(input_mapping.get('body')),
+        headers=_compile_section(input_mapping.get('headers')),
+        to_context=_compile_output(output_mapping.get('to_context')),
+        to_proposal_data=(
+            _compile_output(output_mapping['to_proposal_data'])
+            if 'to_proposal_data' in output_mapping else None
+        ),
+        failure_conditions=tuple(
+            _compile_condition(condition) for condition in validation_config.get('failure_conditions', [])
+        ),
+        error_template=error_template,
+        render_error=_compile_template(error_template, compile_response_path, missing='N/A'),
+        proposal_fields=_proposal_fields(input_mapping),
+    )
+
+
+def mapping_hash(operation) -> str:
+    payload = json.dumps(
+        [operation.input_mapping, operation.output_mapping, operation.validation_config],
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class MappingCache:
+    """
+    进程内的编译结果缓存
+
+    与 WorkflowCache 相同：条目按操作 ID 存放并记录内容哈希，TTL 内直接复用，
+    到期后重新计算哈希，配置未变时继续使用已编译结果。update_operation 会主动失效。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Tuple[str, CompiledMappings, float]] = {}
+
+    def _ttl(self) -> float:
+        return current_app.config.get('TOOL_MAPPING_CACHE_TTL', DEFAULT_CACHE_TTL)
+
+    def get(self, operation) -> CompiledMappings:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(operation.id)
+        if entry and now - entry[2] < self._ttl():
+            return entry[1]
+        content_hash = mapping_hash(operation)
+        if entry and entry[0] == content_hash:
+            compiled = entry[1]
+        else:
+            compiled = compile_operation(operation)
+        with self._lock:
+            self._entries[operation.id] = (content_hash, compiled, now)
+        return compiled
+
+    def invalidate(self, operation_id: Optional[int] = None) -> None:
+        with self._lock:
+            if operation_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(operation_id, None)
+
+
+mapping_cache = MappingCache()
+
+
+def compiled_mappings(operation) -> CompiledMappings:
+    return mapping_cache.get(operation)
+
+
+def invalidate_operation_mappings(operation_id: Optional[int] = None) -> None:
+    """丢弃某个（或全部）操作的编译结果。"""
+    mapping_cache.invalidate(operation_id)
@@ -0,0 +1,238 @@
+"""
+External tool record & replay
+把真实的 ExternalToolExecution 请求/响应（含耗时）导出为夹具文件，并提供本地回放服务
+
+回放服务按 /tools/<tool_id>/<path>?<query> 提供录制的响应，按录制的耗时（请求发出到收到
+响应，或同一接口耗时分布中的随机样本）乘以缩放系数延迟返回。把本地库中工具的 base_url 指向回放服务后，即可在
+无网络的环境中复现生产环境的转换与表单交互负载（flask tool-record / flask tool-replay）。
+"""
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from werkzeug.serving import make_server
+from werkzeug.wrappers import Request, Response
+
+from app.core.execution_log import ENCODING_KEY, execution_body
+from app.models.models import ExternalTool, ExternalToolExecution
+
+FIXTURE_VERSION = 1
+
+# 回放时不转发的响应头（由回放服务自己生成）
+_HOP_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection", "date", "server"}
+
+
+def _body_key(body: Any) -> str:
+    raw = json.dumps(body or {}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _query_key(query: str) -> str:
+    """参数顺序无关的查询串"""
+    return urlencode(sorted(parse_qsl(query or "", keep_blank_values=True)))
+
+
+def _relative_path(tool: ExternalTool, url: Optional[str]) -> Tuple[str, str]:
+    """请求 URL 相对工具 base_url 的路径与规范化的查询串"""
+    parts = urlsplit(url or "")
+    url = parts._replace(query="", fragment="").geturl()
+    base = (tool.base_url or "").rstrip("/")
+    if base and url.startswith(base):
+        url = url[len(base):]
+    return "/" + url.lstrip("/"), _query_key(parts.query)
+
+
+def _truncated(value: Any) -> bool:
+    return isinstance(value, dict) and value.get(ENCODING_KEY) == "truncated"
+
+
+def record_entry(execution: ExternalToolExecution) -> Dict[str, Any]:
+    """
+    一条执行记录的夹具条目
+
+    latency_ms 为请求发出到收到响应的耗时（不含限流与排队等待），旧记录没有该值时为 None；
+    执行日志截断过的内容列在 truncated 中，这些内容不完整，不能用于回放。
+    """
+    tool = execution.operation.tool
+    path, query = _relative_path(tool, execution.request_url)
+    bodies = {
+        field: execution_body(execution, field) for field in ("request_body", "response_headers", "response_body")
+    }
+    return {
+        "execution_id": execution.id,
+        "tool_id": tool.id,
+        "tool": tool.name,
+        "operation_id": execution.operation_id,
+        "method": execution.request_method or execution.operation.method,
+        "path": path,
+        "query": query,
+        "request_body": bodies["request_body"],
+        "status": execution.response_status,
+        "headers": bodies["response_headers"] or {},
+        "body": bodies["response_body"],
+        "latency_ms": execution.response_ms,
+        "truncated": [field for field, value in bodies.items() if _truncated(value)],
+        "triggered_by": execution.triggered_by,
+        "started_at": execution.started_at.isoformat() if execution.started_at else None,
+    }
+
+
+def record_fixture(
+    operation_ids: Optional[Iterable[int]] = None,
+    since_days: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    导出实际发出了请求的执行记录（不含缓存命中与未得到响应的记录）
+
+    内容被执行日志截断的记录不导出，数量见 skipped_truncated。
+    """
+    query = ExternalToolExecution.query.filter(
+        ExternalToolExecution.response_status.isnot(None),
+        ExternalToolExecution.cache_hit.isnot(True),
+    )
+    if operation_ids:
+        query = query.filter(ExternalToolExecution.operation_id.in_(list(operation_ids)))
+    if since_days is not None:
+        query = query.filter(ExternalToolExecution.started_at >= datetime.utcnow() - timedelta(days=since_days))
+    query = query.order_by(ExternalToolExecution.started_at.desc(), ExternalToolExecution.id.desc())
+    if limit:
+        query = query.limit(limit)
+    entries = [record_entry(execution) for execution in query]
+    complete = [entry for entry in entries if not entry["truncated"]]
+    return {
+        "version": FIXTURE_VERSION,
+        "recorded_at": datetime.utcnow().isoformat(),
+        "entries": complete,
+        "skipped_truncated": len(entries) - len(complete),
+    }
+
+
+def write_fixture(fixture: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as fh:
+        json.dump(fixture, fh, ensure_ascii=False, indent=1, default=str)
+
+
+def load_fixture(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as fh:
+        fixture = json.load(fh)
+    if fixture.get("version") != FIXTURE_VERSION:
+        raise ValueError(f"Unsupported fixture version: {fixture.get('version')}")
+    return fixture
+
+
+class ReplayRoute:
+    """同一 (工具, 方法, 路径, 查询串) 的录制条目；请求体相同的条目优先，其余轮流返回"""
+
+    def __init__(self, entries: List[Dict[str, Any]]):
+        self.entries = entries
+        self._lock = threading.Lock()
+        self._all = itertools.cycle(entries)
+        by_body = defaultdict(list)
+        for entry in entries:
+            by_body[_body_key(entry.get("request_body"))].append(entry)
+        self._by_body = {key: itertools.cycle(items) for key, items in by_body.items()}
+        self.latencies = [entry["latency_ms"] for entry in entries if entry.get("latency_ms") is not None]
+
+    def pick(self, body: Any) -> Dict[str, Any]:
+        with self._lock:
+            matching = self._by_body.get(_body_key(body))
+            return next(matching if matching is not None else self._all)
+
+
+class ReplayServer:
+    """
+    回放录制响应的本地 HTTP 服务（WSGI，每个请求一个线程）
+
+    latency="recorded" 使用命中条目自己的耗时，"distribution" 从该接口全部录制耗时中
+    随机抽样；latency_scale 为缩放系数（0 表示不延迟）。
+    """
+
+    def __init__(self, fixture: Dict[str, Any], latency: str = "recorded", latency_scale: float = 1.0, seed=None):
+        if latency not in ("recorded", "distribution"):
+            raise ValueError("latency must be 'recorded' or 'distribution'")
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self._random = random.Random(seed)
+        grouped = defaultdict(list)
+        for entry in fixture.get("entries", []):
+            if entry.get("truncated"):
+                continue
+            key = (entry["tool_id"], entry["method"].upper(), entry["path"], _query_key(entry.get("query", "")))
+            grouped[key].append(entry)
+        self.routes = {key: ReplayRoute(entries) for key, entries in grouped.items()}
+        self.tool_ids = sorted({key[0] for key in self.routes})
+        self.served = 0
+        self.unmatched = 0
+        self._server = None
+        self._thread = None
+
+    def _delay(self, route: ReplayRoute, entry: Dict[str, Any]) -> float:
+        if self.latency == "distribution" and route.latencies:
+            latency_ms = self._random.choice(route.latencies)
+        else:
+            latency_ms = entry.get("latency_ms") or 0
+        return latency_ms / 1000.0 * self.latency_scale
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        parts = request.path.split("/", 3)
+        route = None
+        if len(parts) >= 3 and parts[1] == "tools" and parts[2].isdigit():
+            path = "/" + (parts[3] if len(parts) > 3 else "")
+            query = _query_key(request.query_string.decode("utf-8", errors="replace"))
+            route = self.routes.get((int(parts[2]), request.method.upper(), path, query))
+        if route is None:
+            self.unmatched += 1
+            response = Response(
+                json.dumps({"message": f"No recording for {request.method} {request.path}"}),
+                status=404,
+                content_type="application/json",
+            )
+            return response(environ, start_response)
+
+        body = request.get_json(silent=True)
+        entry = route.pick(body)
+        delay = self._delay(route, entry)
+        if delay > 0:
+            time.sleep(delay)
+        self.served += 1
+        headers = {k: v for k, v in (entry.get("headers") or {}).items() if k.lower() not in _HOP_HEADERS}
+        headers["Content-Type"] = "application/json"
+        response = Response(
+            json.dumps(entry.get("body"), default=str),
+            status=entry.get("status") or 200,
+            headers=headers,
+        )
+        return response(environ, start_response)
+
+    def tool_base_url(self, tool_id: int) -> str:
+        return f"{self.url}/tools/{tool_id}"
+
+    @property
+    def url(self) -> str:
+        return f"http://{self._server.host}:{self._server.port}"
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> "ReplayServer":
+        """在后台线程中启动服务；port=0 时由系统分配端口"""
+        self._server = make_server(host, port, self, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="tool-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self, host: str = "127.0.0.1", port: int = 8099) -> None:
+        self._server = make_server(host, port, self, threaded=True)
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,241 @@
+"""
+Workflow definition compiler
+将 Workflow.definition JSON 预编译为带索引的结构，并按进程缓存
+"""
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+from flask import current_app
+
+from app.models.models import ProposalType, Workflow, WorkflowState
+
+
+DEFAULT_CACHE_TTL = 60  # 秒；超过后重新核对 definition 的内容哈希
+
+
+@dataclass(frozen=True)
+class CompiledTransition:
+    name: str
+    label: str
+    from_state: Optional[str]
+    to_state: Optional[str]
+    to_state_id: Optional[int]
+    roles: FrozenSet[str]
+    conditions: Dict[str, Any]
+    effects: Dict[str, Any]
+    # external_tools 的执行轮次（工具下标）；同一轮内的工具互不依赖
+    tool_stages: Tuple[Tuple[int, ...], ...] = ()
+
+    @property
+    def parallel_tools(self) -> bool:
+        return bool(self.effects.get("parallel_tools"))
+
+    def allows(self, actor_roles) -> bool:
+        return not self.roles or not self.roles.isdisjoint(actor_roles)
+
+
+@dataclass(frozen=True)
+class CompiledWorkflow:
+    workflow_id: int
+    content_hash: str
+    by_key: Dict[Tuple[Optional[str], str], CompiledTransition]
+    by_from: Dict[Optional[str], Tuple[CompiledTransition, ...]]
+    names: FrozenSet[str]
+    state_ids: Dict[str, int]
+    state_names: Dict[int, str] = field(default_factory=dict)
+
+    def find(self, from_state: Optional[str], name: str) -> Optional[CompiledTransition]:
+        return self.by_key.get((from_state, name))
+
+    def outgoing(self, from_state: Optional[str]) -> Tuple[CompiledTransition, ...]:
+        return self.by_from.get(from_state, ())
+
+
+def definition_hash(definition: Optional[Dict[str, Any]]) -> str:
+    payload = json.dumps(definition or {}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def plan_tool_stages(tool_configs, parallel: bool = False) -> Tuple[Tuple[int, ...], ...]:
+    """
+    把 external_tools 划分为执行轮次
+
+    顺序模式下每个工具单独一轮，保持配置顺序。并行模式（effects.parallel_tools）
+    按 depends_on 分层：工具只在其依赖全部完成后的下一轮执行，因此可以读取
+    依赖工具写入 context 的 mapped_output。工具以 "key"（缺省为 operation_id）
+    标识，未知依赖或循环依赖抛出 ValueError。
+    """
+    tool_configs = tool_configs or []
+    if not parallel:
+        return tuple((index,) for index in range(len(tool_configs)))
+
+    keys = [str(config.get("key") or config.get("operation_id")) for config in tool_configs]
+    index_by_key = {key: index for index, key in enumerate(keys)}
+    remaining = {}
+    for index, config in enumerate(tool_configs):
+        depends_on = config.get("depends_on") or []
+        if isinstance(depends_on, str):
+            depends_on = [depends_on]
+        unknown = [str(dep) for dep in depends_on if str(dep) not in index_by_key]
+        if unknown:
+            raise ValueError(f"External tool {keys[index]} depends on unknown tool(s): {', '.join(unknown)}")
+        remaining[index] = {index_by_key[str(dep)] for dep in depends_on}
+
+    stages = []
+    done = set()
+    while remaining:
+        ready = tuple(index for index in sorted(remaining) if remaining[index] <= done)
+        if not ready:
+            cycle = ", ".join(keys[index] for index in sorted(remaining))
+            raise ValueError(f"External tool dependencies form a cycle: {cycle}")
+        stages.append(ready)
+        done.update(ready)
+        for index in ready:
+            del remaining[index]
+    return tuple(stages)
+
+
+def validate_definition(definition: Optional[Dict[str, Any]]) -> None:
+    """保存前检查 definition 能否编译；不合法时抛出 ValueError"""
+    for raw in (definition or {}).get("transitions", []):
+        effects = raw.get("effects") or {}
+        try:
+            plan_tool_stages(effects.get("external_tools"), bool(effects.get("parallel_tools")))
+        except ValueError as exc:
+            raise ValueError(f"Transition {raw.get('name')}: {exc}")
+
+
+def compile_workflow(workflow: Workflow) -> CompiledWorkflow:
+    """把 definition 编译为按 (from, name) 与 from 索引的转换表。"""
+    definition = workflow.definition or {}
+    states = WorkflowState.query.filter_by(workflow_id=workflow.id).all()
+    state_ids = {state.name: state.id for state in states}
+
+    by_key: Dict[Tuple[Optional[str], str], CompiledTransition] = {}
+    by_from: Dict[Optional[str], list] = {}
+    for raw in definition.get("transitions", []):
+        name = raw.get("name")
+        if not name:
+            continue
+        effects = raw.get("effects") or {}
+        transition = CompiledTransition(
+            name=name,
+            label=raw.get("label", name),
+            from_state=raw.get("from"),
+            to_state=raw.get("to"),
+            to_state_id=state_ids.get(raw.get("to")),
+            roles=frozenset(raw.get("roles") or []),
+            conditions=raw.get("conditions") or {},
+            effects=effects,
+            tool_stages=plan_tool_stages(effects.get("external_tools"), bool(effects.get("parallel_tools"))),
+        )
+        # 与旧实现保持一致：同一 (from, name) 以首次出现者为准
+        key = (transition.from_state, name)
+        if key in by_key:
+            continue
+        by_key[key] = transition
+        by_from.setdefault(transition.from_state, []).append(transition)
+
+    return CompiledWorkflow(
+        workflow_id=workflow.id,
+        content_hash=definition_hash(definition),
+        by_key=by_key,
+        by_from={state: tuple(items) for state, items in by_from.items()},
+        names=frozenset(name for _, name in by_key),
+        state_ids=state_ids,
+        state_names={state_id: name for name, state_id in state_ids.items()},
+    )
+
+
+class WorkflowCache:
+    """
+    进程内的编译结果缓存
+
+    条目按 (workflow_id, content_hash) 存放；TTL 到期后只重新读取 definition
+    并比较哈希，内容未变时复用已编译结果。update_workflow 会主动失效；
+    提案类型所用的工作流由 update_proposal_type 主动失效。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compiled: Dict[Tuple[int, str], CompiledWorkflow] = {}
+        self._current: Dict[int, Tuple[str, float]] = {}
+        self._type_workflows: Dict[int, Tuple[int, float]] = {}
+
+    def _ttl(self) -> float:
+        return current_app.config.get("WORKFLOW_CACHE_TTL", DEFAULT_CACHE_TTL)
+
+    def workflow_id_for_type(self, proposal_type_id: int) -> Optional[int]:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._type_workflows.get(proposal_type_id)
+        if cached and now - cached[1] < self._ttl():
+            return cached[0]
+        proposal_type = ProposalType.query.get(proposal_type_id)
+        if proposal_type is None:
+            return None
+        with self._lock:
+            self._type_workflows[proposal_type_id] = (proposal_type.workflow_id, now)
+        return proposal_type.workflow_id
+
+    def get(self, workflow_id: int) -> CompiledWorkflow:
+        now = time.monotonic()
+        with self._lock:
+            current = self._current.get(workflow_id)
+            if current and now - current[1] < self._ttl():
+                compiled = self._compiled.get((workflow_id, current[0]))
+                if compiled is not None:
+                    return compiled
+
+        workflow = Workflow.query.get(workflow_id)
+        if workflow is None or workflow.definition is None:
+            raise ValueError("Workflow definition missing.")
+        content_hash = definition_hash(workflow.definition)
+        with self._lock:
+            compiled = self._compiled.get((workflow_id, content_hash))
+        if compiled is None:
+            compiled = compile_workflow(workflow)
+
+        with self._lock:
+            stale = self._current.get(workflow_id)
+            if stale and stale[0] != content_hash:
+                self._compiled.pop((workflow_id, stale[0]), None)
+            self._compiled[(workflow_id, content_hash)] = compiled
+            self._current[workflow_id] = (content_hash, now)
+        return compiled
+
+    def invalidate(self, workflow_id: Optional[int] = None) -> None:
+        with self._lock:
+            if workflow_id is None:
+                self._compiled.clear()
+                self._current.clear()
+                self._type_workflows.clear()
+                return
+            self._current.pop(workflow_id, None)
+            for key in [key for key in self._compiled if key[0] == workflow_id]:
+                del self._compiled[key]
+            for type_id in [
+                type_id for type_id, (wf_id, _) in self._type_workflows.items() if wf_id == workflow_id
+            ]:
+                del self._type_workflows[type_id]
+
+    def invalidate_type(self, proposal_type_id: int) -> None:
+        with self._lock:
+            self._type_workflows.pop(proposal_type_id, None)
+
+
+workflow_cache = WorkflowCache()
+
+
+def invalidate_workflow(workflow_id: Optional[int] = None) -> None:
+    """丢弃某个（或全部）工作流的编译结果。"""
+    workflow_cache.invalidate(workflow_id)
+
+
+def invalidate_proposal_type(proposal_type_id: int) -> None:
+    """丢弃某个提案类型缓存的工作流映射。"""
+    workflow_cache.invalidate_type(proposal_type_id)
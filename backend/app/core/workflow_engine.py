@@ -1,8 +1,21 @@
+from collections import Counter
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
 
 from app import db
-from app.models.models import Proposal, ProposalPhase, ProposalInstrument, WorkflowState, ExternalToolOperation
+from app.core.proposal_counters import apply_deltas
+from app.core.proposal_summary import refresh_summary
+from app.core.workflow_compiler import CompiledTransition, CompiledWorkflow, workflow_cache
+from app.models.models import (
+    ExternalToolOperation,
+    Proposal,
+    ProposalInstrument,
+    ProposalPhase,
+    ProposalSummary,
+    WorkflowState,
+)
 
 
 class WorkflowEngine:
@@ -38,10 +51,40 @@ class WorkflowEngine:
     # public API
     # ------------------------------------------------------------------ #
     def execute_transition(self, proposal_id: int, action_name: str, actor, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        执行单个转换
+
+        外部工具分阶段执行：先写入执行日志（intent）并提交，释放数据库连接后
+        再发出 HTTP 请求，最后重新加锁读取提案、确认状态未被并发修改，在同一事务中
+        写回映射到 proposal.data 的工具输出并应用转换。转换失败时已记录的执行日志
+        仍会保留，工具输出不写回提案。
+        """
+        from app.core.external_tool_executor import ExternalToolExecutor
+
+        context = context or {}
         proposal = Proposal.query.get_or_404(proposal_id)
-        transition = self._find_transition(proposal, action_name, context or {})
+        transition = self._find_transition(proposal, action_name, context)
         self._authorize(transition, actor)
-        self._apply_transition(proposal, transition, context or {}, actor)
+
+        plan = self._transition_plan(proposal, transition, context)
+        executor = ExternalToolExecutor(self.db, autocommit=False)
+        self._run_tool_plans([plan], executor, actor, release_connection=True)
+        if plan["error"] is not None:
+            self.db.commit()
+            raise plan["error"]
+        if plan["released"]:
+            # 先提交工具结果，再在新事务中加锁校验并应用转换
+            self.db.commit()
+            locked, conflicts, facts = self._lock_for_apply([proposal_id], {proposal_id: transition}, actor)
+            if conflicts:
+                raise conflicts[proposal_id]
+            proposal = locked[proposal_id]
+        else:
+            facts = None
+        self._write_tool_data(proposal, plan)
+        self._apply_transition(proposal, transition, context, actor, facts)
+        for operation in plan["async_tools"]:
+            self._enqueue_tool(operation, proposal, context, actor)
         self.db.commit()
         return {
             "status": "success",
@@ -53,76 +96,334 @@ class WorkflowEngine:
     def get_allowed_actions(self, proposal_id: int, actor) -> List[Dict[str, Any]]:
         proposal = Proposal.query.get_or_404(proposal_id)
         workflow = self._load_workflow(proposal)
-        current_state = proposal.current_state.name if proposal.current_state else None
+        current_state = self._current_state_name(proposal, workflow)
         actor_roles = {role.name for role in getattr(actor, "roles", [])}
         allowed: List[Dict[str, Any]] = []
-        for transition in workflow.get("transitions", []):
-            if transition.get("from") != current_state:
+        for transition in workflow.outgoing(current_state):
+            if not transition.allows(actor_roles):
                 continue
-            if not self._has_required_role(transition, actor_roles):
-                continue
-            if not self._evaluate_conditions(transition.get("conditions"), proposal):
+            if not self._evaluate_conditions(transition.conditions, proposal):
                 continue
             allowed.append(
                 {
-                    "name": transition.get("name"),
-                    "label": transition.get("label", transition.get("name")),
-                    "to": transition.get("to"),
+                    "name": transition.name,
+                    "label": transition.label,
+                    "to": transition.to_state,
                 }
             )
         return allowed
 
+    def get_allowed_actions_bulk(self, proposal_ids: Iterable[int], actor) -> Dict[int, List[Dict[str, Any]]]:
+        """
+        批量计算多个提案的可用操作
+
+        提案、阶段与仪器分配各用一次查询预加载，条件在内存中求值；
+        不存在的提案 ID 不会出现在返回结果中。
+        """
+        ids = list(dict.fromkeys(int(pid) for pid in proposal_ids))
+        if not ids:
+            return {}
+        proposals = Proposal.query.filter(Proposal.id.in_(ids)).all()
+        facts = ProposalFacts.preload(ids)
+        actor_roles = {role.name for role in getattr(actor, "roles", [])}
+
+        results: Dict[int, List[Dict[str, Any]]] = {}
+        for proposal in proposals:
+            workflow = self._load_workflow(proposal)
+            current_state = self._current_state_name(proposal, workflow)
+            allowed: List[Dict[str, Any]] = []
+            for transition in workflow.outgoing(current_state):
+                if not transition.allows(actor_roles):
+                    continue
+                if not self._evaluate_conditions(transition.conditions, proposal, facts=facts):
+                    continue
+                allowed.append(
+                    {
+                        "name": transition.name,
+                        "label": transition.label,
+                        "to": transition.to_state,
+                    }
+                )
+            results[proposal.id] = allowed
+        return results
+
+    def execute_transition_bulk(
+        self,
+        proposal_ids: Iterable[int],
+        action_name: str,
+        actor,
+        context: Optional[Dict[str, Any]] = None,
+        chunk_size: Optional[int] = None,
+        fan_out_tools: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        对多个提案执行同一转换
+
+        提案按 chunk_size 分块，每块一个事务；块内每个提案在独立的 SAVEPOINT
+        中应用，失败只回滚该提案。外部工具按配置顺序分轮执行：同一轮内
+        块中所有提案的调用一起发送，fan_out_tools=True 时并发发送。
+
+        Returns:
+            与 proposal_ids 顺序一致的逐提案结果；失败项 status 为 "error"
+        """
+        ids = list(dict.fromkeys(int(pid) for pid in proposal_ids))
+        if chunk_size is None:
+            chunk_size = current_app.config.get("BULK_TRANSITION_CHUNK_SIZE", 50)
+        chunk_size = max(1, int(chunk_size))
+
+        results: List[Dict[str, Any]] = []
+        for offset in range(0, len(ids), chunk_size):
+            chunk = ids[offset:offset + chunk_size]
+            try:
+                results.extend(
+                    self._execute_transition_chunk(chunk, action_name, actor, context or {}, fan_out_tools)
+                )
+                self.db.commit()
+            except Exception as exc:
+                self.db.rollback()
+                results.extend(self._transition_error(pid, action_name, exc) for pid in chunk)
+        return results
+
     # ------------------------------------------------------------------ #
     # internal helpers
     # ------------------------------------------------------------------ #
-    def _load_workflow(self, proposal: Proposal) -> Dict[str, Any]:
-        workflow = proposal.proposal_type.workflow
-        if workflow is None or workflow.definition is None:
+    def _execute_transition_chunk(
+        self,
+        proposal_ids: List[int],
+        action_name: str,
+        actor,
+        context: Dict[str, Any],
+        fan_out_tools: bool,
+    ) -> List[Dict[str, Any]]:
+        proposals = {p.id: p for p in Proposal.query.filter(Proposal.id.in_(proposal_ids)).all()}
+        facts = ProposalFacts.preload(list(proposals), summaries=True)
+
+        outcomes: Dict[int, Dict[str, Any]] = {}
+        plans: List[Dict[str, Any]] = []
+        for pid in proposal_ids:
+            proposal = proposals.get(pid)
+            if proposal is None:
+                outcomes[pid] = self._transition_error(pid, action_name, LookupError("Proposal not found"))
+                continue
+            plan_context = dict(context)
+            try:
+                transition = self._find_transition(proposal, action_name, plan_context, facts)
+                self._authorize(transition, actor)
+            except Exception as exc:
+                outcomes[pid] = self._transition_error(pid, action_name, exc)
+                continue
+            plans.append(self._transition_plan(proposal, transition, plan_context))
+
+        from app.core.external_tool_executor import ExternalToolExecutor
+
+        executor = ExternalToolExecutor(self.db, autocommit=False)
+        self._run_tool_plans(plans, executor, actor, fan_out=fan_out_tools, release_connection=True)
+
+        pending = [plan for plan in plans if plan["error"] is None]
+        if any(plan["released"] for plan in pending):
+            # 发送期间连接已释放：提交工具结果后重新加锁读取，确认状态未被并发修改
+            self.db.commit()
+            _, conflicts, facts = self._lock_for_apply(
+                [plan["proposal"].id for plan in pending],
+                {plan["proposal"].id: plan["transition"] for plan in pending},
+                actor,
+            )
+            for plan in pending:
+                if plan["proposal"].id in conflicts:
+                    plan["error"] = conflicts[plan["proposal"].id]
+
+        # 整块的计数差值合并后按键序一次写入：逐个提案写入时各事务对计数行的加锁顺序交错，
+        # 并发的批量转换可能互相死锁
+        chunk_deltas = Counter()
+        for plan in plans:
+            proposal = plan["proposal"]
+            if plan["error"] is not None:
+                outcomes[proposal.id] = self._transition_error(proposal.id, action_name, plan["error"])
+                continue
+            deltas = Counter()
+            try:
+                with self.db.begin_nested():
+                    self._write_tool_data(proposal, plan)
+                    self._apply_transition(proposal, plan["transition"], plan["context"], actor, facts, deltas)
+                    for operation in plan["async_tools"]:
+                        self._enqueue_tool(operation, proposal, plan["context"], actor)
+            except Exception as exc:
+                outcomes[proposal.id] = self._transition_error(proposal.id, action_name, exc)
+                continue
+            chunk_deltas.update(deltas)
+            outcomes[proposal.id] = {
+                "status": "success",
+                "proposal_id": proposal.id,
+                "action": action_name,
+                "new_state": plan["transition"].to_state,
+            }
+        apply_deltas(self.db, Counter(), chunk_deltas)
+        return [outcomes[pid] for pid in proposal_ids]
+
+    def _transition_plan(
+        self, proposal: Proposal, transition: CompiledTransition, context: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        plan = self._tool_plan(
+            proposal,
+            context,
+            transition.effects.get("external_tools") or [],
+            transition.tool_stages,
+            transition.parallel_tools,
+            state_name=transition.to_state,
+        )
+        plan["transition"] = transition
+        return plan
+
+    def _lock_for_apply(
+        self,
+        proposal_ids: List[int],
+        transitions: Dict[int, CompiledTransition],
+        actor,
+    ) -> Tuple[Dict[int, Proposal], Dict[int, Exception], "ProposalFacts"]:
+        """
+        外部工具调用结束后重新加锁读取提案（SELECT ... FOR UPDATE），并在锁定的行上
+        重新校验转换：状态仍是起始状态、操作者仍有所需角色、阶段与仪器条件仍然满足
+        （context.* 条件由调用方给出，不随并发修改变化，不再重复求值）
+
+        返回 (提案, 冲突, 预加载的阶段与仪器)；冲突为已删除、状态或条件已被并发修改、
+        或操作者失去权限的提案及对应错误。
+        """
+        proposals = {
+            p.id: p
+            for p in Proposal.query.filter(Proposal.id.in_(proposal_ids))
+            .with_for_update()
+            .populate_existing()
+            .all()
+        }
+        facts = ProposalFacts.preload(list(proposals), summaries=True)
+        conflicts = {}
+        for pid in proposal_ids:
+            proposal = proposals.get(pid)
+            transition = transitions[pid]
+            if proposal is None:
+                conflicts[pid] = LookupError("Proposal not found")
+                continue
+            current = self._current_state_name(proposal, self._load_workflow(proposal))
+            if current != transition.from_state:
+                conflicts[pid] = ValueError(
+                    f"Proposal state changed to {current} while external tools were running; "
+                    f"transition {transition.name} not applied."
+                )
+                continue
+            try:
+                self._authorize(transition, actor)
+            except PermissionError as exc:
+                conflicts[pid] = exc
+                continue
+            row_conditions = {
+                key: expected for key, expected in transition.conditions.items() if not key.startswith("context.")
+            }
+            if not self._evaluate_conditions(row_conditions, proposal, facts=facts):
+                conflicts[pid] = ValueError(
+                    f"Transition {transition.name} conditions no longer met after external tools ran; not applied."
+                )
+        return proposals, conflicts, facts
+
+    def _transition_error(self, proposal_id: int, action_name: str, exc: Exception) -> Dict[str, Any]:
+        return {
+            "status": "error",
+            "proposal_id": proposal_id,
+            "action": action_name,
+            "error": str(exc),
+            "error_type": classify_transition_error(exc),
+        }
+
+    def _load_workflow(self, proposal: Proposal) -> CompiledWorkflow:
+        workflow_id = workflow_cache.workflow_id_for_type(proposal.proposal_type_id)
+        if workflow_id is None:
             raise ValueError("Workflow definition missing.")
-        return workflow.definition
+        return workflow_cache.get(workflow_id)
 
-    def _find_transition(self, proposal: Proposal, action_name: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    def _current_state_name(self, proposal: Proposal, workflow: CompiledWorkflow) -> Optional[str]:
+        if proposal.current_state_id is None:
+            return None
+        name = workflow.state_names.get(proposal.current_state_id)
+        if name is None and proposal.current_state:
+            name = proposal.current_state.name
+        return name
+
+    def _find_transition(
+        self,
+        proposal: Proposal,
+        action_name: str,
+        context: Dict[str, Any],
+        facts: Optional["ProposalFacts"] = None,
+    ) -> CompiledTransition:
         workflow = self._load_workflow(proposal)
-        current_state = proposal.current_state.name if proposal.current_state else None
-        for transition in workflow.get("transitions", []):
-            if transition.get("name") != action_name:
-                continue
-            if transition.get("from") != current_state:
+        current_state = self._current_state_name(proposal, workflow)
+        transition = workflow.find(current_state, action_name)
+        if transition is None:
+            if action_name in workflow.names:
                 raise ValueError(f"Transition {action_name} invalid from {current_state}")
-            if not self._evaluate_conditions(transition.get("conditions"), proposal, context):
-                raise ValueError(f"Transition {action_name} conditions unmet.")
-            return transition
-        raise ValueError(f"Action {action_name} not defined in workflow.")
-
-    def _authorize(self, transition: Dict[str, Any], actor) -> None:
-        roles_required = transition.get("roles") or []
-        if not roles_required:
+            raise ValueError(f"Action {action_name} not defined in workflow.")
+        if not self._evaluate_conditions(transition.conditions, proposal, context, facts):
+            raise ValueError(f"Transition {action_name} conditions unmet.")
+        return transition
+
+    def _authorize(self, transition: CompiledTransition, actor) -> None:
+        if not transition.roles:
             return
         actor_roles = {role.name for role in getattr(actor, "roles", [])}
-        if actor_roles.isdisjoint(roles_required):
+        if not transition.allows(actor_roles):
             raise PermissionError("Insufficient role to execute transition.")
 
-    def _apply_transition(self, proposal: Proposal, transition: Dict[str, Any], context: Dict[str, Any], actor=None) -> None:
-        target_state_name = transition.get("to")
-        if target_state_name is None:
+    def _apply_transition(
+        self,
+        proposal: Proposal,
+        transition: CompiledTransition,
+        context: Dict[str, Any],
+        actor=None,
+        facts: Optional["ProposalFacts"] = None,
+        deltas: Optional[Counter] = None,
+    ) -> None:
+        """写入目标状态并应用 effects；外部工具已由调用方在此之前执行（deltas 见 refresh_summary）"""
+        if transition.to_state is None:
             raise ValueError("Transition target state missing.")
-        target_state = WorkflowState.query.filter_by(
-            workflow_id=proposal.proposal_type.workflow_id, name=target_state_name
-        ).first()
+        target_state = None
+        if transition.to_state_id is not None:
+            target_state = WorkflowState.query.get(transition.to_state_id)
         if target_state is None:
-            raise ValueError(f"Workflow state {target_state_name} not found.")
+            target_state = WorkflowState.query.filter_by(
+                workflow_id=proposal.proposal_type.workflow_id, name=transition.to_state
+            ).first()
+        if target_state is None:
+            raise ValueError(f"Workflow state {transition.to_state} not found.")
         proposal.current_state = target_state
-        self._apply_effects(proposal, transition.get("effects") or {}, context, actor)
+        self._apply_effects(proposal, transition.effects, context, actor, facts)
+        # 读模型与转换在同一事务中更新
+        if facts is not None:
+            refresh_summary(
+                self.db, proposal, facts.phases_of(proposal.id), facts.instruments_of(proposal.id), deltas
+            )
+        else:
+            refresh_summary(self.db, proposal, deltas=deltas)
 
-    def _apply_effects(self, proposal: Proposal, effects: Dict[str, Any], context: Dict[str, Any], actor=None) -> None:
+    def _apply_effects(
+        self,
+        proposal: Proposal,
+        effects: Dict[str, Any],
+        context: Dict[str, Any],
+        actor=None,
+        facts: Optional["ProposalFacts"] = None,
+    ) -> None:
         if not effects:
             return
         now = datetime.utcnow()
         if phase_name := effects.get("phase"):
-            phase = proposal.phases.filter_by(phase=phase_name).first()
+            if facts is not None:
+                phase = facts.phase(proposal.id, phase_name)
+            else:
+                phase = proposal.phases.filter_by(phase=phase_name).first()
             if not phase:
                 phase = ProposalPhase(proposal=proposal, phase=phase_name)
                 self.db.add(phase)
+                if facts is not None:
+                    facts.add_phase(proposal.id, phase)
             if status := effects.get("set_phase_status"):
                 phase.status = status
             if effects.get("record_submission_time"):
@@ -130,9 +431,14 @@ class WorkflowEngine:
             if effects.get("record_confirmation_time"):
                 phase.confirmed_at = now
         if instrument_effect := effects.get("instrument"):
-            assignment = proposal.instruments.filter_by(
-                instrument_id=instrument_effect.get("instrument_id"), phase=instrument_effect.get("phase", "phase1")
-            ).first()
+            if facts is not None:
+                assignment = facts.instrument(
+                    proposal.id, instrument_effect.get("instrument_id"), instrument_effect.get("phase", "phase1")
+                )
+            else:
+                assignment = proposal.instruments.filter_by(
+                    instrument_id=instrument_effect.get("instrument_id"), phase=instrument_effect.get("phase", "phase1")
+                ).first()
             if assignment:
                 if status := instrument_effect.get("set_status"):
                     assignment.status = status
@@ -144,111 +450,265 @@ class WorkflowEngine:
                     assignment.confirmed_at = now
                 if instrument_effect.get("record_applicant_confirm_time"):
                     assignment.applicant_confirmed_at = now
-        
-        # 执行外部工具调用
-        if external_tools := effects.get("external_tools"):
-            self._execute_external_tools(external_tools, proposal, context, actor)
-    
-    def _execute_external_tools(
+
+    def _tool_plan(
         self,
-        tool_configs: List[Dict[str, Any]],
         proposal: Proposal,
         context: Dict[str, Any],
-        actor=None
-    ) -> None:
+        tool_configs: List[Dict[str, Any]],
+        stages: Tuple[Tuple[int, ...], ...],
+        parallel: bool,
+        state_name: Optional[str] = None,
+    ) -> Dict[str, Any]:
         """
-        执行外部工具调用
+        一次转换的外部工具执行计划
         
         tool_configs 格式：
         [
             {
                 "operation_id": 1,  # ExternalToolOperation ID
+                "key": "visibility",  # 可选，供 depends_on 引用，缺省为 operation_id
+                "depends_on": [],   # 可选，并行模式下需先完成的工具
                 "async": false,     # 是否异步执行
                 "on_failure": "continue"  # continue | abort | retry
             }
         ]
         
-        对于验证类工具，如果验证失败且配置为阻止转换，将抛出 ValidationError
+        effects.parallel_tools 为 true 时，互不依赖的工具在同一轮内并发调用，
+        转换耗时约为各轮最大延迟之和而非全部延迟之和。
+        对于验证类工具，如果验证失败且配置为阻止转换，错误记录在 plan["error"]
         """
-        from app.core.external_tool_executor import ExternalToolExecutor
-        
-        executor = ExternalToolExecutor(self.db)
-        validation_errors = []  # 收集所有验证错误
+        return {
+            "proposal": proposal,
+            "context": context,
+            "tool_configs": tool_configs,
+            "stages": stages,
+            "parallel": parallel,
+            "state_name": state_name,
+            "validation_errors": [],  # 收集所有验证错误
+            "async_tools": [],
+            "error": None,
+            "released": False,  # 是否为发送请求提交过事务（之后需重新加锁校验）
+            "proposal_data": {},  # 映射到 proposal.data 的工具输出，校验通过后与转换一起写回
+        }
+
+    def _write_tool_data(self, proposal: Proposal, plan: Dict[str, Any]) -> None:
+        if plan["proposal_data"]:
+            proposal.data = {**(proposal.data or {}), **plan["proposal_data"]}
+
+    def _run_tool_plans(
+        self,
+        plans: List[Dict[str, Any]],
+        executor,
+        actor,
+        fan_out: bool = False,
+        release_connection: bool = False,
+    ) -> None:
+        """
+        按轮次执行一个或多个提案的外部工具
+
+        第 k 轮准备每个提案第 k 轮的调用并一起发送：fan_out 时所有调用并发，
+        否则每个提案的调用依次发送（并行模式的提案内部仍并发）。结果按配置
+        顺序并入各自的 context，后续轮次因此能读取前序输出。阻止转换的错误
+        记录在 plan["error"]，该提案不再执行后续轮次。
+
+        release_connection 时，每轮准备完成后先提交事务（执行日志以 running
+        状态落库），发送期间不占用数据库连接与行锁；complete 阶段只 flush。
+        """
+        rounds = max((len(plan["stages"]) for plan in plans), default=0)
+        for index in range(rounds):
+            batch = []
+            for plan in plans:
+                if plan["error"] is not None or index >= len(plan["stages"]):
+                    continue
+                for tool_index in plan["stages"][index]:
+                    if plan["error"] is not None:
+                        break
+                    entry = self._prepare_tool_call(executor, plan, plan["tool_configs"][tool_index], actor)
+                    if entry is not None:
+                        batch.append(entry)
+
+            if release_connection and batch:
+                self.db.commit()
+                for plan in plans:
+                    plan["released"] = True
+
+            if fan_out:
+                executor.send_all([call for _, _, _, call in batch])
+            else:
+                for plan in plans:
+                    calls = [call for owner, _, _, call in batch if owner is plan]
+                    executor.send_all(calls, None if plan["parallel"] else 1)
+
+            for plan, operation, tool_config, call in batch:
+                result, error = None, None
+                try:
+                    result = executor.complete(call)
+                except Exception as e:
+                    error = e
+                if plan["error"] is not None:
+                    continue
+                try:
+                    self._handle_tool_outcome(
+                        operation, tool_config, plan["context"], plan["validation_errors"], result, error
+                    )
+                except Exception as blocking:
+                    plan["error"] = blocking
+
+        for plan in plans:
+            if plan["error"] is None:
+                try:
+                    self._raise_validation_errors(plan["validation_errors"])
+                except ValueError as exc:
+                    plan["error"] = exc
+
+    def _prepare_tool_call(self, executor, plan: Dict[str, Any], tool_config: Dict[str, Any], actor):
+        operation_id = tool_config.get("operation_id")
+        if not operation_id:
+            return None
         
-        for tool_config in tool_configs:
-            operation_id = tool_config.get("operation_id")
-            if not operation_id:
-                continue
-            
-            # 检查操作是否存在
-            operation = ExternalToolOperation.query.get(operation_id)
+        # 检查操作是否存在
+        operation = ExternalToolOperation.query.get(operation_id)
+        try:
             if not operation or not operation.tool.is_active:
-                on_failure = tool_config.get("on_failure", "continue")
-                if on_failure == "abort":
-                    raise ValueError(f"External tool operation {operation_id} not found or inactive")
-                # 对于验证类工具，服务不可用可能也需要阻止
-                if operation and operation.tool_type == 'validation':
-                    validation_config = operation.validation_config or {}
-                    if validation_config.get('block_on_service_error', False):
-                        raise ValueError(
-                            f"Validation tool '{operation.name}' is unavailable. "
-                            f"Please try again later or contact support."
-                        )
-                continue
+                self._handle_unavailable_tool(operation_id, operation, tool_config)
+                return None
             
+            # async=True 的工具写入任务队列，由 worker 在事务提交后执行
+            if self._runs_async(operation, tool_config):
+                plan["async_tools"].append(operation)
+                return None
+        except Exception as blocking:
+            plan["error"] = blocking
+            return None
+        
+        try:
+            call = executor.prepare(
+                operation_id=operation_id,
+                proposal=plan["proposal"],
+                context=plan["context"],
+                actor=actor,
+                triggered_by="workflow_transition",
+                state_name=plan["state_name"],
+                proposal_data=plan["proposal_data"],
+            )
+        except Exception as e:
             try:
-                # TODO: 如果 async=True，应该使用任务队列（如 Celery）
-                # 目前实现同步调用
-                result = executor.execute(
-                    operation_id=operation_id,
-                    proposal=proposal,
-                    context=context,
-                    actor=actor,
-                    triggered_by=f"workflow_transition"
+                self._handle_tool_outcome(
+                    operation, tool_config, plan["context"], plan["validation_errors"], error=e
                 )
-                
-                # 处理验证失败
-                if result.get('status') == 'validation_failed':
-                    if result.get('block_transition', True):
-                        # 验证失败且配置为阻止转换
-                        error_msg = result.get('error', 'Validation failed')
-                        validation_errors.append({
-                            'tool': operation.name,
-                            'error': error_msg,
-                            'response': result.get('response'),
-                        })
-                    else:
-                        # 验证失败但不阻止，记录到 context
-                        context.setdefault('validation_warnings', []).append({
-                            'tool': operation.name,
-                            'error': result.get('error'),
-                        })
-                
-                # 处理服务错误
-                elif result.get('status') == 'service_error':
-                    if result.get('block_transition', False):
-                        raise ValueError(
-                            f"External tool '{operation.name}' is unavailable: {result.get('error')}. "
-                            f"Please try again later."
-                        )
-                    # 服务错误但不阻止，记录到 context
-                    context.setdefault('tool_errors', []).append({
+            except Exception as blocking:
+                plan["error"] = blocking
+            return None
+        return plan, operation, tool_config, call
+
+    def _runs_async(self, operation: ExternalToolOperation, tool_config: Dict[str, Any]) -> bool:
+        """
+        是否放入任务队列异步执行
+
+        结果可能阻止转换的验证工具总是同步执行，async 标记对其无效。
+        """
+        from app.core.external_tool_executor import blocks_transition
+
+        return bool(tool_config.get("async")) and not blocks_transition(operation)
+
+    def _enqueue_tool(self, operation: ExternalToolOperation, proposal: Proposal, context: Dict[str, Any], actor=None) -> None:
+        from app.core.job_queue import enqueue_tool_execution
+
+        job = enqueue_tool_execution(
+            operation,
+            proposal=proposal,
+            context=context,
+            actor=actor,
+            triggered_by="workflow_transition",
+            session=self.db,
+        )
+        context.setdefault('queued_tools', []).append({
+            'tool': operation.name,
+            'job_id': job.id,
+            'execution_id': job.execution_id,
+        })
+
+    def _handle_unavailable_tool(self, operation_id, operation, tool_config: Dict[str, Any]) -> None:
+        """操作不存在或已停用；需要阻止转换时抛出 ValueError"""
+        on_failure = tool_config.get("on_failure", "continue")
+        if on_failure == "abort":
+            raise ValueError(f"External tool operation {operation_id} not found or inactive")
+        # 对于验证类工具，服务不可用可能也需要阻止
+        if operation and operation.tool_type == 'validation':
+            validation_config = operation.validation_config or {}
+            if validation_config.get('block_on_service_error', False):
+                raise ValueError(
+                    f"Validation tool '{operation.name}' is unavailable. "
+                    f"Please try again later or contact support."
+                )
+
+    def _handle_tool_outcome(
+        self,
+        operation: ExternalToolOperation,
+        tool_config: Dict[str, Any],
+        context: Dict[str, Any],
+        validation_errors: List[Dict[str, Any]],
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """把单个工具的执行结果并入 context / validation_errors"""
+        try:
+            if error is not None:
+                raise error
+            
+            # 处理验证失败
+            if result.get('status') == 'validation_failed':
+                if result.get('block_transition', True):
+                    # 验证失败且配置为阻止转换
+                    error_msg = result.get('error', 'Validation failed')
+                    validation_errors.append({
+                        'tool': operation.name,
+                        'error': error_msg,
+                        'response': result.get('response'),
+                    })
+                else:
+                    # 验证失败但不阻止，记录到 context
+                    context.setdefault('validation_warnings', []).append({
                         'tool': operation.name,
                         'error': result.get('error'),
-                        'type': 'service_unavailable',
                     })
+            
+            # 处理服务错误
+            elif result.get('status') == 'service_error':
+                if result.get('block_transition', False):
+                    raise ValueError(
+                        f"External tool '{operation.name}' is unavailable: {result.get('error')}. "
+                        f"Please try again later."
+                    )
+                # 服务错误但不阻止，记录到 context
+                context.setdefault('tool_errors', []).append({
+                    'tool': operation.name,
+                    'error': result.get('error'),
+                    'type': 'service_unavailable',
+                })
+            
+            # 可重试的失败已交给任务队列，记录后继续转换
+            elif result.get('status') == 'pending':
+                context.setdefault('queued_tools', []).append({
+                    'tool': operation.name,
+                    'job_id': result.get('job_id'),
+                    'execution_id': result.get('execution_id'),
+                    'next_attempt_at': result.get('next_attempt_at'),
+                })
+            
+            # 将输出合并到 context
+            if result.get("mapped_output"):
+                context.update(result["mapped_output"])
                 
-                # 将输出合并到 context
-                if result.get("mapped_output"):
-                    context.update(result["mapped_output"])
-                    
-            except Exception as e:
-                on_failure = tool_config.get("on_failure", "continue")
-                if on_failure == "abort":
-                    raise ValueError(f"External tool execution failed: {str(e)}")
-                # continue: 忽略错误继续执行
-                # retry: 已在 executor 中处理
-        
+        except Exception as e:
+            on_failure = tool_config.get("on_failure", "continue")
+            if on_failure == "abort":
+                raise ValueError(f"External tool execution failed: {str(e)}")
+            # continue: 忽略错误继续执行
+            # retry: 已在 executor 中交给任务队列
+
+    def _raise_validation_errors(self, validation_errors: List[Dict[str, Any]]) -> None:
         # 如果有验证错误且需要阻止，抛出异常
         if validation_errors:
             error_messages = [err['error'] for err in validation_errors]
@@ -256,20 +716,34 @@ class WorkflowEngine:
                 f"Validation failed:\n" + "\n".join(f"- {msg}" for msg in error_messages)
             )
 
-    def _evaluate_conditions(self, conditions: Dict[str, Any], proposal: Proposal, context: Optional[Dict[str, Any]] = None) -> bool:
+    def _evaluate_conditions(
+        self,
+        conditions: Dict[str, Any],
+        proposal: Proposal,
+        context: Optional[Dict[str, Any]] = None,
+        facts: Optional["ProposalFacts"] = None,
+    ) -> bool:
         if not conditions:
             return True
         context = context or {}
         for key, expected in conditions.items():
             if key == "phase_status":
-                phase = proposal.phases.filter_by(phase=expected.get("phase")).first()
+                if facts is not None:
+                    phase = facts.phase(proposal.id, expected.get("phase"))
+                else:
+                    phase = proposal.phases.filter_by(phase=expected.get("phase")).first()
                 if not phase or phase.status != expected.get("status"):
                     return False
             elif key == "instrument_status":
-                assignment = proposal.instruments.filter_by(
-                    instrument_id=expected.get("instrument_id"),
-                    phase=expected.get("phase", "phase1"),
-                ).first()
+                if facts is not None:
+                    assignment = facts.instrument(
+                        proposal.id, expected.get("instrument_id"), expected.get("phase", "phase1")
+                    )
+                else:
+                    assignment = proposal.instruments.filter_by(
+                        instrument_id=expected.get("instrument_id"),
+                        phase=expected.get("phase", "phase1"),
+                    ).first()
                 if not assignment or assignment.status != expected.get("status"):
                     return False
             elif key.startswith("context."):
@@ -280,8 +754,76 @@ class WorkflowEngine:
                 return False
         return True
 
-    def _has_required_role(self, transition: Dict[str, Any], actor_roles: set) -> bool:
-        roles_required = transition.get("roles") or []
-        if not roles_required:
-            return True
-        return not actor_roles.isdisjoint(set(roles_required))
\ No newline at end of file
+
+def classify_transition_error(exc: Exception) -> str:
+    """把转换异常归类为 API 返回的 error_type"""
+    if isinstance(exc, PermissionError):
+        return "permission_denied"
+    if isinstance(exc, LookupError):
+        return "not_found"
+    if isinstance(exc, ValueError):
+        message = str(exc)
+        if 'Validation failed' in message or 'validation' in message.lower():
+            return "validation_failed"
+        return "workflow_error"
+    return "internal_error"
+
+
+class ProposalFacts:
+    """预加载的阶段与仪器分配，供批量条件求值使用。"""
+
+    def __init__(self):
+        self._phases: Dict[Tuple[int, str], ProposalPhase] = {}
+        self._instruments: Dict[Tuple[int, int, str], ProposalInstrument] = {}
+        self._by_proposal: Dict[int, Dict[str, List]] = {}
+        # 持有读模型行的引用，refresh_summary 中的 session.get 命中身份映射
+        self._summaries: List[ProposalSummary] = []
+
+    def _entries(self, proposal_id: int) -> Dict[str, List]:
+        return self._by_proposal.setdefault(proposal_id, {"phases": [], "instruments": []})
+
+    @classmethod
+    def preload(cls, proposal_ids: List[int], summaries: bool = False) -> "ProposalFacts":
+        facts = cls()
+        if not proposal_ids:
+            return facts
+        phases = (
+            ProposalPhase.query.filter(ProposalPhase.proposal_id.in_(proposal_ids))
+            .order_by(ProposalPhase.id)
+            .all()
+        )
+        for phase in phases:
+            facts._phases.setdefault((phase.proposal_id, phase.phase), phase)
+            facts._entries(phase.proposal_id)["phases"].append(phase)
+        assignments = (
+            ProposalInstrument.query.filter(ProposalInstrument.proposal_id.in_(proposal_ids))
+            .order_by(ProposalInstrument.id)
+            .all()
+        )
+        for assignment in assignments:
+            key = (assignment.proposal_id, assignment.instrument_id, assignment.phase)
+            facts._instruments.setdefault(key, assignment)
+            facts._entries(assignment.proposal_id)["instruments"].append(assignment)
+        if summaries:
+            facts._summaries = ProposalSummary.query.filter(ProposalSummary.proposal_id.in_(proposal_ids)).all()
+        return facts
+
+    def add_phase(self, proposal_id: int, phase: ProposalPhase) -> None:
+        self._phases[(proposal_id, phase.phase)] = phase
+        self._entries(proposal_id)["phases"].append(phase)
+
+    def phases_of(self, proposal_id: int) -> List[ProposalPhase]:
+        return self._entries(proposal_id)["phases"]
+
+    def instruments_of(self, proposal_id: int) -> List[ProposalInstrument]:
+        return self._entries(proposal_id)["instruments"]
+
+    def phase(self, proposal_id: int, phase_name: Optional[str]) -> Optional[ProposalPhase]:
+        return self._phases.get((proposal_id, phase_name))
+
+    def instrument(self, proposal_id: int, instrument_id: Any, phase_name: str) -> Optional[ProposalInstrument]:
+        try:
+            instrument_id = int(instrument_id)
+        except (TypeError, ValueError):
+            return None
+        return self._instruments.get((proposal_id, instrument_id, phase_name))
@@ -139,6 +139,58 @@ class Proposal(db.Model):
     state_history = db.relationship(
         "ProposalStateHistory", backref="proposal", lazy="dynamic", cascade="all, delete-orphan"
     )
+    summary = db.relationship(
+        "ProposalSummary", backref="proposal", uselist=False, cascade="all, delete-orphan"
+    )
+    __table_args__ = (
+        # 提案列表的键集分页：按 (timestamp, id) 排序，以及申请人只看自己的提案
+        db.Index("ix_proposal_timestamp_id", "timestamp", "id"),
+        db.Index("ix_proposal_user_id_id", "user_id", "id"),
+    )
+
+
+class ProposalSummary(db.Model):
+    """
+    提案列表的读模型（每个提案一行）
+
+    当前状态、类型、季度以及各阶段 / 仪器分配的状态冗余存储于此，列表与调度队列
+    不再关联五张表。由 app.core.proposal_summary.refresh_summary 在修改提案的同一事务
+    中更新，flask rebuild-summaries 可整体重建。
+    """
+    proposal_id = db.Column(db.Integer, db.ForeignKey("proposal.id"), primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(140), nullable=False)
+    abstract = db.Column(db.Text)
+    timestamp = db.Column(db.DateTime)
+    state_id = db.Column(db.Integer)
+    state_name = db.Column(db.String(64), index=True)
+    proposal_type_id = db.Column(db.Integer, index=True)
+    proposal_type_name = db.Column(db.String(64))
+    season_id = db.Column(db.Integer, index=True)
+    # [{"phase", "status", "submitted_at"}]，按阶段 id 排序
+    phases = db.Column(db.JSON, default=list)
+    # [{"instrument", "status", "phase", "confirmed_at"}]，按分配 id 排序
+    instruments = db.Column(db.JSON, default=list)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (
+        db.Index("ix_proposal_summary_timestamp_id", "timestamp", "proposal_id"),
+        db.Index("ix_proposal_summary_user_id_id", "user_id", "proposal_id"),
+    )
+
+
+class ProposalCounter(db.Model):
+    """
+    仪表盘聚合计数（按季度、维度与取值）
+
+    dimension 为 state / proposal_type / instrument / phase_status / instrument_status，
+    phase_status 与 instrument_status 的 key 形如 "phase1:submitted"、"MCI:pending"；
+    season_id 为 0 表示提案类型未关联季度。随 ProposalSummary 在同一事务中增量更新，
+    flask reconcile-counters 用 GROUP BY 重新计算。
+    """
+    season_id = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    dimension = db.Column(db.String(32), primary_key=True)
+    key = db.Column(db.String(140), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
 
 
 class ProposalStateHistory(db.Model):
@@ -212,6 +264,9 @@ class ProposalInstrument(db.Model):
     __table_args__ = (
         db.UniqueConstraint("proposal_id", "instrument_id", "phase", name="uq_proposal_instrument"),
         db.Index("ix_proposal_instrument_queue", "instrument_id", "phase", "status"),
+        # 调度队列按分配 id 的键集分页
+        db.Index("ix_proposal_instrument_queue_id", "instrument_id", "phase", "status", "id"),
+        db.Index("ix_proposal_instrument_instrument_id_id", "instrument_id", "id"),
     )
 
 
@@ -248,6 +303,32 @@ class ExternalTool(db.Model):
     auth_type = db.Column(db.String(32), default="none")  # none, api_key, bearer, basic, oauth2
     auth_config = db.Column(db.JSON, default=dict)  # 认证详细配置（加密存储）
     
+    # 运行配置
+    config = db.Column(db.JSON, default=dict)
+    # config 格式：
+    # {
+    #   "http": {  # 连接池设置，修改后会重建该工具的 HTTP 会话
+    #     "pool_connections": 4,
+    #     "pool_maxsize": 16,
+    #     "pool_block": false,
+    #     "keep_alive": true,
+    #     "max_concurrency": 64  # asyncio 引擎下该工具的并发请求上限
+    #   },
+    #   "circuit_breaker": {  # 熔断器（按工具开启，默认关闭），状态在本机各进程间共享
+    #     "enabled": true,
+    #     "failure_threshold": 5,
+    #     "recovery_timeout": 30,
+    #     "half_open_max_calls": 1
+    #   },
+    #   "rate_limit": {  # 令牌桶限流，状态在本机各进程间共享
+    #     "rate": 10,  # 每秒请求数
+    #     "burst": 20,
+    #     "max_wait": 10,  # 排队等待令牌的最长秒数
+    #     "max_queue": 100,
+    #     "reject": false  # true 时不排队，没有令牌立即拒绝
+    #   }
+    # }
+    
     # 元数据
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -300,6 +381,22 @@ class ExternalToolOperation(db.Model):
     #   ],
     #   "error_message_template": "Target is not visible: {response.reason}"  # 错误消息模板
     # }
+
+    # 响应缓存（按需开启，适用于幂等的查询/校验类操作）
+    cache_config = db.Column(db.JSON, default=dict)
+    # cache_config 格式：{"enabled": true, "ttl": 300, "coalesce": true}
+
+    # 批量请求：窗口内（或攒满 max_size 个）的调用合并为一次上游请求，响应按条目拆回各调用
+    batch_config = db.Column(db.JSON, default=dict)
+    # batch_config 格式：
+    # {
+    #   "enabled": true,
+    #   "max_size": 100,
+    #   "window": 5,  # 秒；异步任务按窗口对齐执行时间，同一窗口内的任务一起发送
+    #   "items_field": "targets",  # 请求体中放置各调用请求体（input_mapping.body）列表的字段
+    #   "response_items": "response.results",  # 响应中与请求条目对应的结果列表
+    #   "match_on": "proposal_id"  # 可选：按该字段匹配结果与请求条目，缺省按顺序对应
+    # }
     
     __table_args__ = (
         db.UniqueConstraint("tool_id", "operation_id", name="uq_tool_operation"),
@@ -329,11 +426,19 @@ class ExternalToolExecution(db.Model):
     response_status = db.Column(db.Integer)
     response_headers = db.Column(db.JSON, default=dict)
     response_body = db.Column(db.JSON, default=dict)
+    response_ms = db.Column(db.Float)  # 请求发出到收到响应的耗时（毫秒），不含限流与排队等待
+
+    # 去重存储：内容写入 ExternalToolBlob 后上面三列置空，只保留内容哈希（读取见 execution_log.execution_body）
+    request_body_hash = db.Column(db.String(64), index=True)
+    response_headers_hash = db.Column(db.String(64), index=True)
+    response_body_hash = db.Column(db.String(64), index=True)
     
     # 执行状态
-    status = db.Column(db.String(32), default="pending")  # pending, running, success, failed, retrying
+    status = db.Column(db.String(32), default="pending")  # pending, queued, running, success, failed, retrying
     error_message = db.Column(db.Text)
     retry_count = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime)  # retrying 状态下计划的下一次尝试时间
+    cache_hit = db.Column(db.Boolean, default=False)  # 响应来自缓存，未实际请求外部服务
     
     # 时间戳
     started_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -343,3 +448,73 @@ class ExternalToolExecution(db.Model):
     operation = db.relationship("ExternalToolOperation", backref="executions")
     proposal = db.relationship("Proposal", backref="tool_executions")
     actor = db.relationship("User", backref="tool_executions")
+
+    __table_args__ = (
+        db.Index("ix_external_tool_execution_started_at", "started_at"),
+    )
+
+
+class ExternalToolBlob(db.Model):
+    """
+    执行日志请求/响应内容的去重存储
+    按原始内容的 SHA-256 寻址，相同的内容只存一份
+    """
+    hash = db.Column(db.String(64), primary_key=True)
+    content = db.Column(db.JSON)  # 经 encode_body 编码（截断/压缩）后的内容
+    size = db.Column(db.Integer)  # 原始 JSON 的字节数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 归档后发现已无执行记录引用的时间；宽限期内再次被写入引用时清空（见 execution_archive._prune_blobs）
+    orphaned_at = db.Column(db.DateTime, index=True)
+
+
+class ExternalToolJob(db.Model):
+    """
+    外部工具异步执行任务
+    由本机 worker 池（flask tool-worker）认领执行，无需外部消息代理
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    execution_id = db.Column(db.Integer, db.ForeignKey("external_tool_execution.id"), nullable=False)
+    operation_id = db.Column(db.Integer, db.ForeignKey("external_tool_operation.id"), nullable=False)
+    proposal_id = db.Column(db.Integer, db.ForeignKey("proposal.id"))
+    actor_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+    triggered_by = db.Column(db.String(140))
+    context = db.Column(db.JSON, default=dict)
+
+    # 调度状态
+    status = db.Column(db.String(32), default="queued")  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+
+    # 租约：worker 认领后在 lease_expires_at 之前独占；过期后可被其他 worker 重新认领
+    lease_owner = db.Column(db.String(64))
+    lease_expires_at = db.Column(db.DateTime)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    execution = db.relationship("ExternalToolExecution", backref=db.backref("job", uselist=False))
+    operation = db.relationship("ExternalToolOperation")
+
+    __table_args__ = (
+        db.Index("ix_external_tool_job_claim", "status", "run_after"),
+    )
+
+
+class ExternalToolExecutionArchive(db.Model):
+    """
+    已归档执行日志的索引
+    记录本体按月追加在 EXECUTION_ARCHIVE_DIR 下的 JSONL.gz 文件中（flask archive-executions）
+    """
+    execution_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    operation_id = db.Column(db.Integer, index=True)
+    proposal_id = db.Column(db.Integer, index=True)
+    actor_id = db.Column(db.Integer)
+    status = db.Column(db.String(32))
+    started_at = db.Column(db.DateTime)
+
+    # 所在文件与 gzip 成员的起始偏移，查询时只解压该成员
+    archive_file = db.Column(db.String(64), nullable=False)
+    member_offset = db.Column(db.BigInteger, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
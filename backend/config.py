@@ -11,4 +11,56 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     # Redis is disabled for now
     REDIS_URL = None
-
+    # 编译后工作流定义 / 外部工具映射的进程内缓存，到期后重新核对内容哈希
+    WORKFLOW_CACHE_TTL = int(os.environ.get('WORKFLOW_CACHE_TTL', 60))
+    TOOL_MAPPING_CACHE_TTL = int(os.environ.get('TOOL_MAPPING_CACHE_TTL', 60))
+    # 批量转换每个事务处理的提案数，以及外部工具并发发送的线程数
+    BULK_TRANSITION_CHUNK_SIZE = int(os.environ.get('BULK_TRANSITION_CHUNK_SIZE', 50))
+    EXTERNAL_TOOL_MAX_WORKERS = int(os.environ.get('EXTERNAL_TOOL_MAX_WORKERS', 8))
+    # 阻止型验证工具不能延后重试：当场最多重试的次数（不超过操作的 max_retries）与单次等待上限（秒）；
+    # 其余操作的重试交给任务队列
+    EXTERNAL_TOOL_INLINE_RETRIES = int(os.environ.get('EXTERNAL_TOOL_INLINE_RETRIES', 2))
+    EXTERNAL_TOOL_INLINE_RETRY_MAX_DELAY = float(os.environ.get('EXTERNAL_TOOL_INLINE_RETRY_MAX_DELAY', 2.0))
+    # 外部工具异步任务队列（flask tool-worker）
+    JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', 4))
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+    JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', 300))
+    # 任务遇到数据库等基础设施错误时的最多尝试次数；外部服务失败的重试次数由操作的 retry_config 决定
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+    JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', 30))
+    # 外部工具发送引擎：threads（requests + 线程池）或 asyncio（httpx，需安装 async 可选依赖）
+    EXTERNAL_TOOL_ENGINE = os.environ.get('EXTERNAL_TOOL_ENGINE', 'threads')
+    EXTERNAL_TOOL_ASYNC_CONCURRENCY = int(os.environ.get('EXTERNAL_TOOL_ASYNC_CONCURRENCY', 500))
+    EXTERNAL_TOOL_ASYNC_PER_TOOL = int(os.environ.get('EXTERNAL_TOOL_ASYNC_PER_TOOL', 64))
+    JOB_ASYNC_BATCH = int(os.environ.get('JOB_ASYNC_BATCH', 200))
+    # 外部工具响应缓存：memory（进程内）或 host（本机多进程共享，存于 HOST_STATE_PATH）
+    TOOL_CACHE_BACKEND = os.environ.get('TOOL_CACHE_BACKEND', 'memory')
+    TOOL_CACHE_MAX_ENTRIES = int(os.environ.get('TOOL_CACHE_MAX_ENTRIES', 1024))
+    HOST_STATE_PATH = os.environ.get('HOST_STATE_PATH') or os.path.join(basedir, 'instance', 'host_state.db')
+    # 并发相同请求的合并：process（进程内）、host（本机多进程，经 HOST_STATE_PATH）或 off
+    TOOL_COALESCE_MODE = os.environ.get('TOOL_COALESCE_MODE', 'process')
+    # host 模式下结果保留多久供请求进行中加入的等待进程读取；之后才到达的请求不会拿到该结果
+    TOOL_COALESCE_RESULT_TTL = float(os.environ.get('TOOL_COALESCE_RESULT_TTL', 2.0))
+    # 外部工具执行日志：sync（逐条写入）或 buffered（后台批量写入；转换中的验证工具仍同步写入）
+    EXTERNAL_TOOL_LOG_MODE = os.environ.get('EXTERNAL_TOOL_LOG_MODE', 'sync')
+    EXTERNAL_TOOL_LOG_BATCH_SIZE = int(os.environ.get('EXTERNAL_TOOL_LOG_BATCH_SIZE', 100))
+    EXTERNAL_TOOL_LOG_FLUSH_INTERVAL = float(os.environ.get('EXTERNAL_TOOL_LOG_FLUSH_INTERVAL', 1.0))
+    EXTERNAL_TOOL_LOG_QUEUE_SIZE = int(os.environ.get('EXTERNAL_TOOL_LOG_QUEUE_SIZE', 10000))
+    # 请求/响应体超过该字节数时只保留预览（0 为不截断）；可选 gzip 压缩较大的内容
+    EXTERNAL_TOOL_LOG_MAX_BODY = int(os.environ.get('EXTERNAL_TOOL_LOG_MAX_BODY', 0))
+    EXTERNAL_TOOL_LOG_COMPRESS = os.environ.get('EXTERNAL_TOOL_LOG_COMPRESS', 'false').lower() in ('1', 'true', 'yes')
+    EXTERNAL_TOOL_LOG_COMPRESS_MIN = int(os.environ.get('EXTERNAL_TOOL_LOG_COMPRESS_MIN', 1024))
+    # 请求/响应内容按哈希去重存入 external_tool_blob，执行记录只保留哈希
+    EXTERNAL_TOOL_LOG_DEDUP = os.environ.get('EXTERNAL_TOOL_LOG_DEDUP', 'true').lower() in ('1', 'true', 'yes')
+    # 执行日志保留期：超过天数的已结束执行由 flask archive-executions 移入按月的压缩归档文件
+    EXECUTION_RETENTION_DAYS = int(os.environ.get('EXECUTION_RETENTION_DAYS', 90))
+    EXECUTION_ARCHIVE_DIR = os.environ.get('EXECUTION_ARCHIVE_DIR') or os.path.join(basedir, 'instance', 'execution_archive')
+    EXECUTION_ARCHIVE_BATCH = int(os.environ.get('EXECUTION_ARCHIVE_BATCH', 1000))
+    # 归档时无引用的内容先打标记，超过该宽限期仍无引用才删除；期间再次被写入引用会清除标记
+    EXECUTION_BLOB_GRACE_SECONDS = int(os.environ.get('EXECUTION_BLOB_GRACE_SECONDS', 3600))
+    # 提案列表的键集分页：只传 cursor 时的每页条数与 limit 上限（下一页游标见 X-Next-Cursor 响应头；
+    # 不传 limit 与 cursor 时返回全部）
+    PROPOSAL_PAGE_SIZE = int(os.environ.get('PROPOSAL_PAGE_SIZE', 100))
+    PROPOSAL_PAGE_SIZE_MAX = int(os.environ.get('PROPOSAL_PAGE_SIZE_MAX', 1000))
+    # 流式导出（/api/proposals/export 与 flask export-proposals）每块读取的提案数
+    PROPOSAL_EXPORT_CHUNK_SIZE = int(os.environ.get('PROPOSAL_EXPORT_CHUNK_SIZE', 500))
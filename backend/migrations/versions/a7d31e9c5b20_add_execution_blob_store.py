@@ -0,0 +1,162 @@
+"""add execution blob store
+
+Revision ID: a7d31e9c5b20
+Revises: f5c8d2a7e931
+Create Date: 2026-10-18 14:05:31.206448
+
+"""
+import base64
+import gzip
+import hashlib
+import json
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d31e9c5b20'
+down_revision = 'f5c8d2a7e931'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+BODY_FIELDS = ('request_body', 'response_headers', 'response_body')
+
+execution = sa.table(
+    'external_tool_execution',
+    sa.column('id', sa.Integer),
+    *[sa.column(field, sa.JSON) for field in BODY_FIELDS],
+    *[sa.column(f'{field}_hash', sa.String) for field in BODY_FIELDS],
+)
+blob = sa.table(
+    'external_tool_blob',
+    sa.column('hash', sa.String),
+    sa.column('content', sa.JSON),
+    sa.column('size', sa.Integer),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+def _raw_value(value):
+    # 与 app.core.execution_log 一致：已压缩的内容按原始 JSON 计算哈希
+    if isinstance(value, dict) and value.get('_encoding') == 'gzip+base64':
+        return json.loads(gzip.decompress(base64.b64decode(value['data'])).decode('utf-8'))
+    return value
+
+
+def _body_hash(value):
+    raw = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str, ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _backfill(conn):
+    """按 id 分批把已有执行记录的内容移入 external_tool_blob，每批一次写入"""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(execution).where(execution.c.id > last_id).order_by(execution.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        contents = {}
+        updates = []
+        for row in rows:
+            update = {'_id': row.id}
+            for field in BODY_FIELDS:
+                value = getattr(row, field)
+                if value is None:
+                    continue
+                raw = _raw_value(value)
+                digest = _body_hash(raw)
+                contents.setdefault(digest, (value, raw))
+                update[f'{field}_hash'] = digest
+            if len(update) > 1:
+                updates.append(update)
+        if not updates:
+            continue
+
+        existing = {
+            digest for (digest,) in conn.execute(
+                sa.select(blob.c.hash).where(blob.c.hash.in_(list(contents)))
+            )
+        }
+        new_blobs = [
+            {
+                'hash': digest,
+                'content': value,
+                'size': len(json.dumps(raw, default=str, ensure_ascii=False).encode('utf-8')),
+                'created_at': datetime.utcnow(),
+            }
+            for digest, (value, raw) in contents.items()
+            if digest not in existing
+        ]
+        if new_blobs:
+            conn.execute(blob.insert(), new_blobs)
+        for update in updates:
+            values = {key: value for key, value in update.items() if key != '_id'}
+            values.update({field: None for field in BODY_FIELDS if f'{field}_hash' in values})
+            conn.execute(execution.update().where(execution.c.id == update['_id']).values(**values))
+
+
+def _restore(conn):
+    """把内容写回执行记录（降级用）"""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(execution).where(execution.c.id > last_id).order_by(execution.c.id).limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        hashes = {getattr(row, f'{field}_hash') for row in rows for field in BODY_FIELDS} - {None}
+        if not hashes:
+            continue
+        contents = dict(conn.execute(sa.select(blob.c.hash, blob.c.content).where(blob.c.hash.in_(list(hashes)))).fetchall())
+        for row in rows:
+            values = {
+                field: contents.get(getattr(row, f'{field}_hash'))
+                for field in BODY_FIELDS
+                if getattr(row, f'{field}_hash')
+            }
+            if values:
+                conn.execute(execution.update().where(execution.c.id == row.id).values(**values))
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('external_tool_blob',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('content', sa.JSON(), nullable=True),
+    sa.Column('size', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    with op.batch_alter_table('external_tool_execution', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('request_body_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('response_headers_hash', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('response_body_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_external_tool_execution_request_body_hash'), ['request_body_hash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_external_tool_execution_response_headers_hash'), ['response_headers_hash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_external_tool_execution_response_body_hash'), ['response_body_hash'], unique=False)
+
+    # ### end Alembic commands ###
+    _backfill(op.get_bind())
+
+
+def downgrade():
+    _restore(op.get_bind())
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('external_tool_execution', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_external_tool_execution_response_body_hash'))
+        batch_op.drop_index(batch_op.f('ix_external_tool_execution_response_headers_hash'))
+        batch_op.drop_index(batch_op.f('ix_external_tool_execution_request_body_hash'))
+        batch_op.drop_column('response_body_hash')
+        batch_op.drop_column('response_headers_hash')
+        batch_op.drop_column('request_body_hash')
+
+    op.drop_table('external_tool_blob')
+    # ### end Alembic commands ###
@@ -0,0 +1,187 @@
+"""add proposal summary read model
+
+Revision ID: d8a2c6f0b514
+Revises: c4f1a9d2e7b3
+Create Date: 2026-10-18 16:48:09.552170
+
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8a2c6f0b514'
+down_revision = 'c4f1a9d2e7b3'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+proposal = sa.table(
+    'proposal',
+    sa.column('id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('title', sa.String),
+    sa.column('abstract', sa.Text),
+    sa.column('timestamp', sa.DateTime),
+    sa.column('current_state_id', sa.Integer),
+    sa.column('proposal_type_id', sa.Integer),
+)
+workflow_state = sa.table('workflow_state', sa.column('id', sa.Integer), sa.column('name', sa.String))
+proposal_type = sa.table(
+    'proposal_type',
+    sa.column('id', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('season_id', sa.Integer),
+)
+proposal_phase = sa.table(
+    'proposal_phase',
+    sa.column('id', sa.Integer),
+    sa.column('proposal_id', sa.Integer),
+    sa.column('phase', sa.String),
+    sa.column('status', sa.String),
+    sa.column('submitted_at', sa.DateTime),
+)
+proposal_instrument = sa.table(
+    'proposal_instrument',
+    sa.column('id', sa.Integer),
+    sa.column('proposal_id', sa.Integer),
+    sa.column('instrument_id', sa.Integer),
+    sa.column('phase', sa.String),
+    sa.column('status', sa.String),
+    sa.column('confirmed_at', sa.DateTime),
+)
+instrument = sa.table('instrument', sa.column('id', sa.Integer), sa.column('code', sa.String))
+summary = sa.table(
+    'proposal_summary',
+    sa.column('proposal_id', sa.Integer),
+    sa.column('user_id', sa.Integer),
+    sa.column('title', sa.String),
+    sa.column('abstract', sa.Text),
+    sa.column('timestamp', sa.DateTime),
+    sa.column('state_id', sa.Integer),
+    sa.column('state_name', sa.String),
+    sa.column('proposal_type_id', sa.Integer),
+    sa.column('proposal_type_name', sa.String),
+    sa.column('season_id', sa.Integer),
+    sa.column('phases', sa.JSON),
+    sa.column('instruments', sa.JSON),
+    sa.column('updated_at', sa.DateTime),
+)
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _backfill(conn):
+    """按 id 分批为已有提案生成读模型行（与 app.core.proposal_summary 的格式一致）"""
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(
+                proposal,
+                workflow_state.c.name.label('state_name'),
+                proposal_type.c.name.label('proposal_type_name'),
+                proposal_type.c.season_id,
+            )
+            .select_from(
+                proposal.outerjoin(workflow_state, proposal.c.current_state_id == workflow_state.c.id).outerjoin(
+                    proposal_type, proposal.c.proposal_type_id == proposal_type.c.id
+                )
+            )
+            .where(proposal.c.id > last_id)
+            .order_by(proposal.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        ids = [row.id for row in rows]
+
+        phases = defaultdict(list)
+        for phase in conn.execute(
+            sa.select(proposal_phase).where(proposal_phase.c.proposal_id.in_(ids)).order_by(proposal_phase.c.id)
+        ):
+            phases[phase.proposal_id].append(
+                {'phase': phase.phase, 'status': phase.status, 'submitted_at': _iso(phase.submitted_at)}
+            )
+        instruments = defaultdict(list)
+        for pi in conn.execute(
+            sa.select(proposal_instrument, instrument.c.code)
+            .select_from(proposal_instrument.join(instrument, proposal_instrument.c.instrument_id == instrument.c.id))
+            .where(proposal_instrument.c.proposal_id.in_(ids))
+            .order_by(proposal_instrument.c.id)
+        ):
+            instruments[pi.proposal_id].append(
+                {'instrument': pi.code, 'status': pi.status, 'phase': pi.phase, 'confirmed_at': _iso(pi.confirmed_at)}
+            )
+
+        now = datetime.utcnow()
+        op.bulk_insert(
+            summary,
+            [
+                {
+                    'proposal_id': row.id,
+                    'user_id': row.user_id,
+                    'title': row.title,
+                    'abstract': row.abstract,
+                    'timestamp': row.timestamp,
+                    'state_id': row.current_state_id,
+                    'state_name': row.state_name,
+                    'proposal_type_id': row.proposal_type_id,
+                    'proposal_type_name': row.proposal_type_name,
+                    'season_id': row.season_id,
+                    'phases': phases[row.id],
+                    'instruments': instruments[row.id],
+                    'updated_at': now,
+                }
+                for row in rows
+            ],
+        )
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('proposal_summary',
+    sa.Column('proposal_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=140), nullable=False),
+    sa.Column('abstract', sa.Text(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('state_id', sa.Integer(), nullable=True),
+    sa.Column('state_name', sa.String(length=64), nullable=True),
+    sa.Column('proposal_type_id', sa.Integer(), nullable=True),
+    sa.Column('proposal_type_name', sa.String(length=64), nullable=True),
+    sa.Column('season_id', sa.Integer(), nullable=True),
+    sa.Column('phases', sa.JSON(), nullable=True),
+    sa.Column('instruments', sa.JSON(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['proposal_id'], ['proposal.id'], ),
+    sa.PrimaryKeyConstraint('proposal_id')
+    )
+    with op.batch_alter_table('proposal_summary', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_proposal_summary_proposal_type_id'), ['proposal_type_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_proposal_summary_season_id'), ['season_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_proposal_summary_state_name'), ['state_name'], unique=False)
+        batch_op.create_index('ix_proposal_summary_timestamp_id', ['timestamp', 'proposal_id'], unique=False)
+        batch_op.create_index('ix_proposal_summary_user_id_id', ['user_id', 'proposal_id'], unique=False)
+    # ### end Alembic commands ###
+
+    _backfill(op.get_bind())
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('proposal_summary', schema=None) as batch_op:
+        batch_op.drop_index('ix_proposal_summary_user_id_id')
+        batch_op.drop_index('ix_proposal_summary_timestamp_id')
+        batch_op.drop_index(batch_op.f('ix_proposal_summary_state_name'))
+        batch_op.drop_index(batch_op.f('ix_proposal_summary_season_id'))
+        batch_op.drop_index(batch_op.f('ix_proposal_summary_proposal_type_id'))
+
+    op.drop_table('proposal_summary')
+    # ### end Alembic commands ###
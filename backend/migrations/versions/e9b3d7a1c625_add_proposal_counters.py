@@ -0,0 +1,120 @@
+"""add proposal dashboard counters
+
+Revision ID: e9b3d7a1c625
+Revises: d8a2c6f0b514
+Create Date: 2026-10-18 17:31:44.102958
+
+"""
+from collections import Counter
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9b3d7a1c625'
+down_revision = 'd8a2c6f0b514'
+branch_labels = None
+depends_on = None
+
+proposal = sa.table(
+    'proposal',
+    sa.column('id', sa.Integer),
+    sa.column('current_state_id', sa.Integer),
+    sa.column('proposal_type_id', sa.Integer),
+)
+workflow_state = sa.table('workflow_state', sa.column('id', sa.Integer), sa.column('name', sa.String))
+proposal_type = sa.table(
+    'proposal_type',
+    sa.column('id', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('season_id', sa.Integer),
+)
+proposal_phase = sa.table(
+    'proposal_phase',
+    sa.column('id', sa.Integer),
+    sa.column('proposal_id', sa.Integer),
+    sa.column('phase', sa.String),
+    sa.column('status', sa.String),
+)
+proposal_instrument = sa.table(
+    'proposal_instrument',
+    sa.column('id', sa.Integer),
+    sa.column('proposal_id', sa.Integer),
+    sa.column('instrument_id', sa.Integer),
+    sa.column('status', sa.String),
+)
+instrument = sa.table('instrument', sa.column('id', sa.Integer), sa.column('code', sa.String))
+counter = sa.table(
+    'proposal_counter',
+    sa.column('season_id', sa.Integer),
+    sa.column('dimension', sa.String),
+    sa.column('key', sa.String),
+    sa.column('count', sa.Integer),
+)
+
+
+def _backfill(conn):
+    """与 app.core.proposal_counters.compute_counters 相同的 GROUP BY 计数"""
+    season = sa.func.coalesce(proposal_type.c.season_id, 0)
+    with_type = proposal.join(proposal_type, proposal.c.proposal_type_id == proposal_type.c.id)
+    counts = Counter()
+    for season_id, name, count in conn.execute(
+        sa.select(season, workflow_state.c.name, sa.func.count(proposal.c.id))
+        .select_from(with_type.join(workflow_state, proposal.c.current_state_id == workflow_state.c.id))
+        .group_by(season, workflow_state.c.name)
+    ):
+        counts[(season_id, 'state', name)] += count
+    for season_id, name, count in conn.execute(
+        sa.select(season, proposal_type.c.name, sa.func.count(proposal.c.id))
+        .select_from(with_type)
+        .group_by(season, proposal_type.c.name)
+    ):
+        counts[(season_id, 'proposal_type', name)] += count
+    for season_id, phase, status, count in conn.execute(
+        sa.select(season, proposal_phase.c.phase, proposal_phase.c.status, sa.func.count(proposal_phase.c.id))
+        .select_from(with_type.join(proposal_phase, proposal_phase.c.proposal_id == proposal.c.id))
+        .where(proposal_phase.c.status.isnot(None))
+        .group_by(season, proposal_phase.c.phase, proposal_phase.c.status)
+    ):
+        counts[(season_id, 'phase_status', f'{phase}:{status}')] += count
+    for season_id, code, status, count in conn.execute(
+        sa.select(season, instrument.c.code, proposal_instrument.c.status, sa.func.count(proposal_instrument.c.id))
+        .select_from(
+            with_type.join(proposal_instrument, proposal_instrument.c.proposal_id == proposal.c.id).join(
+                instrument, proposal_instrument.c.instrument_id == instrument.c.id
+            )
+        )
+        .group_by(season, instrument.c.code, proposal_instrument.c.status)
+    ):
+        counts[(season_id, 'instrument', code)] += count
+        if status:
+            counts[(season_id, 'instrument_status', f'{code}:{status}')] += count
+    if counts:
+        op.bulk_insert(
+            counter,
+            [
+                {'season_id': season_id, 'dimension': dimension, 'key': key, 'count': count}
+                for (season_id, dimension, key), count in sorted(counts.items())
+            ],
+        )
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('proposal_counter',
+    sa.Column('season_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('dimension', sa.String(length=32), nullable=False),
+    sa.Column('key', sa.String(length=140), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('season_id', 'dimension', 'key')
+    )
+    # ### end Alembic commands ###
+
+    _backfill(op.get_bind())
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('proposal_counter')
+    # ### end Alembic commands ###
@@ -47,6 +47,132 @@ def seed():
     print("Database seeded!")
 
 
+@app.cli.command("tool-worker")
+@click.option("--concurrency", type=int, default=None, help="Number of worker threads.")
+@click.option("--poll-interval", type=float, default=None, help="Seconds to wait when the queue is empty.")
+@click.option("--once", is_flag=True, help="Process the currently due jobs and exit.")
+def tool_worker(concurrency, poll_interval, once):
+    """Run the local external tool job worker pool."""
+    from app.core.job_queue import JobWorker
+
+    worker = JobWorker(app, concurrency=concurrency, poll_interval=poll_interval)
+    if once:
+        try:
+            processed = worker.run_once(limit=100)
+        finally:
+            worker.stop()
+        print(f"Processed {processed} job(s).")
+        return
+    print(f"Tool worker {worker.worker_id} started with {worker.concurrency} thread(s).")
+    worker.run_forever()
+
+
+@app.cli.command("archive-executions")
+@click.option("--older-than-days", type=int, default=None, help="Archive executions started more than this many days ago.")
+@click.option("--batch-size", type=int, default=None, help="Executions moved per transaction.")
+def archive_executions(older_than_days, batch_size):
+    """Move old external tool executions into the compressed archive."""
+    from app.core.execution_archive import archive_executions as run_archive
+
+    archived = run_archive(older_than_days=older_than_days, batch_size=batch_size)
+    print(f"Archived {archived} execution(s).")
+
+
+@app.cli.command("tool-record")
+@click.argument("output")
+@click.option("--operation-id", "operation_ids", type=int, multiple=True, help="Only record these operations.")
+@click.option("--since-days", type=int, default=None, help="Only record executions from the last N days.")
+@click.option("--limit", type=int, default=None, help="Maximum number of executions to record.")
+def tool_record(output, operation_ids, since_days, limit):
+    """Record external tool request/response pairs into a replay fixture."""
+    from app.core.tool_replay import record_fixture, write_fixture
+
+    fixture = record_fixture(operation_ids=operation_ids, since_days=since_days, limit=limit)
+    write_fixture(fixture, output)
+    print(f"Recorded {len(fixture['entries'])} execution(s) to {output}.")
+    if fixture["skipped_truncated"]:
+        print(f"Skipped {fixture['skipped_truncated']} execution(s) whose logged bodies were truncated.")
+
+
+@app.cli.command("tool-replay")
+@click.argument("fixture")
+@click.option("--host", default="127.0.0.1", help="Interface to listen on.")
+@click.option("--port", type=int, default=8099, help="Port to listen on.")
+@click.option("--latency", type=click.Choice(["recorded", "distribution"]), default="recorded",
+              help="Replay each recording's own latency or sample the endpoint's latency distribution.")
+@click.option("--latency-scale", type=float, default=1.0, help="Multiply replayed latencies (0 disables delays).")
+@click.option("--point-tools", is_flag=True, help="Point the recorded tools' base_url at this server (local DB only).")
+def tool_replay(fixture, host, port, latency, latency_scale, point_tools):
+    """Serve recorded external tool responses locally."""
+    from app.core.http_sessions import http_sessions
+    from app.core.tool_replay import ReplayServer, load_fixture
+    from app.models.models import ExternalTool
+
+    server = ReplayServer(load_fixture(fixture), latency=latency, latency_scale=latency_scale)
+    base = f"http://{host}:{port}"
+    for tool_id in server.tool_ids:
+        print(f"Tool {tool_id}: {base}/tools/{tool_id}")
+        if point_tools:
+            tool = db.session.get(ExternalTool, tool_id)
+            if tool is not None:
+                tool.base_url = f"{base}/tools/{tool_id}"
+    if point_tools:
+        db.session.commit()
+        http_sessions.invalidate()
+    print(f"Replaying {sum(len(r.entries) for r in server.routes.values())} recording(s) on {base}")
+    server.serve_forever(host, port)
+
+
+@app.cli.command("export-proposals")
+@click.argument("output", type=click.File("w", encoding="utf-8"), default="-")
+@click.option("--format", "fmt", type=click.Choice(["ndjson", "csv"]), default="ndjson", help="Output format.")
+@click.option("--columns", default="", help="Comma separated columns to export (default: all).")
+@click.option("--payloads", is_flag=True, help="Include phase payloads and instrument form data.")
+@click.option("--state", default=None, help="Only export proposals in this workflow state.")
+@click.option("--proposal-type-id", type=int, default=None, help="Only export this proposal type.")
+@click.option("--season-id", type=int, default=None, help="Only export this season.")
+@click.option("--chunk-size", type=int, default=None, help="Proposals read per query.")
+def export_proposals(output, fmt, columns, payloads, state, proposal_type_id, season_id, chunk_size):
+    """Stream proposals to OUTPUT (default stdout) as NDJSON or CSV."""
+    from app.core.proposal_export import iter_export
+
+    try:
+        lines = iter_export(
+            fmt,
+            columns=[c.strip() for c in columns.split(",") if c.strip()],
+            payloads=payloads,
+            chunk_size=chunk_size,
+            state=state,
+            proposal_type_id=proposal_type_id,
+            season_id=season_id,
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--columns")
+    for line in lines:
+        output.write(line)
+
+
+@app.cli.command("rebuild-summaries")
+@click.option("--chunk-size", type=int, default=None, help="Proposals rebuilt per transaction.")
+def rebuild_summaries(chunk_size):
+    """Rebuild the proposal_summary read model and dashboard counters from the proposal tables."""
+    from app.core.proposal_summary import rebuild_summaries as run_rebuild
+
+    total = run_rebuild(chunk_size=chunk_size)
+    print(f"Rebuilt {total} proposal summary row(s).")
+
+
+@app.cli.command("reconcile-counters")
+def reconcile_counters():
+    """Recompute the dashboard counters from the proposal tables and report drift."""
+    from app.core.proposal_counters import reconcile_counters as run_reconcile
+
+    drift = run_reconcile()
+    for (season_id, dimension, key), (stored, actual) in sorted(drift.items()):
+        print(f"season {season_id} {dimension} {key}: {stored} -> {actual}")
+    print(f"Counters reconciled ({len(drift)} drifted).")
+
+
 @app.shell_context_processor
 def make_shell_context():
     return {'db': db, 'User': User, 'Role': Role, 'Proposal': Proposal, 'ProposalType': ProposalType}
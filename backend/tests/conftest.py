@@ -2,6 +2,8 @@ import pytest
 import os
 
 from app import create_app, db
+from app.core.tool_mapping import invalidate_operation_mappings
+from app.core.workflow_compiler import invalidate_workflow
 from app.models.models import (
     FormTemplate,
     Instrument,
@@ -25,8 +27,12 @@ class TestConfig:
 
 
 @pytest.fixture
-def app():
+def app(tmp_path):
     app = create_app(TestConfig)
+    # 本机共享状态（熔断器等）每个测试独立
+    app.config["HOST_STATE_PATH"] = str(tmp_path / "host_state.db")
+    invalidate_workflow()
+    invalidate_operation_mappings()
     with app.app_context():
         db.create_all()
         seed_reference_data()
@@ -0,0 +1,1092 @@
+from datetime import datetime
+
+import pytest
+import requests
+
+from app import db
+from app.core.http_sessions import http_sessions
+from app.core.job_queue import JobWorker
+from app.core.workflow_compiler import invalidate_workflow
+from app.core.workflow_engine import WorkflowEngine
+from app.models.models import (
+    ExternalTool,
+    ExternalToolBlob,
+    ExternalToolExecution,
+    ExternalToolJob,
+    ExternalToolOperation,
+    Proposal,
+    ProposalPhase,
+    ProposalType,
+    Role,
+    User,
+    WorkflowState,
+)
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.headers = {"Content-Type": "application/json"}
+        self._body = body
+        self.text = str(body)
+
+    def json(self):
+        return self._body
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Replace outbound HTTP with a recorder returning queued responses."""
+
+    class Upstream:
+        def __init__(self):
+            self.calls = []
+            self.responses = []
+
+        def __call__(self, method, url, headers=None, params=None, json=None, timeout=None, **kwargs):
+            self.calls.append({"method": method, "url": url, "params": params, "json": json})
+            if self.responses:
+                return self.responses.pop(0)
+            return FakeResponse({"ok": True})
+
+    fake = Upstream()
+    monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: fake(*args, **kwargs))
+    return fake
+
+
+@pytest.fixture
+def proposer(app):
+    user = User(username="tool-user", email="tool-user@example.com")
+    user.set_password("password123")
+    user.roles.append(Role.query.filter_by(name="Proposer").first())
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def proposal(app, proposer):
+    proposal = Proposal(
+        title="Tool Test",
+        author=proposer,
+        proposal_type=ProposalType.query.first(),
+        current_state=WorkflowState.query.filter_by(name="Draft").first(),
+        data={},
+    )
+    phase = ProposalPhase(proposal=proposal, phase="phase1", status="draft", opened_at=datetime.utcnow())
+    db.session.add_all([proposal, phase])
+    db.session.commit()
+    return proposal
+
+
+def make_operation(**overrides):
+    tool = ExternalTool(name=overrides.pop("tool_name", "Scheduler"), base_url="http://upstream.test")
+    fields = dict(
+        tool=tool,
+        operation_id="scheduleTargets",
+        name="Schedule Targets",
+        method="POST",
+        path="/schedule",
+        input_mapping={"body": {"proposal_id": "proposal.id"}},
+        output_mapping={},
+        retry_config={"max_retries": 0},
+        tool_type="other",
+    )
+    fields.update(overrides)
+    operation = ExternalToolOperation(**fields)
+    db.session.add_all([tool, operation])
+    db.session.commit()
+    return operation
+
+
+def attach_tools(proposal, tool_configs, **effects):
+    workflow = proposal.proposal_type.workflow
+    definition = dict(workflow.definition)
+    transition = dict(definition["transitions"][0])
+    transition["effects"] = dict(transition["effects"], external_tools=tool_configs, **effects)
+    definition["transitions"] = [transition]
+    workflow.definition = definition
+    db.session.commit()
+    invalidate_workflow(workflow.id)
+
+
+def test_async_tool_is_queued_and_run_by_worker(app, proposal, proposer, upstream):
+    operation = make_operation()
+    attach_tools(proposal, [{"operation_id": operation.id, "async": True}])
+
+    result = WorkflowEngine(db.session).execute_transition(proposal.id, "submit_phase1", proposer)
+    assert result["new_state"] == "Submitted"
+    assert upstream.calls == []
+
+    job = ExternalToolJob.query.one()
+    assert job.status == "queued"
+    assert job.execution.status == "queued"
+
+    assert JobWorker(app).run_once() == 1
+    db.session.expire_all()
+    job = ExternalToolJob.query.one()
+    assert job.status == "done"
+    assert job.attempts == 1
+    assert ExternalToolExecution.query.one().status == "success"
+    assert upstream.calls[0]["json"] == {"proposal_id": proposal.id}
+
+
+def test_parallel_tools_run_concurrently_and_respect_dependencies(app, proposal, proposer, upstream, monkeypatch):
+    import threading
+    import time
+
+    visibility = make_operation(
+        tool_name="Visibility",
+        operation_id="checkVisibility",
+        output_mapping={"to_context": {"window": "response.window"}},
+    )
+    scheduler = make_operation(tool_name="Scheduler")
+    notifier = make_operation(
+        tool_name="Notifier",
+        operation_id="notify",
+        input_mapping={"body": {"window": "context.window"}},
+    )
+    attach_tools(proposal, [
+        {"operation_id": visibility.id, "key": "visibility"},
+        {"operation_id": scheduler.id, "key": "scheduler"},
+        {"operation_id": notifier.id, "depends_on": ["visibility"]},
+    ], parallel_tools=True)
+
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_upstream(method, url, json=None, **kwargs):
+        with lock:
+            in_flight.append(url)
+            peak.append(len(in_flight))
+        time.sleep(0.1)
+        with lock:
+            in_flight.remove(url)
+        upstream.calls.append({"url": url, "json": json})
+        return FakeResponse({"window": "2026-11-01"})
+
+    monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: slow_upstream(*args, **kwargs))
+
+    WorkflowEngine(db.session).execute_transition(proposal.id, "submit_phase1", proposer)
+
+    assert max(peak) == 2
+    assert upstream.calls[-1]["json"] == {"window": "2026-11-01"}
+    assert ExternalToolExecution.query.filter_by(status="success").count() == 3
+
+
+def test_session_registry_reuses_and_rebuilds_per_tool(app):
+    operation = make_operation(tool_name="Pooled")
+    tool = operation.tool
+    session = http_sessions.get(tool)
+    assert http_sessions.get(tool) is session
+
+    tool.config = {"http": {"pool_maxsize": 2}}
+    db.session.commit()
+    rebuilt = http_sessions.get(tool)
+    assert rebuilt is not session
+    assert rebuilt.get_adapter("http://upstream.test")._pool_maxsize == 2
+
+    # 共享会话不保存上游的 Set-Cookie
+    import http.client
+    from types import SimpleNamespace
+
+    from requests.cookies import extract_cookies_to_jar
+
+    headers = http.client.HTTPMessage()
+    headers["Set-Cookie"] = "sid=abc; Path=/"
+    extract_cookies_to_jar(
+        rebuilt.cookies,
+        requests.Request("GET", "http://upstream.test/check").prepare(),
+        SimpleNamespace(_original_response=SimpleNamespace(msg=headers)),
+    )
+    assert len(rebuilt.cookies) == 0
+
+
+def test_cached_operation_skips_upstream_but_records_execution(app, proposal, proposer, upstream):
+    from app.core.external_tool_executor import ExternalToolExecutor
+    from app.core.tool_cache import get_response_cache
+
+    operation = make_operation(
+        operation_id="checkVisibility",
+        method="GET",
+        input_mapping={"query": {"ra": "context.ra", "dec": "context.dec"}},
+        tool_type="validation",
+        cache_config={"enabled": True, "ttl": 60},
+    )
+    upstream.responses = [FakeResponse({"visible": True}), FakeResponse({"visible": False})]
+    executor = ExternalToolExecutor(db.session)
+
+    first = executor.execute(operation.id, proposal, {"ra": 10.5, "dec": -3.2}, proposer)
+    second = executor.execute(operation.id, proposal, {"dec": -3.2, "ra": 10.5}, proposer)
+    third = executor.execute(operation.id, proposal, {"ra": 11.0, "dec": -3.2}, proposer)
+
+    assert len(upstream.calls) == 2
+    assert first["response"] == second["response"] == {"visible": True}
+    assert third["response"] == {"visible": False}
+    executions = ExternalToolExecution.query.order_by(ExternalToolExecution.id).all()
+    assert [bool(execution.cache_hit) for execution in executions] == [False, True, False]
+    assert all(execution.status == "success" for execution in executions)
+
+    stats = get_response_cache().stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+
+
+def test_retryable_failure_is_rescheduled_instead_of_slept(app, proposal, proposer, upstream):
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    operation = make_operation(retry_config={"max_retries": 2, "retry_delay": 5})
+    upstream.responses = [FakeResponse({"error": "busy"}, status_code=503), FakeResponse({"ok": True})]
+
+    result = ExternalToolExecutor(db.session).execute(operation.id, proposal, {}, proposer)
+    assert result["status"] == "pending"
+    assert len(upstream.calls) == 1
+
+    execution = db.session.get(ExternalToolExecution, result["execution_id"])
+    job = db.session.get(ExternalToolJob, result["job_id"])
+    assert (execution.status, execution.retry_count) == ("retrying", 1)
+    assert execution.next_attempt_at > datetime.utcnow()
+    assert job.status == "queued" and job.run_after == execution.next_attempt_at
+
+    worker = JobWorker(app)
+    assert worker.run_once() == 0
+    job.run_after = datetime.utcnow()
+    db.session.commit()
+    assert worker.run_once() == 1
+
+    db.session.expire_all()
+    execution = db.session.get(ExternalToolExecution, result["execution_id"])
+    assert (execution.status, execution.retry_count) == ("success", 1)
+    assert db.session.get(ExternalToolJob, result["job_id"]).status == "done"
+    assert len(upstream.calls) == 2
+
+
+def test_job_is_not_requeued_after_executor_retries_are_exhausted(app, proposal, proposer, monkeypatch):
+    from app.core.job_queue import enqueue_tool_execution
+
+    operation = make_operation(retry_config={"max_retries": 1, "retry_delay": 5})
+    calls = []
+
+    def unreachable(session, method, url, **kwargs):
+        calls.append(url)
+        raise requests.exceptions.ConnectionError("connection refused")
+
+    monkeypatch.setattr(requests.Session, "request", unreachable)
+    job = enqueue_tool_execution(operation, proposal, actor=proposer)
+    db.session.commit()
+    job_id, execution_id = job.id, job.execution_id
+
+    worker = JobWorker(app)
+    assert worker.run_once() == 1
+    db.session.expire_all()
+    execution = db.session.get(ExternalToolExecution, execution_id)
+    assert (execution.status, execution.retry_count) == ("retrying", 1)
+
+    db.session.get(ExternalToolJob, job_id).run_after = datetime.utcnow()
+    db.session.commit()
+    assert worker.run_once() == 1
+
+    # 执行器的重试已用尽：任务与执行记录都结束，不再按 JOB_MAX_ATTEMPTS 放回队列
+    db.session.expire_all()
+    job = db.session.get(ExternalToolJob, job_id)
+    execution = db.session.get(ExternalToolExecution, execution_id)
+    assert job.status == "failed" and job.attempts < job.max_attempts
+    assert execution.status == "failed" and execution.completed_at is not None
+    assert worker.run_once() == 0
+    assert len(calls) == 2
+
+
+def test_job_result_is_discarded_after_lease_is_reclaimed(app, proposal, proposer, monkeypatch):
+    from sqlalchemy import text
+
+    from app.core.job_queue import enqueue_tool_execution
+
+    operation = make_operation()
+    job = enqueue_tool_execution(operation, proposal, actor=proposer)
+    db.session.commit()
+    job_id, execution_id = job.id, job.execution_id
+
+    def slow_upstream(session, method, url, **kwargs):
+        # 请求期间租约过期，另一个 worker 重新认领了任务
+        with db.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE external_tool_job SET lease_owner = 'other', attempts = attempts + 1 WHERE id = :id"),
+                {"id": job_id},
+            )
+        return FakeResponse({"ok": True})
+
+    monkeypatch.setattr(requests.Session, "request", slow_upstream)
+    assert JobWorker(app).run_once() == 1
+
+    db.session.expire_all()
+    job = db.session.get(ExternalToolJob, job_id)
+    assert (job.status, job.lease_owner, job.attempts) == ("running", "other", 2)
+    assert db.session.get(ExternalToolExecution, execution_id).status == "running"
+
+
+def test_blocking_validation_retries_inline_with_a_bound(app, proposal, proposer, upstream):
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    app.config["EXTERNAL_TOOL_INLINE_RETRIES"] = 2
+    app.config["EXTERNAL_TOOL_INLINE_RETRY_MAX_DELAY"] = 0
+    operation = make_operation(
+        tool_type="validation",
+        validation_config={"block_on_service_error": True},
+        retry_config={"max_retries": 5, "retry_delay": 5},
+    )
+    executor = ExternalToolExecutor(db.session)
+
+    upstream.responses = [FakeResponse({"error": "busy"}, status_code=503), FakeResponse({"ok": True})]
+    result = executor.execute(operation.id, proposal, {}, proposer)
+    assert result["status"] == "success"
+    assert db.session.get(ExternalToolExecution, result["execution_id"]).retry_count == 1
+
+    # 当场重试次数受 EXTERNAL_TOOL_INLINE_RETRIES 限制，不安排任务队列重试
+    upstream.calls.clear()
+    upstream.responses = [FakeResponse({"error": "busy"}, status_code=503) for _ in range(5)]
+    result = executor.execute(operation.id, proposal, {}, proposer)
+    assert result["status"] == "service_error" and result["block_transition"] is True
+    assert len(upstream.calls) == 3
+    assert ExternalToolJob.query.count() == 0
+
+
+def test_circuit_breaker_opens_and_fails_fast(app, proposal, proposer, upstream):
+    from app.core.circuit_breaker import get_circuit_breaker
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    operation = make_operation(
+        tool_type="validation",
+        validation_config={"block_on_service_error": True},
+    )
+    executor = ExternalToolExecutor(db.session)
+    # 未开启熔断的工具保持原有行为：每次失败都照常发出请求
+    upstream.responses = [FakeResponse({"error": "down"}, status_code=503) for _ in range(6)]
+    for _ in range(6):
+        assert executor.execute(operation.id, proposal, {}, proposer)["status"] == "service_error"
+    assert len(upstream.calls) == 6
+    assert get_circuit_breaker().status(operation.tool)["state"] == "closed"
+    upstream.calls.clear()
+
+    operation.tool.config = {"circuit_breaker": {"enabled": True, "failure_threshold": 2, "recovery_timeout": 60}}
+    db.session.commit()
+    upstream.responses = [FakeResponse({"error": "down"}, status_code=503) for _ in range(2)]
+
+    for _ in range(2):
+        result = executor.execute(operation.id, proposal, {}, proposer)
+        assert result["status"] == "service_error"
+    assert get_circuit_breaker().status(operation.tool)["state"] == "open"
+
+    result = executor.execute(operation.id, proposal, {}, proposer)
+    assert result["status"] == "service_error" and result["block_transition"] is True
+    assert "circuit open" in result["error"]
+    assert len(upstream.calls) == 2
+
+    admin = User.query.filter_by(username="tool-user").first()
+    admin.roles.append(Role.query.filter_by(name="Admin").first())
+    db.session.commit()
+    token = app.test_client().post(
+        "/api/auth/login", json={"username": "tool-user", "password": "password123"}
+    ).get_json()["token"]
+    response = app.test_client().get(
+        f"/api/external-tools/{operation.tool_id}", headers={"x-access-token": token}
+    )
+    assert response.get_json()["circuit_breaker"]["state"] == "open"
+
+
+def test_open_breaker_rejects_without_taking_the_write_lock(app, monkeypatch):
+    from app.core import circuit_breaker
+    from app.core.circuit_breaker import DEFAULT_BREAKER_CONFIG, get_circuit_breaker
+
+    breaker = get_circuit_breaker()
+    config = dict(DEFAULT_BREAKER_CONFIG, enabled=True, failure_threshold=1, recovery_timeout=30)
+    now = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, "time", lambda: now[0])
+    breaker.record_failure(7, config, "down")
+
+    transactions = []
+    transaction = breaker.store.transaction
+
+    def counting_transaction():
+        transactions.append(1)
+        return transaction()
+
+    monkeypatch.setattr(breaker.store, "transaction", counting_transaction)
+    assert not any(breaker.allow(7, config) for _ in range(20))
+    assert transactions == []
+
+    # 冷却期过后只有认领探测名额的一次加锁，名额用完后的拒绝同样不加锁
+    now[0] += 31
+    assert breaker.allow(7, config) is True
+    assert not any(breaker.allow(7, config) for _ in range(20))
+    assert len(transactions) == 1
+
+
+def test_compiled_mappings_follow_operation_updates(app, proposal, proposer, upstream):
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    operation = make_operation(
+        input_mapping={
+            "query": {"target": "context.target", "missing": "context.nope"},
+            "body": {"label": {"template": "Proposal #{proposal.id} ({proposal.status})"}, "mode": {"literal": "fast"}},
+        },
+        output_mapping={"to_context": {"slot": "response.slot.id"}, "to_proposal_data": {"slot_id": "response.slot.id"}},
+        tool_type="validation",
+        validation_config={
+            "failure_conditions": [{"path": "response.visible", "operator": "==", "value": False}],
+            "error_message_template": "Not visible: {response.reason} / {response.detail}",
+        },
+    )
+    executor = ExternalToolExecutor(db.session)
+    upstream.responses = [
+        FakeResponse({"visible": True, "slot": {"id": 7}}),
+        FakeResponse({"visible": False, "reason": "below horizon"}),
+    ]
+
+    context = {"target": "M31"}
+    result = executor.execute(operation.id, proposal, context, proposer)
+    assert upstream.calls[0]["params"] == {"target": "M31"}
+    assert upstream.calls[0]["json"] == {"label": f"Proposal #{proposal.id} (Draft)", "mode": "fast"}
+    assert result["mapped_output"] == {"slot": 7} and context["slot"] == 7
+    assert db.session.get(Proposal, proposal.id).data == {"slot_id": 7}
+
+    result = executor.execute(operation.id, proposal, {"target": "M31"}, proposer)
+    assert result["status"] == "validation_failed"
+    assert result["error"] == "Not visible: below horizon / N/A"
+
+    proposer.roles.append(Role.query.filter_by(name="Admin").first())
+    db.session.commit()
+    token = app.test_client().post(
+        "/api/auth/login", json={"username": "tool-user", "password": "password123"}
+    ).get_json()["token"]
+    response = app.test_client().patch(
+        f"/api/external-tools/operations/{operation.id}",
+        json={"input_mapping": {"body": {"title": "proposal.title"}}},
+        headers={"x-access-token": token},
+    )
+    assert response.status_code == 200
+
+    executor.execute(operation.id, proposal, {}, proposer)
+    assert upstream.calls[-1]["json"] == {"title": "Tool Test"}
+
+
+def test_data_source_loads_only_referenced_proposal_fields(app, proposal, upstream):
+    from sqlalchemy import event
+
+    from app.core.external_tool_executor import ExternalToolExecutor
+    from app.core.tool_mapping import compiled_mappings
+
+    executor = ExternalToolExecutor(db.session)
+    by_id = make_operation(input_mapping={"body": {"proposal_id": "proposal.id"}})
+    phases = make_operation(
+        tool_name="Phases",
+        input_mapping={"body": {"label": {"template": "{proposal.title}: {proposal.phases}"}}},
+    )
+    everything = make_operation(tool_name="Everything", input_mapping={"body": {"proposal": "proposal"}})
+
+    assert compiled_mappings(by_id).proposal_fields == {"id"}
+    assert compiled_mappings(phases).proposal_fields == {"title", "phases"}
+    assert compiled_mappings(everything).proposal_fields is None
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    proposal_id = proposal.id
+    by_id.tool.base_url
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        params = executor._build_request_params(by_id, proposal, {})
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert params["body"] == {"proposal_id": proposal_id}
+    assert statements == []
+
+    source = executor._proposal_source(proposal, compiled_mappings(phases).proposal_fields)
+    assert set(source) == {"title", "phases"}
+    assert source["phases"][0]["phase"] == "phase1"
+    assert set(executor._proposal_source(proposal, None)) == {
+        "id", "title", "abstract", "status", "data", "author", "phases", "instruments",
+    }
+
+
+def test_transition_releases_connection_during_tool_call(app, proposal, proposer, upstream, monkeypatch):
+    from sqlalchemy import text
+
+    operation = make_operation(output_mapping={"to_proposal_data": {"checked": "response.ok"}})
+    attach_tools(proposal, [{"operation_id": operation.id, "on_failure": "abort"}])
+    seen = {}
+
+    def observe(*args, **kwargs):
+        seen["in_transaction"] = db.session().in_transaction()
+        with db.engine.connect() as conn:
+            seen["execution_status"] = conn.execute(text("SELECT status FROM external_tool_execution")).scalar()
+        return FakeResponse({"ok": True})
+
+    monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: observe(*args, **kwargs))
+    result = WorkflowEngine(db.session).execute_transition(proposal.id, "submit_phase1", proposer)
+
+    assert result["new_state"] == "Submitted"
+    assert seen == {"in_transaction": False, "execution_status": "running"}
+    assert ExternalToolExecution.query.one().status == "success"
+    assert db.session.get(Proposal, proposal.id).data["checked"] is True
+
+
+def test_transition_rechecks_state_after_tool_call(app, proposal, proposer, monkeypatch):
+    from sqlalchemy import text
+
+    operation = make_operation(output_mapping={"to_proposal_data": {"checked": "response.ok"}})
+    attach_tools(proposal, [{"operation_id": operation.id}])
+    submitted = WorkflowState.query.filter_by(name="Submitted").first()
+    proposal_id, submitted_id = proposal.id, submitted.id
+
+    def concurrent_update(*args, **kwargs):
+        with db.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE proposal SET current_state_id = :state WHERE id = :id"),
+                {"state": submitted_id, "id": proposal_id},
+            )
+        return FakeResponse({"ok": True})
+
+    monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: concurrent_update(*args, **kwargs))
+    with pytest.raises(ValueError, match="state changed"):
+        WorkflowEngine(db.session).execute_transition(proposal_id, "submit_phase1", proposer)
+
+    db.session.rollback()
+    assert ExternalToolExecution.query.one().status == "success"
+    assert ProposalPhase.query.filter_by(proposal_id=proposal_id).one().status == "draft"
+    # 未应用的转换不写回工具输出
+    assert "checked" not in (db.session.get(Proposal, proposal_id).data or {})
+
+
+def test_transition_rechecks_conditions_after_tool_call(app, proposal, proposer, monkeypatch):
+    from sqlalchemy import text
+
+    operation = make_operation()
+    attach_tools(proposal, [{"operation_id": operation.id}])
+    workflow = proposal.proposal_type.workflow
+    definition = dict(workflow.definition)
+    definition["transitions"] = [
+        dict(definition["transitions"][0], conditions={"phase_status": {"phase": "phase1", "status": "draft"}})
+    ]
+    workflow.definition = definition
+    db.session.commit()
+    invalidate_workflow(workflow.id)
+    proposal_id = proposal.id
+
+    def concurrent_update(*args, **kwargs):
+        with db.engine.begin() as conn:
+            conn.execute(
+                text("UPDATE proposal_phase SET status = 'withdrawn' WHERE proposal_id = :id"), {"id": proposal_id}
+            )
+        return FakeResponse({"ok": True})
+
+    monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: concurrent_update(*args, **kwargs))
+    with pytest.raises(ValueError, match="conditions no longer met"):
+        WorkflowEngine(db.session).execute_transition(proposal_id, "submit_phase1", proposer)
+
+    db.session.rollback()
+    assert db.session.get(Proposal, proposal_id).current_state.name == "Draft"
+
+
+def test_proposal_deleted_during_tool_call_returns_404(app, proposal, proposer, monkeypatch):
+    from sqlalchemy import text
+
+    operation = make_operation()
+    attach_tools(proposal, [{"operation_id": operation.id}])
+    proposal_id = proposal.id
+
+    def concurrent_delete(*args, **kwargs):
+        with db.engine.begin() as conn:
+            conn.execute(text("DELETE FROM proposal WHERE id = :id"), {"id": proposal_id})
+        return FakeResponse({"ok": True})
+
+    monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: concurrent_delete(*args, **kwargs))
+    client = app.test_client()
+    token = client.post(
+        "/api/auth/login", json={"username": "tool-user", "password": "password123"}
+    ).get_json()["token"]
+    response = client.post(
+        f"/api/proposals/{proposal_id}/transitions",
+        json={"transition": "submit_phase1"},
+        headers={"x-access-token": token},
+    )
+    assert response.status_code == 404
+    assert response.get_json()["error_type"] == "not_found"
+
+
+def test_buffered_execution_log_writes_in_batches(app, proposal, proposer, upstream):
+    from app.core.execution_log import execution_body, get_log_writer
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    app.config.update(
+        EXTERNAL_TOOL_LOG_MODE="buffered",
+        EXTERNAL_TOOL_LOG_COMPRESS=True,
+        EXTERNAL_TOOL_LOG_COMPRESS_MIN=16,
+        EXTERNAL_TOOL_LOG_FLUSH_INTERVAL=60,
+    )
+    operation = make_operation()
+    validation = make_operation(tool_name="Checker", tool_type="validation")
+    body = {"visible": True, "windows": list(range(50))}
+    upstream.responses = [FakeResponse(body) for _ in range(3)]
+    executor = ExternalToolExecutor(db.session)
+    writer = get_log_writer()
+    try:
+        results = [executor.execute(operation.id, proposal, {}, proposer, "form_interaction") for _ in range(2)]
+        audited = executor.execute(validation.id, proposal, {}, proposer, "workflow_transition")
+
+        assert [result["execution_id"] for result in results] == [None, None]
+        assert all(result["response"] == body for result in results)
+        assert ExternalToolExecution.query.count() == 1
+        assert db.session.get(ExternalToolExecution, audited["execution_id"]).status == "success"
+
+        writer.flush()
+        rows = ExternalToolExecution.query.filter_by(operation_id=operation.id).all()
+        assert [row.status for row in rows] == ["success", "success"]
+        # 相同的响应只存一份，压缩后存入 external_tool_blob
+        assert rows[0].response_body is None
+        assert rows[0].response_body_hash == rows[1].response_body_hash
+        blob = db.session.get(ExternalToolBlob, rows[0].response_body_hash)
+        assert blob.content["_encoding"] == "gzip+base64"
+        assert execution_body(rows[1]) == body
+    finally:
+        writer.stop()
+
+
+def test_archived_executions_remain_queryable(app, proposal, proposer, tmp_path):
+    from datetime import timedelta
+
+    from app.core.execution_archive import archive_executions, query_executions
+    from app.models.models import ExternalToolExecutionArchive
+
+    app.config["EXECUTION_ARCHIVE_DIR"] = str(tmp_path / "archive")
+    operation = make_operation()
+    old = datetime.utcnow() - timedelta(days=120)
+
+    def record(status, started_at):
+        execution = ExternalToolExecution(
+            operation=operation, proposal=proposal, actor_id=proposer.id, status=status,
+            started_at=started_at, response_status=200, response_body={"status": status},
+        )
+        db.session.add(execution)
+        return execution
+
+    archived = [record("success", old), record("failed", old - timedelta(days=40))]
+    retrying = record("retrying", old)
+    recent = record("success", datetime.utcnow())
+    db.session.commit()
+    archived_ids = [execution.id for execution in archived]
+    db.session.add(ExternalToolJob(
+        execution_id=archived_ids[0], operation_id=operation.id, proposal_id=proposal.id, status="done",
+    ))
+    db.session.commit()
+
+    assert archive_executions(older_than_days=90, batch_size=1) == 2
+    assert {e.id for e in ExternalToolExecution.query} == {retrying.id, recent.id}
+    assert ExternalToolJob.query.count() == 0
+    assert ExternalToolExecutionArchive.query.count() == 2
+    assert len(list((tmp_path / "archive").glob("executions-*.jsonl.gz"))) == 2
+
+    records = query_executions(proposal_id=proposal.id, status="success")
+    assert [(r["id"], r["archived"]) for r in records] == [(recent.id, False), (archived_ids[0], True)]
+
+    proposer.roles.append(Role.query.filter_by(name="Admin").first())
+    db.session.commit()
+    token = app.test_client().post(
+        "/api/auth/login", json={"username": "tool-user", "password": "password123"}
+    ).get_json()["token"]
+    response = app.test_client().get(
+        f"/api/external-tools/executions/{archived_ids[1]}", headers={"x-access-token": token}
+    )
+    assert response.status_code == 200
+    assert response.get_json()["response_body"] == {"status": "failed"}
+    assert response.get_json()["archived"] is True
+
+
+def test_identical_bodies_are_stored_once(app, proposal, proposer, upstream, tmp_path):
+    from datetime import timedelta
+
+    from app.core.execution_archive import archive_executions, query_executions
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    operation = make_operation()
+    executor = ExternalToolExecutor(db.session)
+    for _ in range(3):
+        executor.execute(operation.id, proposal, {}, proposer, "form_interaction")
+
+    executions = ExternalToolExecution.query.all()
+    assert len({e.response_body_hash for e in executions}) == 1
+    assert all(e.response_body is None for e in executions)
+    # 请求体相同（proposal_id）、响应体与响应头相同
+    assert ExternalToolBlob.query.count() == 3
+
+    app.config["EXECUTION_ARCHIVE_DIR"] = str(tmp_path / "archive")
+    for execution in executions:
+        execution.started_at = datetime.utcnow() - timedelta(days=100)
+    db.session.commit()
+    assert archive_executions(older_than_days=90) == 3
+    # 已无引用的内容先打标记，宽限期过后的下一次归档才删除
+    assert all(blob.orphaned_at is not None for blob in ExternalToolBlob.query)
+    for blob in ExternalToolBlob.query:
+        blob.orphaned_at = datetime.utcnow() - timedelta(days=1)
+    db.session.commit()
+    assert archive_executions(older_than_days=90) == 0
+    assert ExternalToolBlob.query.count() == 0
+    assert [r["response_body"] for r in query_executions(proposal_id=proposal.id)] == [{"ok": True}] * 3
+
+
+def test_blob_prune_keeps_content_referenced_by_concurrent_write(app, proposal, proposer, upstream, tmp_path):
+    from datetime import timedelta
+
+    from app.core import execution_archive
+    from app.core.execution_log import execution_body, store_execution_bodies
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    operation = make_operation()
+    ExternalToolExecutor(db.session).execute(operation.id, proposal, {}, proposer, "form_interaction")
+    old = ExternalToolExecution.query.one()
+    bodies = {field: execution_body(old, field) for field in ("request_body", "response_headers", "response_body")}
+    old.started_at = datetime.utcnow() - timedelta(days=100)
+    db.session.commit()
+    app.config["EXECUTION_ARCHIVE_DIR"] = str(tmp_path / "archive")
+    assert execution_archive.archive_executions(older_than_days=90) == 1
+    for blob in ExternalToolBlob.query:
+        blob.orphaned_at = datetime.utcnow() - timedelta(days=1)
+    db.session.commit()
+
+    # 标记已超过宽限期，写入方存入相同内容（清除标记）但尚未提交执行记录时清理
+    fresh = ExternalToolExecution(
+        operation_id=operation.id,
+        proposal_id=proposal.id,
+        status="success",
+        **bodies,
+    )
+    store_execution_bodies(db.session, [fresh])
+    assert execution_archive._prune_blobs() == 0
+
+    db.session.add(fresh)
+    db.session.commit()
+    assert {field: execution_body(fresh, field) for field in bodies} == bodies
+    assert fresh.response_body is None and db.session.get(ExternalToolBlob, fresh.response_body_hash) is not None
+
+
+def test_identical_concurrent_calls_share_one_upstream_request(app, proposal, proposer, monkeypatch):
+    import threading
+    import time
+
+    from app.core.external_tool_executor import ExternalToolExecutor
+    from app.core.single_flight import get_single_flight
+
+    operation = make_operation(operation_id="checkVisibility", method="GET", tool_type="validation")
+    calls = []
+
+    def slow_upstream(method, url, **kwargs):
+        calls.append(url)
+        time.sleep(0.2)
+        return FakeResponse({"visible": True})
+
+    monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: slow_upstream(*args, **kwargs))
+
+    executor = ExternalToolExecutor(db.session)
+    prepared = [executor.prepare(operation.id, proposal, {}, proposer, "form_interaction") for _ in range(4)]
+    db.session.commit()
+    threads = [threading.Thread(target=executor.send, args=(call,)) for call in prepared]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results = [executor.complete(call) for call in prepared]
+
+    assert len(calls) == 1
+    assert [result["status"] for result in results] == ["success"] * 4
+    assert sum(call.coalesced for call in prepared) == 3
+    stats = get_single_flight().stats()
+    assert (stats["leaders"], stats["shared"], stats["in_flight"]) == (1, 3, 0)
+
+
+def test_host_flight_shares_result_between_processes(tmp_path):
+    import threading
+    import time
+
+    from app.core.host_store import HostStore
+    from app.core.single_flight import HostFlight, SingleFlight
+
+    path = str(tmp_path / "flights.db")
+    # 两个进程各自的合并器，只共享本机状态库
+    first, second = SingleFlight(HostFlight(HostStore(path))), SingleFlight(HostFlight(HostStore(path)))
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return FakeResponse({"visible": True}), None
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(first.do("key", fetch, wait=5)))
+    leader.start()
+    time.sleep(0.05)
+    (response, error), shared = second.do("key", fetch, wait=5)
+    leader.join()
+
+    assert len(calls) == 1
+    assert shared and error is None
+    assert response.json() == {"visible": True}
+    assert second.stats()["host_shared"] == 1
+
+    # 结果仍在保留期内，但之后才到达的请求没有与领头请求并发，不共享该结果
+    (response, error), shared = second.do("key", fetch, wait=5)
+    assert not shared and len(calls) == 2
+
+
+def test_async_engine_runs_worker_batch_with_bounded_concurrency(app, proposal, proposer, monkeypatch):
+    import asyncio
+    import threading
+
+    httpx = pytest.importorskip("httpx")
+    from app.core import async_executor
+    from app.core.job_queue import enqueue_tool_execution
+
+    app.config["EXTERNAL_TOOL_ENGINE"] = "asyncio"
+    operation = make_operation(input_mapping={"body": {"n": "context.n"}})
+    operation.tool.config = {"http": {"max_concurrency": 4}}
+    for n in range(12):
+        enqueue_tool_execution(operation, proposal, {"n": n}, proposer)
+    db.session.commit()
+
+    in_flight, peak, threads = [0], [0], set()
+
+    async def handler(request):
+        threads.add(threading.get_ident())
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.05)
+        in_flight[0] -= 1
+        return httpx.Response(200, json={"accepted": True})
+
+    from_config = async_executor.AsyncToolEngine.from_config
+    monkeypatch.setattr(
+        async_executor.AsyncToolEngine, "from_config",
+        classmethod(lambda cls, executor: from_config.__func__(cls, executor, transport=httpx.MockTransport(handler))),
+    )
+
+    worker = JobWorker(app)
+    assert worker.batch_size > 12
+    assert worker.run_once(limit=worker.batch_size) == 12
+
+    db.session.expire_all()
+    assert peak[0] == 4
+    assert len(threads) == 1
+    assert {job.status for job in ExternalToolJob.query} == {"done"}
+    assert {e.status for e in ExternalToolExecution.query} == {"success"}
+
+
+def test_async_engine_keeps_clients_between_worker_batches(app, proposal, proposer, monkeypatch):
+    httpx = pytest.importorskip("httpx")
+    from app.core import async_executor
+    from app.core.job_queue import enqueue_tool_execution
+
+    app.config["EXTERNAL_TOOL_ENGINE"] = "asyncio"
+    operation = make_operation(input_mapping={"body": {"n": "context.n"}})
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"accepted": True}))
+    from_config = async_executor.AsyncToolEngine.from_config
+    monkeypatch.setattr(
+        async_executor.AsyncToolEngine, "from_config",
+        classmethod(lambda cls, executor: from_config.__func__(cls, executor, transport=transport)),
+    )
+    clients = []
+    client_class = httpx.AsyncClient
+
+    def tracking_client(*args, **kwargs):
+        clients.append(client_class(*args, **kwargs))
+        return clients[-1]
+
+    monkeypatch.setattr(async_executor.httpx, "AsyncClient", tracking_client)
+    worker = JobWorker(app)
+
+    def run_batch():
+        for n in range(2):
+            enqueue_tool_execution(operation, proposal, {"n": n}, proposer)
+        db.session.commit()
+        assert worker.run_once(limit=worker.batch_size) == 2
+
+    run_batch()
+    run_batch()
+    assert len(clients) == 1 and not clients[0].is_closed
+
+    # 工具的连接配置变化（指纹不同）时关闭旧客户端并重建
+    operation.tool.config = {"http": {"max_concurrency": 2}}
+    db.session.commit()
+    run_batch()
+    assert len(clients) == 2 and clients[0].is_closed
+
+    worker.stop()
+    assert clients[1].is_closed
+    assert {e.status for e in ExternalToolExecution.query} == {"success"}
+
+    # 不保留客户端的线程（如 Web 请求）每次发送后关闭临时的客户端与事件循环
+    from app.core.external_tool_executor import ExternalToolExecutor
+
+    executor = ExternalToolExecutor(db.session)
+    prepared = [executor.prepare(operation.id, proposal, {"n": n}, proposer, "form_interaction") for n in range(2)]
+    db.session.commit()
+    executor.send_all(prepared)
+    assert len(clients) == 3 and clients[2].is_closed
+    assert async_executor.async_client_pool() is None
+
+
+def test_rate_limit_paces_and_rejects_requests(app, proposal, proposer, upstream, monkeypatch):
+    from app.core import external_tool_executor
+    from app.core.external_tool_executor import ExternalToolExecutor
+    from app.core.rate_limiter import get_rate_limiter
+
+    operation = make_operation(input_mapping={"body": {"n": "context.n"}}, retry_config={"max_retries": 2})
+    operation.tool.config = {"rate_limit": {"rate": 10, "burst": 2, "max_queue": 2}}
+    db.session.commit()
+
+    slept = []
+    monkeypatch.setattr(external_tool_executor.time, "sleep", slept.append)
+    executor = ExternalToolExecutor(db.session)
+    prepared = [executor.prepare(operation.id, proposal, {"n": n}, proposer, "form_interaction") for n in range(5)]
+    db.session.commit()
+    for call in prepared:
+        executor.send(call)
+
+    # 桶内 2 个令牌立即发送，随后 2 个排队等待，第 5 个超出队列上限被拒绝
+    assert len(upstream.calls) == 4
+    assert len(slept) == 2 and 0 < slept[0] < slept[1] <= 0.2
+    rejected = executor.complete(prepared[-1])
+    assert rejected["status"] == "pending"
+    assert "Rate limit exceeded" in rejected["error"]
+
+    status = get_rate_limiter().status(operation.tool)
+    assert (status["admitted"], status["rejected"], status["waited"]) == (4, 1, 2)
+    assert status["queue_depth"] in (1, 2)  # 测试期间已补充少量令牌
+
+
+def test_calls_refused_by_open_breaker_do_not_use_rate_limit_tokens(app, proposal, proposer, upstream):
+    from app.core.circuit_breaker import breaker_config, get_circuit_breaker
+    from app.core.external_tool_executor import ExternalToolExecutor
+    from app.core.rate_limiter import get_rate_limiter
+
+    operation = make_operation()
+    operation.tool.config = {
+        "rate_limit": {"rate": 10, "burst": 2, "max_queue": 0},
+        "circuit_breaker": {"enabled": True, "failure_threshold": 1, "recovery_timeout": 60},
+    }
+    db.session.commit()
+    get_circuit_breaker().record_failure(operation.tool_id, breaker_config(operation.tool), "down")
+
+    executor = ExternalToolExecutor(db.session)
+    for _ in range(5):
+        result = executor.execute(operation.id, proposal, {}, proposer)
+        assert "circuit open" in result["error"]
+    assert upstream.calls == []
+    status = get_rate_limiter().status(operation.tool)
+    assert (status["admitted"], status["rejected"]) == (0, 0)
+
+
+def test_batch_operation_merges_calls_and_demultiplexes_results(app, proposal, proposer, monkeypatch):
+    from app.core.execution_log import execution_body
+    from app.core.job_queue import enqueue_tool_execution
+    from app.core.tool_batching import window_run_after
+
+    operation = make_operation(
+        input_mapping={"body": {"target": "context.target"}},
+        output_mapping={"to_context": {"slot": "response.slot"}},
+        batch_config={
+            "enabled": True, "max_size": 3, "items_field": "targets",
+            "response_items": "response.results", "match_on": "target",
+        },
+    )
+    requests_sent = []
+
+    def batch_upstream(method, url, json=None, **kwargs):
+        requests_sent.append(json)
+        # 结果顺序与请求相反，按 match_on 对应
+        return FakeResponse({"results": [
+            {"target": item["target"], "slot": f"slot-{item['target']}"} for item in reversed(json["targets"])
+        ]})
+
+    monkeypatch.setattr(requests.Session, "request", lambda session, *args, **kwargs: batch_upstream(*args, **kwargs))
+    jobs = [enqueue_tool_execution(operation, proposal, {"target": f"T{n}"}, proposer) for n in range(5)]
+    db.session.commit()
+
+    worker = JobWorker(app)
+    assert worker.run_once(limit=1) == 3
+    assert requests_sent == [{"targets": [{"target": "T0"}, {"target": "T1"}, {"target": "T2"}]}]
+    assert worker.run_once(limit=1) == 2
+    assert len(requests_sent) == 2
+
+    db.session.expire_all()
+    for n, job in enumerate(jobs):
+        assert job.status == "done"
+        assert job.execution.status == "success"
+        assert execution_body(job.execution) == {"target": f"T{n}", "slot": f"slot-T{n}"}
+    # 每个调用都记录整批请求的耗时，回放导出时有延迟可用
+    first_batch = [job.execution.response_ms for job in jobs[:3]]
+    assert first_batch[0] is not None and len(set(first_batch)) == 1
+
+    window_start = datetime(2026, 10, 18, 12, 0, 0)
+    assert window_run_after({"window": 5}, window_start.replace(second=3)) == window_start.replace(second=5)
+
+
+def test_recorded_executions_replay_with_latency(app, proposal, proposer, upstream, monkeypatch):
+    import json
+    import time
+    import urllib.error
+    import urllib.request
+    from datetime import timedelta
+
+    from app.core.external_tool_executor import ExternalToolExecutor
+    from app.core.tool_replay import ReplayServer, record_fixture
+
+    operation = make_operation(
+        input_mapping={"body": {"target": "context.target"}, "query": {"mode": "context.mode"}}
+    )
+    upstream.responses = [FakeResponse({"slot": "A"}), FakeResponse({"slot": "B"}), FakeResponse({"slot": "C"})]
+    respond = requests.Session.request
+
+    def slow_upstream(session, *args, **kwargs):
+        time.sleep(0.08)
+        return respond(session, *args, **kwargs)
+
+    monkeypatch.setattr(requests.Session, "request", slow_upstream)
+    executor = ExternalToolExecutor(db.session)
+    for target, mode in (("T1", "fast"), ("T2", "fast"), ("T1", "slow")):
+        executor.execute(operation.id, proposal, {"target": target, "mode": mode}, proposer, "form_interaction")
+    for execution in ExternalToolExecution.query:
+        # 限流或排队等待计入了 started_at ~ completed_at，不应作为回放耗时
+        execution.completed_at = execution.started_at + timedelta(seconds=5)
+    # 执行日志截断过的内容不完整，不导出
+    app.config["EXTERNAL_TOOL_LOG_MAX_BODY"] = 8
+    upstream.responses = [FakeResponse({"slot": "D" * 50})]
+    executor.execute(operation.id, proposal, {"target": "T3", "mode": "fast"}, proposer, "form_interaction")
+    db.session.commit()
+
+    fixture = record_fixture()
+    assert [(e["path"], e["query"], e["request_body"], e["body"]) for e in fixture["entries"]] == [
+        ("/schedule", "mode=slow", {"target": "T1"}, {"slot": "C"}),
+        ("/schedule", "mode=fast", {"target": "T2"}, {"slot": "B"}),
+        ("/schedule", "mode=fast", {"target": "T1"}, {"slot": "A"}),
+    ]
+    assert all(80 <= e["latency_ms"] < 1000 for e in fixture["entries"])
+    assert fixture["skipped_truncated"] == 1
+
+    server = ReplayServer(fixture, latency_scale=0.5).start()
+    try:
+        def replay(query):
+            request = urllib.request.Request(
+                server.tool_base_url(operation.tool_id) + "/schedule" + query,
+                data=b'{"target": "T1"}',
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+
+        started = time.monotonic()
+        assert replay("?mode=fast") == {"slot": "A"}
+        assert time.monotonic() - started >= 0.04
+        assert replay("?mode=slow") == {"slot": "C"}
+        with pytest.raises(urllib.error.HTTPError):
+            replay("")
+        assert server.served == 2
+    finally:
+        server.stop()
@@ -1,5 +1,19 @@
+from sqlalchemy import event
+
 from app import db
-from app.models.models import Proposal, ProposalInstrument, ProposalType
+from app.core.proposal_summary import rebuild_summaries, refresh_summary
+from app.models.models import (
+    Instrument,
+    Proposal,
+    ProposalCounter,
+    ProposalInstrument,
+    ProposalPhase,
+    ProposalSummary,
+    ProposalType,
+    Role,
+    User,
+    WorkflowState,
+)
 
 
 def auth_headers(token):
@@ -62,3 +76,307 @@ def test_create_phase1_proposal(client, proposer_token):
     assert instrument_entry.form_data["filter"] == "F275W"
     assert "__attachments__" in instrument_entry.form_data
 
+
+def test_proposal_summary_follows_writes(client, proposer_token):
+    proposal_type = ProposalType.query.first()
+    payload = {
+        "title": "Summary Test",
+        "abstract": "Test abstract",
+        "proposal_type_id": proposal_type.id,
+        "phase_payload": {"phase1": {"status": "submitted", "data": {}}},
+        "instruments": [{"instrument_code": "MCI", "status": "submitted", "form_data": {}}],
+    }
+    response = client.post("/api/proposals/", json=payload, headers=auth_headers(proposer_token))
+    assert response.status_code == 201, response.get_json()
+    proposal_id = response.get_json()["id"]
+
+    summary = ProposalSummary.query.get(proposal_id)
+    assert summary.state_name == "Draft"
+    assert summary.phases[0]["status"] == "submitted"
+    assert summary.instruments == [
+        {"instrument": "MCI", "status": "submitted", "phase": "phase1", "confirmed_at": None}
+    ]
+
+    response = client.patch(
+        f"/api/proposals/{proposal_id}/phase",
+        json={"phase": "phase1", "status": "confirmed"},
+        headers=auth_headers(proposer_token),
+    )
+    assert response.status_code == 200
+    response = client.post(
+        f"/api/proposals/{proposal_id}/instruments/MCI/confirm", json={}, headers=auth_headers(proposer_token)
+    )
+    assert response.status_code == 200
+    summary = ProposalSummary.query.get(proposal_id)
+    assert summary.phases[0]["status"] == "confirmed"
+    assert summary.instruments[0]["status"] == "confirmed"
+    assert summary.instruments[0]["confirmed_at"] is not None
+
+    # 不经过 API 创建的提案同样生成读模型行，出现在列表中
+    imported = Proposal(
+        title="Imported",
+        author=User.query.filter_by(username="proposer").first(),
+        proposal_type=proposal_type,
+        current_state=WorkflowState.query.filter_by(name="Draft").first(),
+    )
+    imported.phases.append(ProposalPhase(phase="phase1", status="submitted"))
+    db.session.add(imported)
+    db.session.commit()
+    assert ProposalSummary.query.get(imported.id).phases[0]["status"] == "submitted"
+    listed = client.get("/api/proposals/", headers=auth_headers(proposer_token)).get_json()
+    assert [item["id"] for item in listed] == [proposal_id, imported.id]
+
+    # 状态、提案类型与仪器改名后读模型中的冗余名称与计数随之更新
+    from app.core.proposal_counters import compute_counters
+
+    WorkflowState.query.filter_by(name="Draft").first().name = "Drafting"
+    proposal_type.name = "Renamed Type"
+    Instrument.query.filter_by(code="MCI").first().code = "MCI2"
+    db.session.commit()
+    summary = ProposalSummary.query.get(proposal_id)
+    assert (summary.state_name, summary.proposal_type_name) == ("Drafting", "Renamed Type")
+    assert summary.instruments[0]["instrument"] == "MCI2"
+    counters = {(row.season_id, row.dimension, row.key): row.count for row in ProposalCounter.query if row.count}
+    assert counters == dict(compute_counters())
+
+    # 事件只挂在 db.session 上，其他会话不补写读模型
+    from sqlalchemy.orm import Session
+
+    with Session(db.engine) as other:
+        other.add(Proposal(title="Other session", user_id=imported.user_id, proposal_type_id=proposal_type.id))
+        other.commit()
+        other_id = other.query(Proposal.id).filter_by(title="Other session").scalar()
+    assert ProposalSummary.query.get(other_id) is None
+
+
+def _make_proposals(count, author, proposal_type, instrument):
+    for index in range(count):
+        proposal = Proposal(
+            title=f"Survey {index}",
+            abstract="",
+            author=author,
+            proposal_type=proposal_type,
+            current_state=WorkflowState.query.filter_by(name="Draft").first(),
+        )
+        proposal.phases.append(ProposalPhase(phase="phase1", status="submitted"))
+        proposal.phases.append(ProposalPhase(phase="phase2", status="pending"))
+        proposal.instruments.append(ProposalInstrument(instrument=instrument, phase="phase1"))
+        db.session.add(proposal)
+        refresh_summary(db.session, proposal)
+    db.session.commit()
+
+
+def _admin_token(client):
+    admin = User(username="admin", email="admin@example.com")
+    admin.set_password("password123")
+    admin.roles.append(Role.query.filter_by(name="Admin").first())
+    db.session.add(admin)
+    db.session.commit()
+    token = client.post("/api/auth/login", json={"username": "admin", "password": "password123"}).get_json()["token"]
+    return admin, token
+
+
+def _count_list_queries(client, token, **params):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/api/proposals/", query_string=params, headers=auth_headers(token))
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert response.status_code == 200, response.get_json()
+    return len(statements), response.get_json()
+
+
+def test_proposal_list_query_count_is_constant(client):
+    admin, token = _admin_token(client)
+    proposal_type = ProposalType.query.first()
+    instrument = Instrument.query.filter_by(code="MCI").first()
+
+    _make_proposals(2, admin, proposal_type, instrument)
+    small, data = _count_list_queries(client, token)
+    small_queue, _ = _count_list_queries(client, token, instrument_code="MCI")
+    assert len(data) == 2
+    assert [phase["phase"] for phase in data[0]["phases"]] == ["phase1", "phase2"]
+    assert data[0]["instruments"][0]["instrument"] == "MCI"
+
+    _make_proposals(20, admin, proposal_type, instrument)
+    large, data = _count_list_queries(client, token)
+    large_queue, queue = _count_list_queries(client, token, instrument_code="MCI")
+    assert len(data) == 22 and len(queue) == 22
+    assert queue[0]["status"] == "Draft"
+    assert queue[0]["assignment"]["status"] == "pending"
+    assert large == small
+    assert large_queue == small_queue
+
+
+def test_proposal_list_keyset_pagination(client):
+    admin, token = _admin_token(client)
+    instrument = Instrument.query.filter_by(code="MCI").first()
+    _make_proposals(5, admin, ProposalType.query.first(), instrument)
+    first = Proposal.query.order_by(Proposal.id).first()
+    first.current_state = WorkflowState.query.filter_by(name="Submitted").first()
+    first.instruments.first().status = "accepted"
+    refresh_summary(db.session, first)
+    db.session.commit()
+
+    def pages(**params):
+        seen, cursor = [], None
+        while True:
+            query = dict(params, limit=2, **({"cursor": cursor} if cursor else {}))
+            response = client.get("/api/proposals/", query_string=query, headers=auth_headers(token))
+            assert response.status_code == 200, response.get_json()
+            seen.append([item["id"] for item in response.get_json()])
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return seen
+
+    ids = [p.id for p in Proposal.query.order_by(Proposal.id)]
+    assert pages() == [ids[0:2], ids[2:4], ids[4:5]]
+    assert sum(pages(order="-timestamp"), []) == sorted(
+        ids, key=lambda i: (Proposal.query.get(i).timestamp, i), reverse=True
+    )
+    assert pages(state="Submitted") == [[ids[0]]]
+    assert pages(state="Draft", instrument_status="pending") == [ids[1:3], ids[3:5]]
+    assert sum(pages(instrument_code="MCI", instrument_status="pending"), []) == ids[1:]
+    assert pages(season_id=999) == [[]]
+
+    # 不传 limit / cursor 时返回全部，不截断
+    response = client.get("/api/proposals/", headers=auth_headers(token))
+    assert [item["id"] for item in response.get_json()] == ids
+    assert "X-Next-Cursor" not in response.headers
+
+    # 时间戳为空的行在升序时排在最前、降序时排在最后，游标中显式编码为 null
+    for proposal_id in ids[1:3]:
+        db.session.get(ProposalSummary, proposal_id).timestamp = None
+    db.session.commit()
+    ordered = sorted(ids, key=lambda i: (i not in ids[1:3], db.session.get(ProposalSummary, i).timestamp or 0, i))
+    assert sum(pages(order="timestamp"), []) == ordered
+    assert sum(pages(order="-timestamp"), []) == ordered[::-1]
+
+    # 调度队列联接读模型分页：缺少读模型行的分配不占用页内名额
+    db.session.delete(db.session.get(ProposalSummary, ids[1]))
+    db.session.commit()
+    assert pages(instrument_code="MCI") == [[ids[0], ids[2]], ids[3:5]]
+
+    response = client.get("/api/proposals/?cursor=not-a-cursor", headers=auth_headers(token))
+    assert response.status_code == 400
+    response = client.get("/api/proposals/?order=title", headers=auth_headers(token))
+    assert response.status_code == 400
+
+
+def test_proposal_export_streams_ndjson_and_csv(client, proposer_token):
+    import csv
+    import io
+    import json
+
+    admin, token = _admin_token(client)
+    _make_proposals(5, admin, ProposalType.query.first(), Instrument.query.filter_by(code="MCI").first())
+    ProposalPhase.query.filter_by(phase="phase1").update({"payload": {"science_objective": "Galaxies"}})
+    db.session.commit()
+
+    response = client.get(
+        "/api/proposals/export",
+        query_string={"chunk_size": 2, "payloads": "true"},
+        headers=auth_headers(token),
+    )
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    records = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [record["id"] for record in records] == [p.id for p in Proposal.query.order_by(Proposal.id)]
+    assert records[0]["status"] == "Draft"
+    assert records[0]["phases"][0]["payload"] == {"science_objective": "Galaxies"}
+    assert records[0]["instruments"][0]["instrument"] == "MCI"
+
+    response = client.get(
+        "/api/proposals/export",
+        query_string={"format": "csv", "columns": "id,title,phases", "chunk_size": 2},
+        headers=auth_headers(token),
+    )
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ["id", "title", "phases"]
+    assert len(rows) == 6
+    assert "payload" not in json.loads(rows[1][2])[0]
+
+    # chunk_size 超出 [1, PROPOSAL_EXPORT_CHUNK_SIZE] 时截到边界，仍按块读取
+    client.application.config["PROPOSAL_EXPORT_CHUNK_SIZE"] = 2
+    for chunk_size, chunks in ((1000000, 3), (-5, 6)):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, "before_cursor_execute", listener)
+        try:
+            response = client.get(
+                "/api/proposals/export", query_string={"chunk_size": chunk_size}, headers=auth_headers(token)
+            )
+            records = response.get_data(as_text=True).splitlines()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+        assert len(records) == 5
+        assert len([s for s in statements if "ORDER BY proposal.id" in s and "LIMIT" in s]) == chunks
+
+    response = client.get("/api/proposals/export?columns=id,secret", headers=auth_headers(token))
+    assert response.status_code == 400
+    response = client.get("/api/proposals/export", headers=auth_headers(proposer_token))
+    assert response.status_code == 403
+
+
+def test_aggregate_counters_track_changes_and_reconcile(client, proposer_token):
+    from app.core.proposal_counters import compute_counters, reconcile_counters, summary_keys
+    from app.core.workflow_engine import WorkflowEngine
+
+    proposal_type = ProposalType.query.first()
+    ids = []
+    for index in range(3):
+        response = client.post(
+            "/api/proposals/",
+            json={
+                "title": f"Counted {index}",
+                "proposal_type_id": proposal_type.id,
+                "phase_payload": {"phase1": {"status": "draft", "data": {}}},
+                "instruments": [{"instrument_code": "MCI", "status": "submitted"}],
+            },
+            headers=auth_headers(proposer_token),
+        )
+        assert response.status_code == 201, response.get_json()
+        ids.append(response.get_json()["id"])
+    proposer = User.query.filter_by(username="proposer").first()
+    WorkflowEngine(db.session).execute_transition(ids[0], "submit_phase1", proposer)
+    client.post(f"/api/proposals/{ids[1]}/instruments/MCI/confirm", json={}, headers=auth_headers(proposer_token))
+
+    def stored():
+        return {
+            (row.season_id, row.dimension, row.key): row.count
+            for row in ProposalCounter.query
+            if row.count
+        }
+
+    assert stored() == dict(compute_counters())
+
+    _, token = _admin_token(client)
+    data = client.get("/api/proposals/aggregates", headers=auth_headers(token)).get_json()
+    assert data["state"] == {"Draft": 2, "Submitted": 1}
+    assert data["proposal_type"] == {"CSST Phase-1": 3}
+    assert data["instrument"] == {"MCI": 3}
+    assert data["phase_status"] == {"phase1": {"draft": 2, "submitted": 1}}
+    assert data["instrument_status"] == {"MCI": {"submitted": 2, "confirmed": 1}}
+    assert client.get("/api/proposals/aggregates", headers=auth_headers(proposer_token)).status_code == 403
+
+    # 绕过写路径直接修改后，对账修正漂移
+    ProposalPhase.query.filter_by(proposal_id=ids[2]).update({"status": "submitted"})
+    db.session.commit()
+    drift = reconcile_counters()
+    assert drift == {(0, "phase_status", "phase1:draft"): (2, 1), (0, "phase_status", "phase1:submitted"): (1, 2)}
+    assert stored() == dict(compute_counters())
+    assert sum(summary_keys(ProposalSummary.query.get(ids[0])).values()) == 5
+
+    # 批量转换整块合并写入计数；通过 ORM 删除提案时减去其计数
+    rebuild_summaries()
+    results = WorkflowEngine(db.session).execute_transition_bulk(ids[1:], "submit_phase1", proposer)
+    assert [result["status"] for result in results] == ["success", "success"]
+    assert stored() == dict(compute_counters())
+    db.session.delete(db.session.get(Proposal, ids[0]))
+    db.session.commit()
+    assert stored() == dict(compute_counters())
+    assert client.get("/api/proposals/aggregates", headers=auth_headers(token)).get_json()["state"] == {
+        "Submitted": 2
+    }
@@ -3,8 +3,9 @@ from datetime import datetime
 import pytest
 
 from app import db
+from app.core.proposal_summary import rebuild_summaries
 from app.core.workflow_engine import WorkflowEngine
-from app.models.models import Proposal, ProposalPhase, ProposalType, Role, User, WorkflowState
+from app.models.models import Proposal, ProposalPhase, ProposalSummary, ProposalType, Role, User, WorkflowState
 
 
 @pytest.fixture
@@ -59,3 +60,158 @@ def test_execute_transition_updates_state_and_phase(proposal, proposer):
     assert phase.status == "submitted"
     assert phase.submitted_at is not None
 
+
+
+def test_workflow_update_invalidates_compiled_definition(client, proposal, proposer):
+    engine = WorkflowEngine(db.session)
+    assert {a["name"] for a in engine.get_allowed_actions(proposal.id, proposer)} == {"submit_phase1"}
+
+    admin = User(username="workflow-admin", email="workflow-admin@example.com")
+    admin.set_password("password123")
+    admin.roles.append(Role.query.filter_by(name="Admin").first())
+    db.session.add(admin)
+    db.session.commit()
+    token = client.post(
+        "/api/auth/login", json={"username": "workflow-admin", "password": "password123"}
+    ).get_json()["token"]
+
+    workflow = proposal.proposal_type.workflow
+    definition = dict(workflow.definition)
+    definition["transitions"] = definition["transitions"] + [
+        {"name": "withdraw", "from": "Draft", "to": "Submitted", "roles": ["Proposer"]}
+    ]
+    response = client.put(
+        f"/api/workflows/{workflow.id}",
+        json={"definition": definition},
+        headers={"x-access-token": token},
+    )
+    assert response.status_code == 200
+
+    actions = engine.get_allowed_actions(proposal.id, proposer)
+    assert {a["name"] for a in actions} == {"submit_phase1", "withdraw"}
+
+
+def test_proposal_type_update_invalidates_workflow_mapping(client, proposal, proposer):
+    from app.models.models import Workflow
+
+    engine = WorkflowEngine(db.session)
+    assert {a["name"] for a in engine.get_allowed_actions(proposal.id, proposer)} == {"submit_phase1"}
+
+    admin = User(username="type-admin", email="type-admin@example.com")
+    admin.set_password("password123")
+    admin.roles.append(Role.query.filter_by(name="Admin").first())
+    fast_track = Workflow(name="Fast Track", definition={"transitions": [
+        {"name": "fast_track", "from": "Draft", "to": "Submitted", "roles": ["Proposer"]}
+    ]})
+    db.session.add_all([admin, fast_track])
+    db.session.commit()
+    token = client.post(
+        "/api/auth/login", json={"username": "type-admin", "password": "password123"}
+    ).get_json()["token"]
+
+    response = client.put(
+        f"/api/proposal-types/{proposal.proposal_type_id}",
+        json={"workflow_id": fast_track.id},
+        headers={"x-access-token": token},
+    )
+    assert response.status_code == 200
+
+    # 映射缓存在 TTL 内也应立即换到新工作流
+    actions = engine.get_allowed_actions(proposal.id, proposer)
+    assert {a["name"] for a in actions} == {"fast_track"}
+
+
+def test_get_allowed_actions_bulk_uses_constant_queries(app, proposer):
+    from sqlalchemy import event
+
+    proposal_type = ProposalType.query.first()
+    draft_state = WorkflowState.query.filter_by(name="Draft").first()
+    proposals = []
+    for index in range(5):
+        proposal = Proposal(
+            title=f"Bulk {index}",
+            author=proposer,
+            proposal_type=proposal_type,
+            current_state=draft_state,
+            data={},
+        )
+        db.session.add(ProposalPhase(proposal=proposal, phase="phase1", status="draft"))
+        proposals.append(proposal)
+    db.session.commit()
+
+    proposal_ids = [p.id for p in proposals]
+    engine = WorkflowEngine(db.session)
+    engine.get_allowed_actions_bulk(proposal_ids[:1], proposer)  # 预热工作流缓存
+    db.session.expire_all()
+    proposer.roles  # 角色加载不计入批量查询
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        results = engine.get_allowed_actions_bulk(proposal_ids, proposer)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert set(results) == set(proposal_ids)
+    assert all(actions[0]["name"] == "submit_phase1" for actions in results.values())
+    assert len(statements) == 3
+
+
+def test_execute_transition_bulk_reports_per_proposal_results(proposal, proposer):
+    submitted_state = WorkflowState.query.filter_by(name="Submitted").first()
+    already_submitted = Proposal(
+        title="Already submitted",
+        author=proposer,
+        proposal_type=proposal.proposal_type,
+        current_state=submitted_state,
+        data={},
+    )
+    db.session.add(already_submitted)
+    db.session.commit()
+
+    engine = WorkflowEngine(db.session)
+    results = engine.execute_transition_bulk(
+        [proposal.id, already_submitted.id, 9999], "submit_phase1", proposer, chunk_size=2
+    )
+
+    assert [r["proposal_id"] for r in results] == [proposal.id, already_submitted.id, 9999]
+    assert results[0]["status"] == "success"
+    assert results[1]["error_type"] == "workflow_error"
+    assert results[2]["error_type"] == "not_found"
+
+    db.session.refresh(proposal)
+    assert proposal.current_state.name == "Submitted"
+    assert proposal.phases.filter_by(phase="phase1").first().status == "submitted"
+
+
+def test_transitions_maintain_proposal_summary(proposal, proposer):
+    second = Proposal(
+        title="Second",
+        author=proposer,
+        proposal_type=proposal.proposal_type,
+        current_state=proposal.current_state,
+        data={},
+    )
+    db.session.add(second)
+    db.session.commit()
+
+    engine = WorkflowEngine(db.session)
+    engine.execute_transition(proposal.id, "submit_phase1", proposer)
+    results = engine.execute_transition_bulk([second.id], "submit_phase1", proposer)
+    assert results[0]["status"] == "success"
+
+    for proposal_id in (proposal.id, second.id):
+        summary = ProposalSummary.query.get(proposal_id)
+        assert summary.state_name == "Submitted"
+        assert summary.phases[0]["phase"] == "phase1"
+        assert summary.phases[0]["status"] == "submitted"
+        assert summary.phases[0]["submitted_at"] is not None
+
+    ProposalSummary.query.delete()
+    db.session.commit()
+    assert rebuild_summaries(chunk_size=1) == 2
+    assert [s.state_name for s in ProposalSummary.query.order_by(ProposalSummary.proposal_id)] == [
+        "Submitted",
+        "Submitted",
+    ]